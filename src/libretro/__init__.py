@@ -7,4 +7,12 @@ from .builder import *
 from .core import *
 from .drivers import *
 from .error import *
+from .memory import *
+from .pool import *
+from .ramsearch import *
+from .rewind import *
+from .runahead import *
+from .savestate import *
 from .session import *
+from .timeline import *
+from .watch import *
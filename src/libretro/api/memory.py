@@ -2,7 +2,8 @@ from ctypes import POINTER, Structure, c_char_p, c_size_t, c_uint, c_uint64, c_v
 from dataclasses import dataclass
 from enum import IntFlag
 
-from libretro.api._utils import FieldsFromTypeHints, deepcopy_array
+from libretro._typing import Buffer
+from libretro.api._utils import FieldsFromTypeHints, deepcopy_array, memoryview_at
 
 RETRO_MEMDESC_CONST = 1 << 0
 RETRO_MEMDESC_BIGENDIAN = 1 << 1
@@ -54,8 +55,33 @@ class retro_memory_descriptor(Structure, metaclass=FieldsFromTypeHints):
             addrspace=self.addrspace,
         )
 
-    # TODO: Implement __getitem__, __setitem__
-    # TODO: Implement a buffer property (not __buffer__ because Structure provides that)
+    @property
+    def buffer(self) -> memoryview | None:
+        """
+        A ``memoryview`` of the ``len`` bytes that this descriptor exposes
+        (starting at ``ptr + offset``),
+        or ``None`` if ``ptr`` is ``NULL`` or ``len`` is zero.
+        Read-only if the descriptor is flagged as ``CONST``.
+        """
+        if not self.ptr or not self.len:
+            return None
+
+        readonly = bool(self.flags & MemoryDescriptorFlag.CONST)
+        return memoryview_at(self.ptr + self.offset, self.len, readonly=readonly)
+
+    def __getitem__(self, item: int | slice) -> int | memoryview:
+        buffer = self.buffer
+        if buffer is None:
+            raise ValueError("Memory descriptor has no backing memory")
+
+        return buffer[item]
+
+    def __setitem__(self, item: int | slice, value: int | bytes | Buffer) -> None:
+        buffer = self.buffer
+        if buffer is None:
+            raise ValueError("Memory descriptor has no backing memory")
+
+        buffer[item] = value
 
 
 @dataclass(init=False)
@@ -1,4 +1,5 @@
 from .context import *
+from .convert import *
 from .frame import *
 from .negotiate import *
 from .render import *
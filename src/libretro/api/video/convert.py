@@ -0,0 +1,280 @@
+"""
+Whole-frame pixel conversion helpers.
+
+These functions convert the raw frames that cores pass to ``retro_video_refresh_t``
+into tightly-packed RGBA8888 buffers, optionally rotating them.
+NumPy is used if it's installed;
+otherwise the conversion falls back to ``bytes.translate`` and extended slicing,
+which still processes whole frames at a time instead of individual pixels.
+"""
+
+from array import array
+from functools import cache
+from typing import NamedTuple
+
+from libretro._typing import Buffer
+
+from .frame import PixelFormat
+from .render import Rotation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_PIXEL32_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+
+class RgbaFrame(NamedTuple):
+    data: memoryview
+    width: int
+    height: int
+
+
+def _expand5(value: int) -> int:
+    return (value << 3) | (value >> 2)
+
+
+def _expand6(value: int) -> int:
+    return (value << 2) | (value >> 4)
+
+
+# Translation tables for the pure-Python path.
+# 16-bit pixels are split into their low and high bytes,
+# and each channel is extracted (and widened to 8 bits) with bytes.translate.
+# Green straddles both bytes, so each half is translated into disjoint bits
+# that are then summed as one big integer.
+_B_LO = bytes(_expand5(b & 0x1F) for b in range(256))
+_G_LO = bytes(b >> 5 for b in range(256))
+_R565_HI = bytes(_expand5(b >> 3) for b in range(256))
+_G565_HI = bytes((b & 0x07) << 3 for b in range(256))
+_R1555_HI = bytes(_expand5((b >> 2) & 0x1F) for b in range(256))
+_G1555_HI = bytes((b & 0x03) << 3 for b in range(256))
+_EXPAND5 = bytes(_expand5(b & 0x1F) for b in range(256))
+_EXPAND6 = bytes(_expand6(b & 0x3F) for b in range(256))
+
+
+@cache
+def _rgba_lut(pixel_format: PixelFormat):
+    """
+    Returns a 65536-entry NumPy table that maps a 16-bit pixel to its RGBA8888 equivalent.
+    """
+    pixels = numpy.arange(0x10000, dtype="<u4")
+    match pixel_format:
+        case PixelFormat.RGB565:
+            r = (pixels >> 11) & 0x1F
+            g = (pixels >> 5) & 0x3F
+            b = pixels & 0x1F
+            g = (g << 2) | (g >> 4)
+        case PixelFormat.RGB1555:
+            r = (pixels >> 10) & 0x1F
+            g = (pixels >> 5) & 0x1F
+            b = pixels & 0x1F
+            g = (g << 3) | (g >> 2)
+        case _:
+            raise ValueError(f"No lookup table for {pixel_format!r}")
+
+    r = (r << 3) | (r >> 2)
+    b = (b << 3) | (b >> 2)
+    return r | (g << 8) | (b << 16) | numpy.uint32(0xFF000000)
+
+
+def _packed_rows(frame: memoryview, width: int, height: int, pitch: int, bpp: int) -> bytes:
+    row_length = width * bpp
+    if pitch == row_length:
+        return bytes(frame[: row_length * height])
+
+    return b"".join(frame[y * pitch : y * pitch + row_length] for y in range(height))
+
+
+def _to_rgba_python(
+    frame: memoryview, width: int, height: int, pitch: int, pixel_format: PixelFormat
+) -> bytearray:
+    packed = _packed_rows(frame, width, height, pitch, pixel_format.bytes_per_pixel)
+    out = bytearray(b"\xff") * (width * height * 4)
+
+    match pixel_format:
+        case PixelFormat.XRGB8888:
+            out[0::4] = packed[2::4]
+            out[1::4] = packed[1::4]
+            out[2::4] = packed[0::4]
+        case PixelFormat.RGB565 | PixelFormat.RGB1555:
+            lo = packed[0::2]
+            hi = packed[1::2]
+            if pixel_format == PixelFormat.RGB565:
+                red, green_hi, expand_green = _R565_HI, _G565_HI, _EXPAND6
+            else:
+                red, green_hi, expand_green = _R1555_HI, _G1555_HI, _EXPAND5
+
+            # The two halves of green occupy disjoint bits, so adding them can't carry
+            green = int.from_bytes(lo.translate(_G_LO), "little") + int.from_bytes(
+                hi.translate(green_hi), "little"
+            )
+            out[0::4] = hi.translate(red)
+            out[1::4] = green.to_bytes(len(lo), "little").translate(expand_green)
+            out[2::4] = lo.translate(_B_LO)
+        case _:
+            raise ValueError(f"Unknown pixel format: {pixel_format}")
+
+    return out
+
+
+def _rotate_python(data: bytearray, width: int, height: int, rotation: Rotation) -> RgbaFrame:
+    if rotation == Rotation.NONE or not data:
+        sideways = rotation in (Rotation.NINETY, Rotation.TWO_SEVENTY)
+        return RgbaFrame(
+            memoryview(data), height if sideways else width, width if sideways else height
+        )
+
+    pixels = array(_PIXEL32_TYPECODE, data)
+    match rotation:
+        case Rotation.ONE_EIGHTY:
+            pixels.reverse()
+            return RgbaFrame(memoryview(pixels).cast("B"), width, height)
+        case Rotation.NINETY:
+            # Counter-clockwise; each output row is an input column, read top to bottom
+            rotated = array(_PIXEL32_TYPECODE)
+            for x in range(width - 1, -1, -1):
+                rotated.extend(pixels[x::width])
+        case Rotation.TWO_SEVENTY:
+            # Clockwise; each output row is an input column, read bottom to top
+            rotated = array(_PIXEL32_TYPECODE)
+            last_row = (height - 1) * width
+            for x in range(width):
+                rotated.extend(pixels[last_row + x :: -width])
+        case _:
+            raise ValueError(f"Invalid rotation: {rotation}")
+
+    return RgbaFrame(memoryview(rotated).cast("B"), height, width)
+
+
+def _to_rgba_numpy(
+    frame: memoryview,
+    width: int,
+    height: int,
+    pitch: int,
+    pixel_format: PixelFormat,
+    rotation: Rotation,
+) -> RgbaFrame:
+    sideways = rotation in (Rotation.NINETY, Rotation.TWO_SEVENTY)
+    out_width, out_height = (height, width) if sideways else (width, height)
+    out = bytearray(width * height * 4)
+    dest = numpy.frombuffer(out, dtype=numpy.uint8).reshape(out_height, out_width, 4)
+    image = dest if rotation == Rotation.NONE else numpy.empty((height, width, 4), numpy.uint8)
+
+    match pixel_format:
+        case PixelFormat.XRGB8888:
+            rows = numpy.frombuffer(frame, dtype=numpy.uint8, count=pitch * height)
+            src = rows.reshape(height, pitch)[:, : width * 4].reshape(height, width, 4)
+            image[..., 0:3] = src[..., 2::-1]
+            image[..., 3] = 0xFF
+        case PixelFormat.RGB565 | PixelFormat.RGB1555:
+            rows = numpy.frombuffer(frame, dtype="<u2", count=(pitch // 2) * height)
+            src = rows.reshape(height, pitch // 2)[:, :width]
+            image.view("<u4").reshape(height, width)[...] = _rgba_lut(pixel_format)[src]
+        case _:
+            raise ValueError(f"Unknown pixel format: {pixel_format}")
+
+    if rotation != Rotation.NONE:
+        # Rotate whole 32-bit pixels rather than individual channels
+        pixels = image.view("<u4").reshape(height, width)
+        dest.view("<u4").reshape(out_height, out_width)[...] = numpy.rot90(pixels, int(rotation))
+
+    return RgbaFrame(memoryview(out), out_width, out_height)
+
+
+def convert_to_rgba(
+    frame: Buffer,
+    width: int,
+    height: int,
+    pitch: int,
+    pixel_format: PixelFormat,
+    rotation: Rotation = Rotation.NONE,
+) -> RgbaFrame:
+    """
+    Converts a frame to tightly-packed RGBA8888, rotating it if requested.
+
+    :param frame: The frame's pixel data, as given to ``retro_video_refresh_t``.
+        Must be at least ``pitch * height`` bytes long.
+    :param width: The width of the frame, in pixels.
+    :param height: The height of the frame, in pixels.
+    :param pitch: The distance between the start of each row in ``frame``, in bytes.
+    :param pixel_format: The pixel format of ``frame``.
+    :param rotation: The counter-clockwise rotation to apply to the output.
+    :return: The converted frame and its dimensions.
+        Width and height are swapped if ``rotation`` is 90 or 270 degrees.
+    :raises ValueError: If ``frame`` is too small for the given dimensions
+        or ``pixel_format`` or ``rotation`` is invalid.
+    """
+    view = memoryview(frame).cast("B")
+    if len(view) < pitch * height:
+        raise ValueError(f"Expected at least {pitch * height} bytes, got {len(view)}")
+
+    if pitch < width * pixel_format.bytes_per_pixel:
+        raise ValueError(
+            f"Pitch {pitch} is too small for {width} pixels of {pixel_format.name} data"
+        )
+
+    if rotation not in Rotation:
+        raise ValueError(f"Invalid rotation: {rotation}")
+
+    if numpy is not None:
+        return _to_rgba_numpy(view, width, height, pitch, pixel_format, rotation)
+
+    rgba = _to_rgba_python(view, width, height, pitch, pixel_format)
+    return _rotate_python(rgba, width, height, rotation)
+
+
+def rotate_rgba(data: Buffer, width: int, height: int, rotation: Rotation) -> RgbaFrame:
+    """
+    Rotates a tightly-packed frame of 32-bit pixels counter-clockwise.
+
+    :param data: The frame to rotate; must be exactly ``width * height * 4`` bytes.
+    :param width: The width of the frame, in pixels.
+    :param height: The height of the frame, in pixels.
+    :param rotation: The rotation to apply.
+    :return: The rotated frame and its dimensions.
+    """
+    view = memoryview(data).cast("B")
+    if len(view) != width * height * 4:
+        raise ValueError(f"Expected {width * height * 4} bytes, got {len(view)}")
+
+    if numpy is not None:
+        out = bytearray(len(view))
+        pixels = numpy.frombuffer(view, dtype="<u4").reshape(height, width)
+        rotated = numpy.rot90(pixels, int(rotation))
+        numpy.frombuffer(out, dtype="<u4").reshape(rotated.shape)[...] = rotated
+        return RgbaFrame(memoryview(out), rotated.shape[1], rotated.shape[0])
+
+    return _rotate_python(bytearray(view), width, height, rotation)
+
+
+def flip_vertical(data: Buffer, width: int, height: int, bytes_per_pixel: int = 4) -> memoryview:
+    """
+    Reverses the order of the rows in a tightly-packed frame,
+    e.g. to convert an OpenGL framebuffer with a bottom-left origin to a top-left one.
+
+    :return: A new buffer containing the flipped frame.
+    """
+    view = memoryview(data).cast("B")
+    row_length = width * bytes_per_pixel
+    if len(view) != row_length * height:
+        raise ValueError(f"Expected {row_length * height} bytes, got {len(view)}")
+
+    if numpy is not None:
+        out = bytearray(len(view))
+        rows = numpy.frombuffer(view, dtype=numpy.uint8).reshape(height, row_length)
+        numpy.frombuffer(out, dtype=numpy.uint8).reshape(height, row_length)[...] = rows[::-1]
+        return memoryview(out)
+
+    return memoryview(
+        b"".join(view[y * row_length : (y + 1) * row_length] for y in range(height - 1, -1, -1))
+    )
+
+
+__all__ = [
+    "RgbaFrame",
+    "convert_to_rgba",
+    "rotate_rgba",
+    "flip_vertical",
+]
@@ -39,6 +39,7 @@ from libretro.drivers import (
     GeneratorMicrophoneDriver,
     GeneratorMidiDriver,
     InputDriver,
+    InputPollPolicy,
     InputStateGenerator,
     InputStateIterable,
     InputStateIterator,
@@ -126,6 +127,7 @@ ThrottleStateArg: TypeAlias = _OptionalArg[retro_throttle_state]
 SavestateContextArg: TypeAlias = _OptionalArg[SavestateContext]
 MicDriverArg: TypeAlias = _OptionalArg[MicrophoneDriver]
 PowerDriverArg: TypeAlias = _OptionalArg[PowerDriver] | retro_device_power
+InputPollPolicyArg: TypeAlias = _OptionalArg[InputPollPolicy]
 
 
 class RequiredError(RuntimeError):
@@ -164,6 +166,8 @@ class _SessionBuilderArgs(TypedDict):
     jit_capable: _OptionalFactory[bool]  # TODO: Replace with some driver (not sure what yet)
     mic: _OptionalFactory[MicrophoneDriver]
     power: _OptionalFactory[PowerDriver]
+    input_poll_policy: _OptionalFactory[InputPollPolicy]
+    coalesce_audio: _OptionalFactory[bool]
 
 
 class SessionBuilder:
@@ -201,6 +205,8 @@ class SessionBuilder:
             jit_capable=_nothing,
             mic=_nothing,
             power=_nothing,
+            input_poll_policy=_nothing,
+            coalesce_audio=_nothing,
         )
 
     def with_core(self, core: CoreArg) -> Self:
@@ -740,6 +746,40 @@ class SessionBuilder:
 
         return self
 
+    def with_input_poll_policy(self, policy: InputPollPolicyArg) -> Self:
+        match policy:
+            case InputPollPolicy():
+                self._args["input_poll_policy"] = lambda: policy
+            case Callable() as func:
+                self._args["input_poll_policy"] = func
+            case _DefaultType.DEFAULT:
+                self._args["input_poll_policy"] = lambda: InputPollPolicy.FIRST
+            case None:
+                self._args["input_poll_policy"] = _nothing
+            case _:
+                raise TypeError(
+                    f"Expected InputPollPolicy, a callable that returns one, DEFAULT, or None; got {type(policy).__name__}"
+                )
+
+        return self
+
+    def with_coalesce_audio(self, coalesce: BoolArg) -> Self:
+        match coalesce:
+            case bool():
+                self._args["coalesce_audio"] = lambda: coalesce
+            case Callable() as func:
+                self._args["coalesce_audio"] = func
+            case _DefaultType.DEFAULT:
+                self._args["coalesce_audio"] = lambda: True
+            case None:
+                self._args["coalesce_audio"] = _nothing
+            case _:
+                raise TypeError(
+                    f"Expected bool, a callable that returns one, DEFAULT, or None; got {type(coalesce).__name__}"
+                )
+
+        return self
+
     def build(self) -> Session:
         """
         Constructs a Session object with the provided arguments.
@@ -770,6 +810,8 @@ class SessionBuilder:
             jit_capable=self._args["jit_capable"](),
             mic_interface=self._args["mic"](),
             device_power=self._args["power"](),
+            input_poll_policy=self._args["input_poll_policy"](),
+            coalesce_audio=self._args["coalesce_audio"](),
         )
 
         environment = CompositeEnvironmentDriver(envargs)
@@ -803,6 +845,8 @@ def defaults(core: CoreArg) -> SessionBuilder:
         .with_jit_capable(DEFAULT)
         .with_mic(DEFAULT)
         .with_power(DEFAULT)
+        .with_input_poll_policy(DEFAULT)
+        .with_coalesce_audio(DEFAULT)
     )
 
 
@@ -16,6 +16,7 @@ from ctypes import (
     cast,
     cdll,
 )
+from functools import lru_cache
 from os import PathLike
 from typing import Protocol
 
@@ -35,6 +36,13 @@ from libretro.api import (
 )
 from libretro.api._utils import memoryview_at
 
+
+@lru_cache(maxsize=16)
+def _char_array(length: int) -> type[Array]:
+    # Savestates are usually the same size every time, so reuse the array type
+    return c_char * length
+
+
 # TODO: Add a CorePhase enum that's updated when entering/leaving each phase.
 # (Some envcalls can only be called in certain phases, so this would be useful for error checking.)
 
@@ -498,7 +506,7 @@ class Core(CoreInterface):
                 )
 
         buflength = len(buf)
-        arraytype: Array = c_char * buflength
+        arraytype = _char_array(buflength)
 
         return self._core.retro_serialize(byref(arraytype.from_buffer(buf)), buflength)
 
@@ -529,7 +537,7 @@ class Core(CoreInterface):
                 )
 
         buflen = len(buf)
-        arraytype: Array = c_char * buflen
+        arraytype = _char_array(buflen)
 
         # TODO: Validate that the buffer wasn't written to, and raise a warning if it was. (Use zlib.crc32)
         return self._core.retro_unserialize(byref(arraytype.from_buffer(buf)), buflen)
@@ -4,4 +4,8 @@ Drivers that receive and optionally process audio data emitted by the core.
 
 from .array import *
 from .driver import *
+from .features import *
+from .resample import *
+from .ring import *
+from .threaded import *
 from .wave import *
@@ -0,0 +1,439 @@
+"""
+An audio driver that summarizes each frame's audio with a few compact features,
+so that long runs can be compared without keeping all of their audio.
+"""
+
+import sys
+from array import array
+from collections.abc import Sequence
+from copy import deepcopy
+from hashlib import blake2b
+from math import sqrt
+from os import PathLike
+from struct import Struct
+from typing import NamedTuple, final
+
+from libretro._typing import override
+from libretro.api.audio import retro_audio_buffer_status_callback, retro_audio_callback
+from libretro.api.av import retro_system_av_info
+from libretro.error import UnsupportedEnvCall
+
+from .driver import AudioDriver
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_MAGIC = b"LRAF"
+_VERSION = 1
+_HEADER = Struct("<4sHHQ")  # Magic, version, reserved, frame count
+_FINGERPRINT_BANDS = 33  # Adjacent band pairs give a 32-bit fingerprint
+
+
+class AudioFeatures(NamedTuple):
+    """
+    Per-frame features of the audio that a core emitted, one entry per video frame.
+    Each field is a column with the same length.
+    """
+
+    frames: array
+    """The number of audio frames (stereo sample pairs) emitted during each video frame."""
+
+    rms: array
+    """The root mean square of all samples in each frame, from 0 to 32768."""
+
+    peak: array
+    """The largest absolute sample value in each frame."""
+
+    zero_crossings: array
+    """The number of sign changes in each frame, summed over both channels."""
+
+    hash: array
+    """A 64-bit BLAKE2b hash of each frame's samples."""
+
+    fingerprint: array
+    """
+    A 32-bit spectral fingerprint of each frame,
+    or 0 for every frame if spectral fingerprints were disabled.
+    Each bit says whether the energy difference between two adjacent frequency bands
+    grew or shrank compared to the previous frame (like Haitsma and Kalker's audio fingerprint),
+    so frames that sound alike have fingerprints with a small Hamming distance.
+    """
+
+    @staticmethod
+    def empty() -> "AudioFeatures":
+        return AudioFeatures(
+            array("I"), array("f"), array("H"), array("I"), array("Q"), array("I")
+        )
+
+    def save(self, file: str | bytes | PathLike) -> None:
+        """
+        Writes these features to a file that ``AudioFeatures.load`` can read.
+        """
+        with open(file, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, 0, len(self.frames)))
+            for column in self:
+                if sys.byteorder == "big":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+
+                column.tofile(f)
+
+    @staticmethod
+    def load(file: str | bytes | PathLike) -> "AudioFeatures":
+        """
+        Reads features written by ``AudioFeatures.save``.
+
+        :raises ValueError: If the file isn't a valid audio feature file.
+        """
+        with open(file, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise ValueError("File is too short to contain audio features")
+
+            magic, version, _, count = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                raise ValueError(f"Expected magic {_MAGIC!r}, got {magic!r}")
+
+            if version != _VERSION:
+                raise ValueError(f"Unsupported audio feature file version {version}")
+
+            features = AudioFeatures.empty()
+            try:
+                for column in features:
+                    column.fromfile(f, count)
+                    if sys.byteorder == "big":
+                        column.byteswap()
+            except EOFError as e:
+                raise ValueError("Audio feature file is truncated") from e
+
+        return features
+
+    def diff(
+        self, other: "AudioFeatures", *, rms_tolerance: float = 0.0, fingerprint_bits: int = 0
+    ) -> list[int]:
+        """
+        Compares these features with another run's, frame by frame.
+
+        :param other: The features to compare against.
+        :param rms_tolerance: How much the RMS of a frame may differ and still match.
+        :param fingerprint_bits: How many fingerprint bits may differ and still match.
+        :return: The indexes of every frame whose features don't match, in order.
+            Frames that exist in only one of the two runs never match.
+            If both tolerances are 0, frames match only if their hashes are equal.
+        """
+        n = min(len(self.frames), len(other.frames))
+        exact = rms_tolerance == 0 and fingerprint_bits == 0
+        columns = ("frames", "hash") if exact else ("frames", "peak", "zero_crossings")
+
+        if numpy is not None:
+            differs = numpy.zeros(n, dtype=numpy.bool_)
+            for name in columns:
+                a = numpy.frombuffer(getattr(self, name), dtype=getattr(self, name).typecode)
+                b = numpy.frombuffer(getattr(other, name), dtype=getattr(other, name).typecode)
+                differs |= a[:n] != b[:n]
+
+            if not exact:
+                a = numpy.frombuffer(self.rms, dtype=numpy.float32)[:n]
+                b = numpy.frombuffer(other.rms, dtype=numpy.float32)[:n]
+                differs |= numpy.abs(a - b) > rms_tolerance
+                a = numpy.frombuffer(self.fingerprint, dtype=numpy.uint32)[:n]
+                b = numpy.frombuffer(other.fingerprint, dtype=numpy.uint32)[:n]
+                distance = numpy.unpackbits((a ^ b).view(numpy.uint8)).reshape(n, 32).sum(1)
+                differs |= distance > fingerprint_bits
+
+            mismatches = numpy.flatnonzero(differs).tolist()
+        else:
+            mismatches = [
+                i
+                for i in range(n)
+                if any(getattr(self, c)[i] != getattr(other, c)[i] for c in columns)
+                or (
+                    not exact
+                    and (
+                        abs(self.rms[i] - other.rms[i]) > rms_tolerance
+                        or (self.fingerprint[i] ^ other.fingerprint[i]).bit_count()
+                        > fingerprint_bits
+                    )
+                )
+            ]
+
+        mismatches.extend(range(n, max(len(self.frames), len(other.frames))))
+        return mismatches
+
+
+def _band_edges(bins: int) -> Sequence[int]:
+    # Logarithmically spaced and skipping DC, but at least one bin wide where possible
+    edges = [1]
+    for i in range(1, _FINGERPRINT_BANDS + 1):
+        edge = max(round(bins ** (i / _FINGERPRINT_BANDS)), edges[-1] + 1)
+        edges.append(min(bins, edge))
+
+    return edges
+
+
+@final
+class AudioFeatureDriver(AudioDriver):
+    """
+    An audio driver that computes features of each video frame's audio as it arrives
+    (see ``AudioFeatures``) and stores them in preallocated columns,
+    then passes the audio on to another audio driver (if any).
+
+    Frames are delimited by ``begin_frame`` and ``end_frame``,
+    which ``CompositeEnvironmentDriver`` calls around each ``retro_run``.
+    Features are computed with NumPy if it's installed.
+    """
+
+    def __init__(
+        self,
+        driver: AudioDriver | None = None,
+        *,
+        capacity: int = 65536,
+        fingerprint: bool = False,
+    ):
+        """
+        :param driver: The audio driver to pass audio to, if any.
+        :param capacity: How many frames of features to preallocate room for.
+            The columns grow as needed.
+        :param fingerprint: Whether to compute spectral fingerprints.
+        :raises TypeError: If ``driver`` is not an ``AudioDriver``.
+        :raises ValueError: If ``capacity`` is not positive.
+        :raises RuntimeError: If ``fingerprint`` is ``True`` but NumPy isn't installed.
+        """
+        if driver is not None and not isinstance(driver, AudioDriver):
+            raise TypeError(f"Expected an AudioDriver or None, got {type(driver).__name__}")
+
+        if capacity <= 0:
+            raise ValueError(f"Expected a positive capacity, got {capacity}")
+
+        if fingerprint and numpy is None:
+            raise RuntimeError("NumPy is required for spectral fingerprints but is not installed")
+
+        self._driver = driver
+        self._fingerprint = fingerprint
+        self._system_av_info: retro_system_av_info | None = None
+        self._columns = AudioFeatures(
+            *(array(c.typecode, bytes(c.itemsize * capacity)) for c in AudioFeatures.empty())
+        )
+        self._count = 0
+        self._previous_bands = None
+        self._previous_left = 0
+        self._previous_right = 0
+        self.__reset_frame()
+
+    def __reset_frame(self) -> None:
+        self._frame_audio = 0
+        self._sum_squares = 0
+        self._peak = 0
+        self._crossings = 0
+        self._hash = blake2b(digest_size=8)
+        self._spectrum_samples: list[bytes] = []
+        self._in_frame = False
+
+    @property
+    def driver(self) -> AudioDriver | None:
+        return self._driver
+
+    def __len__(self) -> int:
+        """
+        The number of frames whose features have been recorded.
+        """
+        return self._count
+
+    @property
+    def features(self) -> AudioFeatures:
+        """
+        A copy of the features recorded so far.
+        """
+        n = self._count
+        return AudioFeatures(*(c[:n] for c in self._columns))
+
+    def clear(self) -> None:
+        """
+        Discards all recorded features, keeping the allocated columns.
+        """
+        self._count = 0
+        self._previous_bands = None
+        self.__reset_frame()
+
+    def __accumulate(self, data: memoryview) -> None:
+        if numpy is not None:
+            samples = numpy.frombuffer(data, dtype=numpy.int16)
+            wide = samples.astype(numpy.int64)
+            self._sum_squares += int(numpy.dot(wide, wide))
+            self._peak = max(self._peak, int(numpy.abs(wide).max()))
+            negative = samples.reshape(-1, 2) < 0
+            first = negative[0]
+            self._crossings += int(numpy.count_nonzero(negative[1:] != negative[:-1]))
+            self._crossings += int(first[0] != (self._previous_left < 0))
+            self._crossings += int(first[1] != (self._previous_right < 0))
+        else:
+            self._sum_squares += sum(s * s for s in data)
+            self._peak = max(self._peak, max(map(abs, data)))
+            for channel, previous in (
+                (data[0::2], self._previous_left),
+                (data[1::2], self._previous_right),
+            ):
+                was_negative = previous < 0
+                for s in channel:
+                    self._crossings += (s < 0) != was_negative
+                    was_negative = s < 0
+
+        self._previous_left = data[-2]
+        self._previous_right = data[-1]
+        raw = data.cast("B")
+        if sys.byteorder == "big":
+            swapped = array("h", data)
+            swapped.byteswap()
+            raw = memoryview(swapped).cast("B")
+
+        self._hash.update(raw)
+        if self._fingerprint:
+            self._spectrum_samples.append(bytes(raw))
+
+    @override
+    def sample(self, left: int, right: int) -> None:
+        self.sample_batch(memoryview(array("h", (left, right))))
+
+    @override
+    def sample_batch(self, data: memoryview) -> int:
+        frames = len(data) // 2
+        if frames:
+            self._in_frame = True
+            self._frame_audio += frames
+            self.__accumulate(data[: frames * 2])
+
+        if self._driver is not None:
+            self._driver.sample_batch(data)
+
+        return frames
+
+    def __fingerprint(self) -> int:
+        if not self._spectrum_samples:
+            self._previous_bands = None
+            return 0
+
+        samples = numpy.frombuffer(b"".join(self._spectrum_samples), dtype="<i2")
+        mono = samples.reshape(-1, 2).mean(axis=1, dtype=numpy.float32)
+        power = numpy.abs(numpy.fft.rfft(mono * numpy.hanning(len(mono)))) ** 2
+        cumulative = numpy.concatenate(([0.0], numpy.cumsum(power)))
+        edges = _band_edges(len(power))
+        bands = numpy.array([cumulative[b] - cumulative[a] for a, b in zip(edges, edges[1:])])
+        slopes = bands[:-1] - bands[1:]
+        previous = self._previous_bands
+        self._previous_bands = slopes
+        if previous is None:
+            return 0
+
+        bits = (slopes - previous) > 0
+        return int(numpy.packbits(bits, bitorder="little").view("<u4")[0])
+
+    def begin_frame(self) -> None:
+        """
+        Starts a new frame.
+        Any audio received since the last ``end_frame`` is attributed to it.
+        ``CompositeEnvironmentDriver.begin_frame`` calls this.
+        """
+        self._in_frame = True
+        begin_frame = getattr(self._driver, "begin_frame", None)
+        if begin_frame is not None:
+            begin_frame()
+
+    def end_frame(self) -> None:
+        """
+        Records the features of the current frame's audio.
+        ``CompositeEnvironmentDriver.end_frame`` calls this.
+        """
+        if self._in_frame:
+            columns = self._columns
+            if self._count == len(columns.frames):
+                # Double the capacity
+                for column in columns:
+                    column.extend(column)
+
+            n = self._count
+            total = self._frame_audio * 2
+            columns.frames[n] = self._frame_audio
+            columns.rms[n] = sqrt(self._sum_squares / total) if total else 0.0
+            columns.peak[n] = self._peak
+            columns.zero_crossings[n] = self._crossings
+            columns.hash[n] = int.from_bytes(self._hash.digest(), "little")
+            columns.fingerprint[n] = self.__fingerprint() if self._fingerprint else 0
+            self._count = n + 1
+            self.__reset_frame()
+
+        end_frame = getattr(self._driver, "end_frame", None)
+        if end_frame is not None:
+            end_frame()
+
+    def close(self) -> None:
+        """
+        Closes the wrapped driver, if it has a ``close`` method.
+        ``Session`` calls this when it exits.
+        """
+        close = getattr(self._driver, "close", None)
+        if close is not None:
+            close()
+
+    @property
+    @override
+    def callbacks(self) -> retro_audio_callback | None:
+        return self._driver.callbacks if self._driver is not None else None
+
+    @callbacks.setter
+    @override
+    def callbacks(self, callback: retro_audio_callback | None):
+        if self._driver is None:
+            raise UnsupportedEnvCall("AudioFeatureDriver does not support setting callbacks")
+
+        self._driver.callbacks = callback
+
+    @property
+    @override
+    def buffer_status(self) -> retro_audio_buffer_status_callback | None:
+        return self._driver.buffer_status if self._driver is not None else None
+
+    @buffer_status.setter
+    @override
+    def buffer_status(self, callback: retro_audio_buffer_status_callback):
+        if self._driver is None:
+            raise UnsupportedEnvCall(
+                "AudioFeatureDriver does not support setting buffer status callback"
+            )
+
+        self._driver.buffer_status = callback
+
+    @property
+    @override
+    def minimum_latency(self) -> int | None:
+        return self._driver.minimum_latency if self._driver is not None else None
+
+    @minimum_latency.setter
+    @override
+    def minimum_latency(self, latency: int | None):
+        if self._driver is None:
+            raise UnsupportedEnvCall("AudioFeatureDriver does not support setting minimum latency")
+
+        self._driver.minimum_latency = latency
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return deepcopy(self._system_av_info)
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, info: retro_system_av_info):
+        if not isinstance(info, retro_system_av_info):
+            raise TypeError(f"Expected retro_system_av_info; got {type(info).__name__}")
+
+        self._system_av_info = deepcopy(info)
+        if self._driver is not None:
+            self._driver.system_av_info = info
+
+
+__all__ = [
+    "AudioFeatureDriver",
+    "AudioFeatures",
+]
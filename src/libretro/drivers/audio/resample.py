@@ -0,0 +1,373 @@
+"""
+An audio driver that converts the core's audio to a fixed sample rate
+before passing it to another audio driver.
+"""
+
+from array import array
+from collections.abc import Callable
+from copy import deepcopy
+from math import ceil, floor, pi, sin, sqrt
+from typing import final
+
+from libretro._typing import override
+from libretro.api.audio import retro_audio_buffer_status_callback, retro_audio_callback
+from libretro.api.av import retro_system_av_info
+
+from .driver import AudioDriver
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    numpy = None
+
+_DEFAULT_SAMPLE_RATE = 44100.0
+_PHASES = 256
+_KAISER_BETA = 8.6
+_CUTOFF = 0.91
+
+
+def _i0(x: float) -> float:
+    # Modified Bessel function of the first kind, order 0 (for the Kaiser window)
+    total = term = 1.0
+    k = 1
+    while term > total * 1e-12:
+        term *= (x / (2 * k)) ** 2
+        total += term
+        k += 1
+
+    return total
+
+
+def _filter_bank(half: int, cutoff: float) -> list[list[float]]:
+    """
+    Builds a windowed-sinc filter for each of ``_PHASES + 1`` fractional offsets.
+    Row ``p`` holds the weights of input samples ``i - half + 1`` through ``i + half``
+    for an output that falls ``p / _PHASES`` of the way between samples ``i`` and ``i + 1``.
+    """
+    norm = _i0(_KAISER_BETA)
+    bank = []
+    for p in range(_PHASES + 1):
+        frac = p / _PHASES
+        row = []
+        for k in range(-half + 1, half + 1):
+            u = frac - k
+            x = cutoff * u
+            sinc = 1.0 if x == 0 else sin(pi * x) / (pi * x)
+            r = u / half
+            window = _i0(_KAISER_BETA * sqrt(1 - r * r)) / norm if abs(r) < 1 else 0.0
+            row.append(cutoff * sinc * window)
+
+        # Unity gain at DC for every phase
+        total = sum(row)
+        bank.append([w / total for w in row])
+
+    return bank
+
+
+@final
+class ResamplingAudioDriver(AudioDriver):
+    """
+    An audio driver that resamples audio to a fixed rate
+    and passes it on to another audio driver,
+    so that anything downstream sees the same sample rate no matter which core is running
+    (or how often it changes its timing).
+
+    Uses a streaming polyphase windowed-sinc filter,
+    so audio is converted continuously across frames without clicks at the boundaries.
+    The filter is vectorized with NumPy if it's installed,
+    and falls back to a (much slower) pure-Python implementation otherwise.
+
+    Optionally, the conversion ratio can be nudged up or down by a small amount
+    based on how full a downstream buffer is, like RetroArch's dynamic rate control;
+    this keeps a consumer that runs on its own clock from over- or underrunning.
+    """
+
+    def __init__(
+        self,
+        driver: AudioDriver,
+        rate: float = 48000.0,
+        *,
+        taps: int = 32,
+        rate_control: float = 0.0,
+        buffer_fill: Callable[[], float] | None = None,
+    ):
+        """
+        :param driver: The audio driver to pass resampled audio to.
+        :param rate: The sample rate to convert to, in Hz.
+        :param taps: The length of the interpolation filter, in input samples.
+            Longer filters have a sharper cutoff but cost more.
+        :param rate_control: The most that dynamic rate control may change the ratio by,
+            as a fraction (RetroArch defaults to 0.005). 0 disables it.
+        :param buffer_fill: Returns how full the downstream buffer is, from 0 to 1.
+            Required for dynamic rate control.
+        :raises TypeError: If ``driver`` is not an ``AudioDriver``.
+        :raises ValueError: If ``rate`` is not positive, if ``taps`` is not a positive even number,
+            if ``rate_control`` is not between 0 and 1,
+            or if ``rate_control`` is set without ``buffer_fill``.
+        """
+        if not isinstance(driver, AudioDriver):
+            raise TypeError(f"Expected an AudioDriver, got {type(driver).__name__}")
+
+        if rate <= 0:
+            raise ValueError(f"Expected a positive sample rate, got {rate}")
+
+        if taps <= 0 or taps % 2:
+            raise ValueError(f"Expected a positive even number of taps, got {taps}")
+
+        if not 0 <= rate_control < 1:
+            raise ValueError(f"Expected a rate control delta in [0, 1), got {rate_control}")
+
+        if rate_control and buffer_fill is None:
+            raise ValueError("Dynamic rate control requires a buffer_fill callable")
+
+        self._driver = driver
+        self._rate = float(rate)
+        self._half = taps // 2
+        self._rate_control = rate_control
+        self._buffer_fill = buffer_fill
+        self._system_av_info: retro_system_av_info | None = None
+        self._frames_in = 0
+        self._frames_out = 0
+        self.__configure(_DEFAULT_SAMPLE_RATE)
+        self.reset()
+
+    def __configure(self, input_rate: float) -> None:
+        self._input_rate = input_rate
+        self._ratio = self._rate / input_rate  # Output samples per input sample
+        self._step = 1 / self._ratio
+
+        # Attenuate everything above the lower of the two Nyquist frequencies
+        bank = _filter_bank(self._half, _CUTOFF * min(1.0, self._ratio))
+        if numpy is not None:
+            self._bank = numpy.array(bank, dtype=numpy.float32)
+        else:
+            self._bank = bank
+
+    def reset(self) -> None:
+        """
+        Discards the filter's history, as if the stream were starting over.
+        """
+        taps = self._half * 2
+        if numpy is not None:
+            self._history = numpy.zeros((2, taps), dtype=numpy.float32)
+        else:
+            self._history = [0.0] * (taps * 2)
+
+        # Position of the next output in the history, in input samples
+        self._time = float(self._half)
+
+    @property
+    def driver(self) -> AudioDriver:
+        return self._driver
+
+    @property
+    def rate(self) -> float:
+        """
+        The sample rate that audio is converted to.
+        """
+        return self._rate
+
+    @property
+    def input_rate(self) -> float:
+        """
+        The core's current sample rate (44100 Hz until it's known).
+        """
+        return self._input_rate
+
+    @property
+    def ratio(self) -> float:
+        """
+        The number of output samples produced per input sample
+        during the most recent batch, including any dynamic rate control adjustment.
+        """
+        return 1 / self._step
+
+    @property
+    def frames_in(self) -> int:
+        """
+        The number of audio frames received from the core.
+        """
+        return self._frames_in
+
+    @property
+    def frames_out(self) -> int:
+        """
+        The number of audio frames passed to the wrapped driver.
+        """
+        return self._frames_out
+
+    def __adjust_step(self) -> None:
+        ratio = self._ratio
+        if self._rate_control:
+            fill = min(1.0, max(0.0, self._buffer_fill()))
+            # A draining buffer needs more output samples, a filling one needs fewer
+            ratio *= 1 + self._rate_control * (1 - 2 * fill)
+
+        self._step = 1 / ratio
+
+    def __resample_numpy(self, data: memoryview) -> memoryview:
+        # One row per channel, so that each filter window is a contiguous slice
+        frames = numpy.frombuffer(data, dtype=numpy.int16).reshape(-1, 2).T
+        x = numpy.concatenate((self._history, frames), axis=1)
+        length = x.shape[1]
+        half = self._half
+        step = self._step
+        t0 = self._time
+        # Every tap of every output has to fall within x
+        count = max(0, ceil((length - half - t0) / step))
+        while count and floor(t0 + (count - 1) * step) + half > length - 1:
+            count -= 1
+
+        t = t0 + step * numpy.arange(count)
+        index = t.astype(numpy.intp)
+        position = (t - index) * _PHASES
+        phase = position.astype(numpy.intp)
+        blend = (position - phase).astype(numpy.float32)[:, None]
+        bank = self._bank
+        weights = bank[phase] * (1 - blend) + bank[phase + 1] * blend
+        windows = sliding_window_view(x, half * 2, axis=1)[:, index - half + 1]
+        out = numpy.einsum("nt,cnt->nc", weights, windows)
+
+        consumed = length - half * 2
+        self._history = x[:, consumed:].copy()
+        self._time = t0 + count * step - consumed
+        numpy.clip(numpy.rint(out, out=out), -32768, 32767, out=out)
+        return memoryview(out.astype(numpy.int16).reshape(-1)).cast("B").cast("h")
+
+    def __resample_python(self, data: memoryview) -> memoryview:
+        x = self._history + [float(s) for s in data]
+        half = self._half
+        taps = half * 2
+        bank = self._bank
+        step = self._step
+        length = len(x) // 2
+        out = array("h")
+        t = self._time
+        while floor(t) + half <= length - 1:
+            index = floor(t)
+            position = (t - index) * _PHASES
+            phase = int(position)
+            blend = position - phase
+            low = bank[phase]
+            high = bank[phase + 1]
+            base = (index - half + 1) * 2
+            left = right = 0.0
+            for k in range(taps):
+                w = low[k] + (high[k] - low[k]) * blend
+                left += x[base + k * 2] * w
+                right += x[base + k * 2 + 1] * w
+
+            out.append(min(32767, max(-32768, round(left))))
+            out.append(min(32767, max(-32768, round(right))))
+            t += step
+
+        consumed = length - taps
+        self._history = x[consumed * 2 :]
+        self._time = t - consumed
+        return memoryview(out)
+
+    @override
+    def sample(self, left: int, right: int) -> None:
+        self.sample_batch(memoryview(array("h", (left, right))))
+
+    @override
+    def sample_batch(self, data: memoryview) -> int:
+        frames = len(data) // 2
+        if not frames:
+            return 0
+
+        self.__adjust_step()
+        if numpy is not None:
+            out = self.__resample_numpy(data)
+        else:
+            out = self.__resample_python(data)
+
+        self._frames_in += frames
+        if len(out):
+            self._frames_out += len(out) // 2
+            self._driver.sample_batch(out)
+
+        return frames
+
+    def begin_frame(self) -> None:
+        """
+        Forwards to the wrapped driver's ``begin_frame``, if it has one.
+        """
+        begin_frame = getattr(self._driver, "begin_frame", None)
+        if begin_frame is not None:
+            begin_frame()
+
+    def end_frame(self) -> None:
+        """
+        Forwards to the wrapped driver's ``end_frame``, if it has one.
+        """
+        end_frame = getattr(self._driver, "end_frame", None)
+        if end_frame is not None:
+            end_frame()
+
+    def close(self) -> None:
+        """
+        Closes the wrapped driver, if it has a ``close`` method.
+        ``Session`` calls this when it exits.
+        """
+        close = getattr(self._driver, "close", None)
+        if close is not None:
+            close()
+
+    @property
+    @override
+    def callbacks(self) -> retro_audio_callback | None:
+        return self._driver.callbacks
+
+    @callbacks.setter
+    @override
+    def callbacks(self, callback: retro_audio_callback | None):
+        self._driver.callbacks = callback
+
+    @property
+    @override
+    def buffer_status(self) -> retro_audio_buffer_status_callback | None:
+        return self._driver.buffer_status
+
+    @buffer_status.setter
+    @override
+    def buffer_status(self, callback: retro_audio_buffer_status_callback):
+        self._driver.buffer_status = callback
+
+    @property
+    @override
+    def minimum_latency(self) -> int | None:
+        return self._driver.minimum_latency
+
+    @minimum_latency.setter
+    @override
+    def minimum_latency(self, latency: int | None):
+        self._driver.minimum_latency = latency
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return deepcopy(self._system_av_info)
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, info: retro_system_av_info):
+        if not isinstance(info, retro_system_av_info):
+            raise TypeError(f"Expected retro_system_av_info; got {type(info).__name__}")
+
+        self._system_av_info = deepcopy(info)
+        rate = info.timing.sample_rate or _DEFAULT_SAMPLE_RATE
+        if rate != self._input_rate:
+            # The history is still valid; only the filter and step change
+            self.__configure(rate)
+
+        # Downstream only ever sees the output rate
+        resampled = deepcopy(info)
+        resampled.timing.sample_rate = self._rate
+        self._driver.system_av_info = resampled
+
+
+__all__ = [
+    "ResamplingAudioDriver",
+]
@@ -0,0 +1,322 @@
+"""
+An audio driver that keeps a bounded history of recent audio.
+"""
+
+from array import array
+from copy import deepcopy
+from math import ceil
+from typing import NamedTuple, final
+
+from libretro._typing import override
+from libretro.api.audio import retro_audio_buffer_status_callback, retro_audio_callback
+from libretro.api.av import retro_system_av_info
+from libretro.error import UnsupportedEnvCall
+
+from .driver import AudioDriver
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_DEFAULT_SAMPLE_RATE = 48000.0
+_DEFAULT_FPS = 60.0
+
+
+class AudioRingStats(NamedTuple):
+    """
+    Counters kept by a ``RingBufferAudioDriver``.
+    """
+
+    frames_written: int
+    """The number of audio frames the core has submitted."""
+
+    frames_read: int
+    """The number of audio frames consumed with ``RingBufferAudioDriver.read``."""
+
+    frames_dropped: int
+    """The number of audio frames that were overwritten before they were read."""
+
+    overflows: int
+    """The number of writes that overwrote at least one unread audio frame."""
+
+
+@final
+class RingBufferAudioDriver(AudioDriver):
+    """
+    An audio driver that stores the most recent audio in a preallocated ring buffer,
+    so that memory use stays constant no matter how long the session runs.
+
+    The buffer holds two copies of every sample
+    (one in each half, like a mirrored "magic" ring buffer),
+    so any span of up to ``capacity`` recent audio frames is contiguous
+    and can be returned as a view without copying.
+    Views share memory with the buffer, so they change as the core submits more audio;
+    copy them if they need to outlive the next frame.
+
+    Audio frames are counted per video frame (see ``begin_frame``)
+    so that audio can be lined up with the video frame it was emitted with.
+    """
+
+    def __init__(self, duration: float = 10.0, *, sample_rate: float | None = None):
+        """
+        :param duration: How many seconds of audio to keep.
+        :param sample_rate: The sample rate to size the buffer for.
+            If ``None``, the buffer is sized for the core's sample rate once it's known
+            (and for 48000 Hz until then).
+        :raises ValueError: If ``duration`` or ``sample_rate`` is not positive.
+        """
+        if not isinstance(duration, (int, float)):
+            raise TypeError(f"Expected a float, got {type(duration).__name__}")
+
+        if duration <= 0:
+            raise ValueError(f"Expected a positive duration, got {duration}")
+
+        if sample_rate is not None and sample_rate <= 0:
+            raise ValueError(f"Expected a positive sample rate, got {sample_rate}")
+
+        self._duration = float(duration)
+        self._fixed_rate = sample_rate
+        self._system_av_info: retro_system_av_info | None = None
+        self.__allocate(sample_rate or _DEFAULT_SAMPLE_RATE, _DEFAULT_FPS)
+
+    def __allocate(self, sample_rate: float, fps: float) -> None:
+        self._sample_rate = sample_rate
+        self._capacity = max(1, ceil(self._duration * sample_rate))
+        self._buffer = bytearray(self._capacity * 2 * 2 * 2)  # Mirrored, stereo, 16-bit
+        self._samples = memoryview(self._buffer).cast("h")
+        self._mirror = self._capacity * 2  # Offset of the second copy, in samples
+
+        # Stream position (in audio frames) at which each recent video frame began
+        self._frame_starts = array("Q", bytes(8 * (max(1, ceil(self._duration * fps)) + 2)))
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Discards all buffered audio and resets the statistics.
+        """
+        self._written = 0
+        self._read = 0
+        self._dropped = 0
+        self._overflows = 0
+        self._frames_begun = 0
+
+    @property
+    def duration(self) -> float:
+        return self._duration
+
+    @property
+    def sample_rate(self) -> float:
+        """
+        The sample rate that the buffer is currently sized for.
+        """
+        return self._sample_rate
+
+    @property
+    def capacity(self) -> int:
+        """
+        The most audio frames (stereo sample pairs) that the buffer can hold.
+        """
+        return self._capacity
+
+    def __len__(self) -> int:
+        """
+        The number of audio frames currently in the buffer.
+        """
+        return min(self._written, self._capacity)
+
+    @property
+    def unread(self) -> int:
+        """
+        The number of buffered audio frames that haven't been consumed with ``read``.
+        """
+        return self._written - self._read
+
+    @property
+    def stats(self) -> AudioRingStats:
+        return AudioRingStats(self._written, self._read, self._dropped, self._overflows)
+
+    @override
+    def sample(self, left: int, right: int) -> None:
+        self.__overwrite(1)
+        i = (self._written % self._capacity) * 2
+        samples = self._samples
+        samples[i] = samples[i + self._mirror] = left
+        samples[i + 1] = samples[i + 1 + self._mirror] = right
+        self._written += 1
+
+    @override
+    def sample_batch(self, data: memoryview) -> int:
+        frames = len(data) // 2
+        capacity = self._capacity
+        self.__overwrite(frames)
+        if frames > capacity:
+            # Only the most recent audio fits
+            skipped = frames - capacity
+            self._written += skipped
+            data = data[skipped * 2 :]
+            count = capacity
+        else:
+            count = frames
+
+        samples = self._samples
+        mirror = self._mirror
+        start = (self._written % capacity) * 2
+        first = min(count * 2, mirror - start)
+        samples[start : start + first] = data[:first]
+        samples[start + mirror : start + mirror + first] = data[:first]
+        rest = count * 2 - first
+        if rest:
+            samples[:rest] = data[first:]
+            samples[mirror : mirror + rest] = data[first:]
+
+        self._written += count
+        return frames
+
+    def __overwrite(self, frames: int) -> None:
+        lost = self._written + frames - self._read - self._capacity
+        if lost > 0:
+            self._dropped += lost
+            self._overflows += 1
+            self._read += lost
+
+    def __view(self, start: int, frames: int) -> memoryview:
+        # start is a stream position; the mirror makes [start, start + frames) contiguous
+        i = (start % self._capacity) * 2
+        return self._samples[i : i + frames * 2]
+
+    def latest(self, frames: int | None = None) -> memoryview:
+        """
+        :param frames: How many of the most recent audio frames to return.
+            Defaults to (and is limited to) every buffered audio frame.
+        :return: A zero-copy view of interleaved stereo samples, oldest first.
+        """
+        available = len(self)
+        frames = available if frames is None else max(0, min(frames, available))
+        return self.__view(self._written - frames, frames)
+
+    def latest_array(self, frames: int | None = None) -> "numpy.ndarray":
+        """
+        Like ``latest``, but as a NumPy array with shape ``(frames, 2)``.
+
+        :raises RuntimeError: If NumPy isn't installed.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is required for latest_array but is not installed")
+
+        return numpy.frombuffer(self.latest(frames), dtype=numpy.int16).reshape(-1, 2)
+
+    def read(self, frames: int | None = None) -> memoryview:
+        """
+        Consumes audio that hasn't been read yet.
+
+        :param frames: The most audio frames to consume. Defaults to all unread audio.
+        :return: A zero-copy view of the consumed interleaved stereo samples, oldest first.
+        """
+        unread = self.unread
+        frames = unread if frames is None else max(0, min(frames, unread))
+        view = self.__view(self._read, frames)
+        self._read += frames
+        return view
+
+    def begin_frame(self) -> None:
+        """
+        Marks the start of a video frame;
+        audio submitted until the next call is attributed to it.
+        ``CompositeEnvironmentDriver.begin_frame`` calls this.
+        """
+        starts = self._frame_starts
+        starts[self._frames_begun % len(starts)] = self._written
+        self._frames_begun += 1
+
+    @property
+    def frame_sizes(self) -> array:
+        """
+        The number of audio frames submitted during each recent video frame, oldest first;
+        the last entry is for the video frame that began most recently.
+        """
+        starts = self._frame_starts
+        n = min(self._frames_begun, len(starts) - 1)
+        positions = [
+            starts[i % len(starts)] for i in range(self._frames_begun - n, self._frames_begun)
+        ]
+        positions.append(self._written)
+        return array("I", (b - a for a, b in zip(positions, positions[1:])))
+
+    def frame_audio(self, age: int = 0) -> memoryview | None:
+        """
+        :param age: Which video frame to return the audio of;
+            0 is the one that began most recently (usually the last one that was run),
+            1 is the one before it, and so on.
+        :return: A zero-copy view of the interleaved stereo samples emitted during that frame,
+            or ``None`` if the frame is too old or its audio has been overwritten.
+        """
+        starts = self._frame_starts
+        frame = self._frames_begun - 1 - age
+        if age < 0 or frame < 0 or frame < self._frames_begun - (len(starts) - 1):
+            return None
+
+        start = starts[frame % len(starts)]
+        end = starts[(frame + 1) % len(starts)] if age else self._written
+        if start < self._written - self._capacity:
+            return None
+
+        return self.__view(start, end - start)
+
+    @property
+    @override
+    def callbacks(self) -> retro_audio_callback | None:
+        return None
+
+    @callbacks.setter
+    @override
+    def callbacks(self, callback: retro_audio_callback | None):
+        raise UnsupportedEnvCall("RingBufferAudioDriver does not support setting callbacks")
+
+    @property
+    @override
+    def buffer_status(self) -> retro_audio_buffer_status_callback | None:
+        return None
+
+    @buffer_status.setter
+    @override
+    def buffer_status(self, callback: retro_audio_buffer_status_callback):
+        raise UnsupportedEnvCall(
+            "RingBufferAudioDriver does not support setting buffer status callback"
+        )
+
+    @property
+    @override
+    def minimum_latency(self) -> int | None:
+        return None
+
+    @minimum_latency.setter
+    @override
+    def minimum_latency(self, latency: int | None):
+        raise UnsupportedEnvCall("RingBufferAudioDriver does not support setting minimum latency")
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return deepcopy(self._system_av_info)
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, info: retro_system_av_info):
+        if not isinstance(info, retro_system_av_info):
+            raise TypeError(f"Expected retro_system_av_info; got {type(info).__name__}")
+
+        self._system_av_info = deepcopy(info)
+        rate = self._fixed_rate or info.timing.sample_rate or _DEFAULT_SAMPLE_RATE
+        fps = info.timing.fps or _DEFAULT_FPS
+        if max(1, ceil(self._duration * rate)) != self._capacity or (
+            max(1, ceil(self._duration * fps)) + 2 != len(self._frame_starts)
+        ):
+            # Only reallocate if the new timing needs a different size
+            self.__allocate(rate, fps)
+
+
+__all__ = [
+    "AudioRingStats",
+    "RingBufferAudioDriver",
+]
@@ -0,0 +1,386 @@
+"""
+An audio driver that simulates a real-time audio device,
+including the audio thread that RetroArch runs for cores with audio callbacks.
+"""
+
+from copy import deepcopy
+from threading import Condition, Event, RLock, Thread
+from time import monotonic
+from typing import NamedTuple, final
+
+from libretro._typing import override
+from libretro.api.audio import retro_audio_buffer_status_callback, retro_audio_callback
+from libretro.api.av import retro_system_av_info
+
+from .driver import AudioDriver
+
+_DEFAULT_SAMPLE_RATE = 44100.0
+_UNDERRUN_LIKELY = 25  # Percent, like RetroArch
+
+
+class ThreadedAudioStats(NamedTuple):
+    """
+    Counters kept by a ``ThreadedAudioDriver``.
+    """
+
+    callbacks: int
+    """The number of times the audio thread called the core's audio callback."""
+
+    underruns: int
+    """The number of times the simulated device ran out of audio to play."""
+
+    frames_dropped: int
+    """The number of audio frames that arrived while the buffer was full."""
+
+
+@final
+class ThreadedAudioDriver(AudioDriver):
+    """
+    An audio driver that plays audio through a simulated device with a fixed-size buffer,
+    which drains in real time according to the core's sample rate.
+
+    If the core registers an audio callback (``EnvironmentCall.SET_AUDIO_CALLBACK``),
+    this driver starts an audio thread at the beginning of the next frame
+    that calls it whenever the buffer falls below ``watermark``, as RetroArch does.
+    ``retro_audio_callback.set_state`` is called on the thread that starts and stops
+    the audio thread, just before starting it and just after stopping it.
+
+    If the core registers a buffer status callback
+    (``EnvironmentCall.SET_AUDIO_BUFFER_STATUS_CALLBACK``),
+    it's given the buffer's occupancy at the beginning of each frame.
+
+    All audio is passed on to another audio driver as soon as it's received,
+    so it can still be recorded or analyzed.
+    That driver may be called from the audio thread.
+    """
+
+    def __init__(
+        self,
+        driver: AudioDriver | None = None,
+        *,
+        latency: int = 64,
+        watermark: float = 0.5,
+        blocking: bool = False,
+    ):
+        """
+        :param driver: The audio driver to pass audio to, if any.
+        :param latency: The size of the simulated device's buffer, in milliseconds.
+            The core may raise this with ``EnvironmentCall.SET_MINIMUM_AUDIO_LATENCY``.
+        :param watermark: How full the buffer may get (as a fraction of its size)
+            before the audio thread stops calling the core's audio callback.
+        :param blocking: If ``True``, writing more audio than fits in the buffer
+            waits for it to drain (throttling the core to real time, like audio sync).
+            If ``False``, the excess is counted in ``ThreadedAudioStats.frames_dropped``.
+        :raises TypeError: If ``driver`` is not an ``AudioDriver``.
+        :raises ValueError: If ``latency`` is not positive
+            or if ``watermark`` is not between 0 and 1.
+        """
+        if driver is not None and not isinstance(driver, AudioDriver):
+            raise TypeError(f"Expected an AudioDriver or None, got {type(driver).__name__}")
+
+        if latency <= 0:
+            raise ValueError(f"Expected a positive latency, got {latency}")
+
+        if not 0 < watermark <= 1:
+            raise ValueError(f"Expected a watermark in (0, 1], got {watermark}")
+
+        self._driver = driver
+        self._latency = latency
+        self._minimum_latency: int | None = None
+        self._watermark = watermark
+        self._blocking = blocking
+        self._callbacks: retro_audio_callback | None = None
+        self._buffer_status: retro_audio_buffer_status_callback | None = None
+        self._system_av_info: retro_system_av_info | None = None
+        self._sample_rate = _DEFAULT_SAMPLE_RATE
+
+        # Guards the simulated device
+        self._state = Condition()
+        self._queued = 0.0
+        self._clock: float | None = None
+        self._written = 0
+        self._callback_count = 0
+        self._underruns = 0
+        self._dropped = 0
+
+        # Held whenever the audio thread calls into the core
+        self._lock = RLock()
+        self._thread: Thread | None = None
+        self._stopping = Event()
+        self._error: BaseException | None = None
+
+    @property
+    def driver(self) -> AudioDriver | None:
+        return self._driver
+
+    @property
+    def latency(self) -> int:
+        """
+        The size of the buffer in milliseconds, including any minimum set by the core.
+        """
+        return max(self._latency, self._minimum_latency or 0)
+
+    @property
+    def capacity(self) -> int:
+        """
+        The size of the buffer in audio frames.
+        """
+        return max(1, round(self.latency * self._sample_rate / 1000))
+
+    @property
+    def occupancy(self) -> int:
+        """
+        The number of audio frames in the buffer that haven't been played yet.
+        """
+        with self._state:
+            self.__drain(monotonic())
+            return round(self._queued)
+
+    @property
+    def stats(self) -> ThreadedAudioStats:
+        return ThreadedAudioStats(self._callback_count, self._underruns, self._dropped)
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether the audio thread is running.
+        """
+        return self._thread is not None
+
+    @property
+    def lock(self) -> RLock:
+        """
+        Held by the audio thread while it calls the core's audio callback.
+        Hold it to keep the audio thread out of the core,
+        e.g. while saving or loading state.
+        ``Session`` holds it while rewinding, recording rewind history, and running ahead.
+        """
+        return self._lock
+
+    def __drain(self, now: float) -> None:
+        # Must hold self._state
+        if self._clock is None:
+            # The device starts playing when it first receives audio
+            return
+
+        played = (now - self._clock) * self._sample_rate
+        self._clock = now
+        if played > self._queued:
+            if self._queued > 0:
+                self._underruns += 1
+
+            self._queued = 0.0
+        else:
+            self._queued -= played
+
+    def __write(self, frames: int) -> None:
+        with self._state:
+            self._written += frames
+            now = monotonic()
+            self.__drain(now)
+            if self._clock is None:
+                self._clock = now
+
+            space = self.capacity - self._queued
+            needed = min(frames, self.capacity)
+            while self._blocking and needed > space and not self._stopping.is_set():
+                # Wait for just enough audio to play
+                self._state.wait((needed - space) / self._sample_rate)
+                self.__drain(monotonic())
+                space = self.capacity - self._queued
+
+            if frames > space:
+                self._dropped += round(frames - max(0.0, space))
+                self._queued = float(self.capacity)
+            else:
+                self._queued += frames
+
+    @override
+    def sample(self, left: int, right: int) -> None:
+        self.__write(1)
+        if self._driver is not None:
+            self._driver.sample(left, right)
+
+    @override
+    def sample_batch(self, data: memoryview) -> int:
+        frames = len(data) // 2
+        self.__write(frames)
+        if self._driver is not None:
+            self._driver.sample_batch(data)
+
+        return frames
+
+    def begin_frame(self) -> None:
+        """
+        Starts the audio thread if the core has registered an audio callback,
+        reports the buffer's status if the core has asked for it,
+        and forwards to the wrapped driver's ``begin_frame`` if it has one.
+        ``CompositeEnvironmentDriver.begin_frame`` calls this.
+        """
+        if self._callbacks and self._callbacks.callback and not self.running:
+            self.start()
+
+        if self._buffer_status:
+            percent = min(100, self.occupancy * 100 // self.capacity)
+            self.report_buffer_status(True, percent, percent < _UNDERRUN_LIKELY)
+
+        begin_frame = getattr(self._driver, "begin_frame", None)
+        if begin_frame is not None:
+            begin_frame()
+
+    def end_frame(self) -> None:
+        """
+        Forwards to the wrapped driver's ``end_frame``, if it has one.
+        """
+        end_frame = getattr(self._driver, "end_frame", None)
+        if end_frame is not None:
+            end_frame()
+
+    def close(self) -> None:
+        """
+        Stops the audio thread, then closes the wrapped driver if it has a ``close`` method.
+        ``Session`` calls this when it exits.
+
+        :raises RuntimeError: If the audio thread failed.
+        """
+        try:
+            self.stop()
+        finally:
+            close = getattr(self._driver, "close", None)
+            if close is not None:
+                close()
+
+    def start(self) -> None:
+        """
+        Calls the core's ``retro_audio_callback.set_state(true)``
+        and starts the audio thread.
+        Does nothing if the thread is already running
+        or if the core hasn't registered an audio callback.
+        """
+        if self.running or not (self._callbacks and self._callbacks.callback):
+            return
+
+        self._stopping.clear()
+        self._error = None
+        self.set_state(True)
+        self._thread = Thread(target=self._pump, name="ThreadedAudioDriver", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the audio thread
+        and then calls the core's ``retro_audio_callback.set_state(false)``.
+        ``Session`` calls this before unloading the core.
+
+        :raises RuntimeError: If the audio thread failed.
+        """
+        if not self.running:
+            return
+
+        self._stopping.set()
+        with self._state:
+            self._state.notify_all()
+
+        self._thread.join()
+        self._thread = None
+        self.set_state(False)
+        if self._error is not None:
+            raise RuntimeError("Audio thread failed") from self._error
+
+    def _pump(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                with self._state:
+                    self.__drain(monotonic())
+                    low = self._watermark * self.capacity
+                    queued = self._queued
+                    written = self._written
+
+                if queued < low:
+                    with self._lock:
+                        self.callback()
+                        self._callback_count += 1
+
+                    if self._written != written:
+                        # Keep filling until the buffer reaches the watermark
+                        continue
+
+                    # The core didn't produce anything; don't spin
+                    wait = self.capacity / self._sample_rate / 8
+                else:
+                    wait = (queued - low) / self._sample_rate
+
+                self._stopping.wait(max(wait, 0.001))
+        except BaseException as e:
+            self._error = e
+
+    @property
+    @override
+    def callbacks(self) -> retro_audio_callback | None:
+        return self._callbacks
+
+    @callbacks.setter
+    @override
+    def callbacks(self, callback: retro_audio_callback | None):
+        if callback is not None and not isinstance(callback, retro_audio_callback):
+            raise TypeError(
+                f"Expected retro_audio_callback or None, got {type(callback).__name__}"
+            )
+
+        # The old callbacks must not be called after they're replaced
+        self.stop()
+        self._callbacks = deepcopy(callback)
+
+    @property
+    @override
+    def buffer_status(self) -> retro_audio_buffer_status_callback | None:
+        return self._buffer_status
+
+    @buffer_status.setter
+    @override
+    def buffer_status(self, callback: retro_audio_buffer_status_callback | None):
+        if callback is not None and not isinstance(callback, retro_audio_buffer_status_callback):
+            raise TypeError(
+                f"Expected retro_audio_buffer_status_callback or None, got {type(callback).__name__}"
+            )
+
+        self._buffer_status = deepcopy(callback)
+
+    @property
+    @override
+    def minimum_latency(self) -> int | None:
+        return self._minimum_latency
+
+    @minimum_latency.setter
+    @override
+    def minimum_latency(self, latency: int | None):
+        with self._state:
+            self._minimum_latency = latency
+            # A smaller buffer can't hold what's already queued
+            self._queued = min(self._queued, float(self.capacity))
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return deepcopy(self._system_av_info)
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, info: retro_system_av_info):
+        if not isinstance(info, retro_system_av_info):
+            raise TypeError(f"Expected retro_system_av_info; got {type(info).__name__}")
+
+        self._system_av_info = deepcopy(info)
+        with self._state:
+            self.__drain(monotonic())
+            self._sample_rate = info.timing.sample_rate or _DEFAULT_SAMPLE_RATE
+            self._queued = min(self._queued, float(self.capacity))
+
+        if self._driver is not None:
+            self._driver.system_av_info = info
+
+
+__all__ = [
+    "ThreadedAudioDriver",
+    "ThreadedAudioStats",
+]
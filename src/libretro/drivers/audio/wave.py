@@ -1,7 +1,23 @@
+"""
+An audio driver that records the core's audio to WAV or FLAC files.
+"""
+
+import os
+import shutil
+import subprocess  # nosec B404
+import sys
 import wave
+import weakref
+from array import array
+from contextlib import suppress
 from copy import deepcopy
-from io import RawIOBase
+from enum import Enum
 from os import PathLike, fsdecode
+from queue import Empty, Queue, SimpleQueue
+from struct import Struct
+from threading import Thread
+from typing import BinaryIO, NamedTuple
+from warnings import warn
 
 from libretro._typing import override
 from libretro.api.audio import retro_audio_buffer_status_callback, retro_audio_callback
@@ -10,37 +26,424 @@ from libretro.error import UnsupportedEnvCall
 
 from .driver import AudioDriver
 
+_DEFAULT_SAMPLE_RATE = 44100
+_FRAME = Struct("<hh")
+
+
+class AudioFileFormat(Enum):
+    """
+    The kind of file that a ``WaveWriterAudioDriver`` writes.
+    """
+
+    WAV = "wav"
+    """Uncompressed 16-bit stereo PCM, written with the standard library's ``wave`` module."""
+
+    FLAC = "flac"
+    """
+    Lossless compressed audio, encoded by the ``flac`` command-line tool
+    (or by ``ffmpeg`` if ``flac`` isn't installed).
+    """
+
+
+def flac_encoder() -> str | None:
+    """
+    :return: The path to a FLAC encoder that ``WaveWriterAudioDriver`` can use,
+        or ``None`` if neither ``flac`` nor ``ffmpeg`` is installed.
+    """
+    return shutil.which("flac") or shutil.which("ffmpeg")
+
+
+def _flac_command(encoder: str, rate: int, path: str) -> list[str]:
+    if os.path.splitext(os.path.basename(encoder))[0].lower() == "ffmpeg":
+        return [
+            encoder,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "s16le",
+            "-ar",
+            str(rate),
+            "-ac",
+            "2",
+            "-i",
+            "-",
+            "-c:a",
+            "flac",
+            path,
+        ]
+
+    return [
+        encoder,
+        "--silent",
+        "--force",
+        "--force-raw-format",
+        "--endian=little",
+        "--sign=signed",
+        "--channels=2",
+        "--bps=16",
+        f"--sample-rate={rate}",
+        "-o",
+        path,
+        "-",
+    ]
+
+
+class _Segment(NamedTuple):
+    """
+    Tells the writer thread to start a new output file.
+    """
+
+    rate: int
+    path: str | None
+
+
+_STOP = None
+
+
+class _Writer:
+    """
+    The state of a ``WaveWriterAudioDriver``'s writer thread.
+    Kept apart from the driver so that the thread doesn't keep the driver alive,
+    which lets the driver finish its file when it's garbage-collected.
+    """
+
+    def __init__(
+        self,
+        queue: "Queue[tuple[bytearray, int] | _Segment | None]",
+        free: "SimpleQueue[bytearray]",
+        encoder: str | None,
+        stream: BinaryIO | None,
+    ):
+        self.queue = queue
+        self.free = free
+        self.encoder = encoder
+        self.stream = stream
+        self.wave: wave.Wave_write | None = None
+        self.process: subprocess.Popen | None = None
+        self.frames_written = 0
+        self.error: BaseException | None = None
+
+    def open(self, segment: _Segment) -> None:
+        self.finish()
+        if self.encoder is not None:
+            # The arguments are passed straight to the encoder (no shell),
+            # which the caller chose
+            self.process = subprocess.Popen(  # nosec B603
+                _flac_command(self.encoder, segment.rate, segment.path),
+                stdin=subprocess.PIPE,
+            )
+        else:
+            self.wave = wave.open(segment.path if segment.path is not None else self.stream, "wb")
+            self.wave.setnchannels(2)
+            self.wave.setsampwidth(2)
+            self.wave.setframerate(segment.rate)
+
+    def finish(self) -> None:
+        if self.wave is not None:
+            self.wave.close()
+            self.wave = None
+
+        if self.process is not None:
+            self.process.stdin.close()
+            returncode = self.process.wait()
+            self.process = None
+            if returncode != 0:
+                raise RuntimeError(f"FLAC encoder exited with status {returncode}")
+
+    def write(self, buffer: bytearray, length: int) -> None:
+        with memoryview(buffer)[:length] as data:
+            if sys.byteorder == "big":
+                samples = array("h", data)
+                samples.byteswap()
+                data = memoryview(samples).cast("B")
+
+            if self.wave is not None:
+                self.wave.writeframesraw(data)
+            else:
+                self.process.stdin.write(data)
+
+        self.frames_written += length // _FRAME.size
+
+    def run(self) -> None:
+        while True:
+            item = self.queue.get()
+            try:
+                # After an error, keep draining the queue so that the session doesn't block
+                match item:
+                    case _Segment() as segment if self.error is None:
+                        self.open(segment)
+                    case (bytearray() as buffer, length):
+                        if self.error is None:
+                            self.write(buffer, length)
+
+                        self.free.put(buffer)
+                    case None:
+                        self.finish()
+                        return
+            except BaseException as e:
+                self.error = e
+                if item is _STOP:
+                    return
+
+
+def _close_at_exit(ref: "weakref.ref[WaveWriterAudioDriver]") -> None:
+    # Daemon threads stop before objects are collected at exit,
+    # so drivers that are still alive must be closed first
+    driver = ref()
+    if driver is not None:
+        driver._close_quietly()
+
 
 class WaveWriterAudioDriver(AudioDriver):
-    def __init__(self, file: str | bytes | PathLike | RawIOBase):
+    """
+    An audio driver that records audio to a file.
+
+    Samples are accumulated in large preallocated buffers,
+    which a background thread writes (or pipes to a FLAC encoder)
+    so that the session rarely waits on the disk.
+    The sample rate comes from ``system_av_info``.
+    If the core changes it mid-stream (with ``EnvironmentCall.SET_SYSTEM_AV_INFO``),
+    the recording continues in a new file named like ``audio.1.wav``, ``audio.2.wav``, and so on,
+    since neither format supports more than one sample rate per file.
+
+    Call ``close`` (or use the driver as a context manager) when done
+    to write any remaining audio and finalize the file.
+    ``Session`` closes its audio driver when it exits,
+    and the file is also finalized if the driver is garbage-collected
+    or is still open when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        file: str | bytes | PathLike | BinaryIO,
+        *,
+        format: AudioFileFormat | None = None,
+        buffer_size: int = 1024 * 1024,
+        queue_size: int = 8,
+        encoder: str | PathLike | None = None,
+    ):
+        """
+        :param file: The path to write to, or a writable binary file (WAV only).
+        :param format: The file format to write.
+            Defaults to FLAC if ``file`` is a path ending in ``.flac``, otherwise WAV.
+        :param buffer_size: The size of each buffer passed to the writer thread, in bytes.
+        :param queue_size: How many full buffers may wait for the writer thread
+            before the session has to wait.
+        :param encoder: The FLAC encoder to run. Defaults to the result of ``flac_encoder()``.
+        :raises TypeError: If ``file`` or ``format`` is not one of the documented types.
+        :raises ValueError: If ``file`` is not writable, if FLAC is requested for a file object,
+            or if ``buffer_size`` or ``queue_size`` is less than 1.
+        :raises RuntimeError: If FLAC is requested but no encoder is installed.
+        """
+        self._path: str | None = None
+        self._stream: BinaryIO | None = None
         match file:
-            case str() as name:
-                self._file = wave.open(name, "wb")
-            case bytes() as name:
-                self._file = wave.open(fsdecode(name), "wb")
-            case PathLike() as path:
-                self._file = wave.open(fsdecode(path), "wb")
-            case RawIOBase() as io if not io.writable():
-                raise ValueError("RawIOBase must be writable")
-            case RawIOBase() as io:
-                self._file = wave.open(io)
+            case str() | bytes() | PathLike():
+                self._path = fsdecode(file)
+            case _ if hasattr(file, "write"):
+                if hasattr(file, "writable") and not file.writable():
+                    raise ValueError("The output file must be writable")
+
+                self._stream = file
             case _:
-                raise TypeError(f"Expected a str, bytes, path, or RawIOBase, got {file!r}")
+                raise TypeError(
+                    f"Expected a str, bytes, path, or binary file, got {type(file).__name__}"
+                )
+
+        if format is None:
+            is_flac = self._path is not None and self._path.lower().endswith(".flac")
+            format = AudioFileFormat.FLAC if is_flac else AudioFileFormat.WAV
+
+        if not isinstance(format, AudioFileFormat):
+            raise TypeError(f"Expected an AudioFileFormat, got {type(format).__name__}")
+
+        if buffer_size < 1:
+            raise ValueError(f"Expected a buffer size of at least 1 byte, got {buffer_size}")
+
+        if queue_size < 1:
+            raise ValueError(f"Expected a queue size of at least 1, got {queue_size}")
+
+        self._encoder: str | None = None
+        if format == AudioFileFormat.FLAC:
+            if self._path is None:
+                raise ValueError("FLAC output must be written to a path, not a file object")
 
-        self._file.setnchannels(2)
-        self._file.setsampwidth(2)
-        self._file.setframerate(44100)
+            self._encoder = fsdecode(encoder) if encoder is not None else flac_encoder()
+            if self._encoder is None:
+                raise RuntimeError("FLAC output requires flac or ffmpeg, but neither was found")
+
+        self._format = format
+        self._buffer_size = buffer_size - buffer_size % _FRAME.size or _FRAME.size
+        self._buffer = bytearray(self._buffer_size)
+        self._used = 0
+        self._queue: Queue[tuple[bytearray, int] | _Segment | None] = Queue(queue_size)
+        self._free: SimpleQueue[bytearray] = SimpleQueue()
+        self._thread: Thread | None = None
         self._system_av_info: retro_system_av_info | None = None
+        self._rate: int | None = None
+        self._segments: list[str] = []
+        self._closed = False
+        self._writer = _Writer(self._queue, self._free, self._encoder, self._stream)
+        self._finalizer = weakref.finalize(self, _close_at_exit, weakref.ref(self))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        self._close_quietly()
+
+    def _close_quietly(self) -> None:
+        # Finishes the file when the driver is collected or at exit;
+        # errors are left in ``error``, since there's no caller to raise them to
+        if getattr(self, "_closed", True):
+            return
+
+        with suppress(RuntimeError):
+            self.close()
+
+    @property
+    def format(self) -> AudioFileFormat:
+        return self._format
+
+    @property
+    def sample_rate(self) -> int | None:
+        """
+        The sample rate of the file currently being written,
+        or ``None`` if no audio has been written yet.
+        """
+        return self._rate
+
+    @property
+    def segments(self) -> list[str]:
+        """
+        The paths of the files written so far, in order.
+        Empty if writing to a file object.
+        """
+        return list(self._segments)
+
+    @property
+    def frames_written(self) -> int:
+        """
+        The number of audio frames that the writer thread has written.
+        """
+        return self._writer.frames_written
+
+    @property
+    def error(self) -> BaseException | None:
+        """
+        The exception that stopped the writer thread, if any.
+        """
+        return self._writer.error
+
+    def _segment_path(self) -> str | None:
+        if self._path is None:
+            return None
+
+        n = len(self._segments)
+        if n == 0:
+            return self._path
+
+        root, ext = os.path.splitext(self._path)
+        return f"{root}.{n}{ext}"
 
-    def sample(self, left: int, right: int):
-        self._file.writeframesraw(left.to_bytes(2, "little", signed=True))
-        self._file.writeframesraw(right.to_bytes(2, "little", signed=True))
+    def _start_segment(self, rate: int) -> None:
+        if self._closed:
+            raise RuntimeError("Cannot write audio to a closed WaveWriterAudioDriver")
 
+        if self._rate is not None and self._path is None:
+            warn(
+                f"Sample rate changed from {self._rate} to {rate} Hz, "
+                "but audio written to a file object can't be split; keeping the old rate"
+            )
+            return
+
+        path = self._segment_path()
+        if path is not None:
+            self._segments.append(path)
+
+        self._rate = rate
+        if self._thread is None:
+            self._thread = Thread(
+                target=self._writer.run, name="WaveWriterAudioDriver", daemon=True
+            )
+            self._thread.start()
+
+        self._queue.put(_Segment(rate, path))
+
+    def _submit(self) -> None:
+        if self._rate is None:
+            self._start_segment(self._current_rate())
+
+        self._queue.put((self._buffer, self._used))
+        try:
+            self._buffer = self._free.get_nowait()
+        except Empty:
+            self._buffer = bytearray(self._buffer_size)
+
+        self._used = 0
+
+    def _current_rate(self) -> int:
+        if self._system_av_info is None or self._system_av_info.timing.sample_rate <= 0:
+            return _DEFAULT_SAMPLE_RATE
+
+        return round(self._system_av_info.timing.sample_rate)
+
+    @override
+    def sample(self, left: int, right: int) -> None:
+        _FRAME.pack_into(self._buffer, self._used, left, right)
+        self._used += _FRAME.size
+        if self._used == self._buffer_size:
+            self._submit()
+
+    @override
     def sample_batch(self, data: memoryview) -> int:
-        self._file.writeframesraw(data)
+        frames = len(data) // 2
+        with data.cast("B") as src:
+            offset = 0
+            size = len(src)
+            while offset < size:
+                n = min(size - offset, self._buffer_size - self._used)
+                self._buffer[self._used : self._used + n] = src[offset : offset + n]
+                self._used += n
+                offset += n
+                if self._used == self._buffer_size:
+                    self._submit()
 
         # Divide by two to return number of frames
-        return len(memoryview) // 2
+        return frames
+
+    def flush(self) -> None:
+        """
+        Passes any buffered audio to the writer thread.
+        """
+        if self._used:
+            self._submit()
+
+    def close(self) -> None:
+        """
+        Writes all buffered audio, finalizes the output file,
+        and waits for the FLAC encoder (if any) to exit.
+        File objects passed to the constructor are not closed.
+
+        :raises RuntimeError: If the writer thread or the encoder failed.
+        """
+        if self._closed:
+            return
+
+        self.flush()
+        self._closed = True
+        self._finalizer.detach()
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+        if self._writer.error is not None:
+            raise RuntimeError("Failed to write audio") from self._writer.error
 
     @property
     @override
@@ -50,7 +453,7 @@ class WaveWriterAudioDriver(AudioDriver):
     @callbacks.setter
     @override
     def callbacks(self, callback: retro_audio_callback | None):
-        raise UnsupportedEnvCall("ArrayAudioDriver does not support setting callbacks")
+        raise UnsupportedEnvCall("WaveWriterAudioDriver does not support setting callbacks")
 
     @property
     @override
@@ -61,7 +464,7 @@ class WaveWriterAudioDriver(AudioDriver):
     @override
     def buffer_status(self, callback: retro_audio_buffer_status_callback):
         raise UnsupportedEnvCall(
-            "ArrayAudioDriver does not support setting buffer status callback"
+            "WaveWriterAudioDriver does not support setting buffer status callback"
         )
 
     @property
@@ -72,7 +475,7 @@ class WaveWriterAudioDriver(AudioDriver):
     @minimum_latency.setter
     @override
     def minimum_latency(self, latency: int | None):
-        raise UnsupportedEnvCall("ArrayAudioDriver does not support setting minimum latency")
+        raise UnsupportedEnvCall("WaveWriterAudioDriver does not support setting minimum latency")
 
     @property
     @override
@@ -86,11 +489,15 @@ class WaveWriterAudioDriver(AudioDriver):
             raise TypeError(f"Expected retro_system_av_info; got {type(info).__name__}")
 
         self._system_av_info = deepcopy(info)
-
-    def close(self):
-        self._file.close()
+        rate = self._current_rate()
+        if self._rate is not None and rate != self._rate:
+            # Audio buffered so far was produced at the old rate
+            self.flush()
+            self._start_segment(rate)
 
 
 __all__ = [
+    "AudioFileFormat",
     "WaveWriterAudioDriver",
+    "flac_encoder",
 ]
@@ -2,5 +2,6 @@
 Drivers for loading content.
 """
 
+from .cache import *
 from .driver import *
 from .standard import *
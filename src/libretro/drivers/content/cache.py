@@ -0,0 +1,281 @@
+"""
+A cache of content extracted from archives, shared between processes.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from os import PathLike
+from typing import final
+from zipfile import Path as ZipPath
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+_LOCK_SUFFIX = ".lock"
+
+
+@contextmanager
+def _locked(path: str, *, shared: bool = False, blocking: bool = True) -> Iterator[bool]:
+    """
+    Locks the file at ``path`` (creating it if necessary) for as long as the context is open.
+
+    Shared locks are only honored on POSIX;
+    on Windows they're skipped, since Windows won't delete files that are in use anyway.
+
+    :return: Whether the lock was acquired, which is always ``True`` if ``blocking``.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            acquired = True
+            if fcntl is not None:
+                flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                try:
+                    fcntl.flock(fd, flags if blocking else flags | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    acquired = False
+            elif msvcrt is not None and not shared:
+                mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                try:
+                    msvcrt.locking(fd, mode, 1)
+                except OSError:
+                    if blocking:
+                        raise
+                    acquired = False
+
+            if acquired and not _same_file(fd, path):
+                # The lock file was deleted (by evict) while we waited for it
+                continue
+
+            yield acquired
+            return
+        finally:
+            os.close(fd)  # Also releases the lock
+
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        return os.path.samestat(os.fstat(fd), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+@final
+class ContentCache:
+    """
+    Keeps files extracted from zip archives on disk
+    so that loading the same archive member again doesn't extract it again.
+
+    Entries are keyed on the archive's path, modification time, and size,
+    plus the member's name, size, and CRC-32 (from the archive's central directory),
+    so a modified archive is extracted again instead of reusing stale files.
+    When the cache exceeds ``max_bytes``, the least recently used entries are deleted.
+
+    Several processes (e.g. the workers of a ``SessionPool``) may share one cache directory;
+    lock files keep them from extracting the same entry twice
+    or deleting an entry that another process is loading.
+    """
+
+    def __init__(self, directory: str | PathLike | None = None, max_bytes: int = 1024**3):
+        """
+        :param directory: Where to store extracted files.
+            Defaults to a ``libretro.py-content`` directory in the system's temporary directory.
+        :param max_bytes: The most disk space the cache should use, in bytes.
+            The entry that was most recently used is never evicted, even if it alone is larger.
+        :raises ValueError: If ``max_bytes`` is less than 1.
+        """
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), "libretro.py-content")
+
+        if not isinstance(directory, (str, PathLike)):
+            raise TypeError(f"Expected a str, PathLike, or None, got {type(directory).__name__}")
+
+        if not isinstance(max_bytes, int):
+            raise TypeError(f"Expected an int, got {type(max_bytes).__name__}")
+
+        if max_bytes < 1:
+            raise ValueError(f"Expected a cache size of at least 1 byte, got {max_bytes}")
+
+        self._directory = os.fspath(directory)
+        self._max_bytes = max_bytes
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes
+
+    @staticmethod
+    def key(zippath: ZipPath) -> str:
+        """
+        :return: The name of the cache entry that holds ``zippath``.
+        :raises TypeError: If ``zippath`` is not a ``zipfile.Path``.
+        :raises ValueError: If the archive wasn't opened from a file on disk.
+        """
+        if not isinstance(zippath, ZipPath):
+            raise TypeError(f"Expected a zipfile.Path, got {type(zippath).__name__}")
+
+        archive = zippath.root.filename
+        if archive is None:
+            raise ValueError(f"Can't cache {zippath.name}; its archive isn't a file on disk")
+
+        stat = os.stat(archive)
+        member = zippath.root.getinfo(zippath.at)
+        identity = "\0".join(
+            str(x)
+            for x in (
+                os.path.realpath(archive),
+                stat.st_mtime_ns,
+                stat.st_size,
+                member.filename,
+                member.file_size,
+                member.CRC,
+            )
+        )
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    @contextmanager
+    def extract(self, zippath: ZipPath) -> Iterator[str]:
+        """
+        Extracts ``zippath`` into the cache if it isn't there already.
+
+        The extracted file won't be evicted until the context exits,
+        so don't use the returned path afterwards.
+        The file is shared with other users of the cache, so don't modify it.
+
+        :return: The path to the extracted file.
+        """
+        key = self.key(zippath)
+        entry = os.path.join(self._directory, key)
+        lock = entry + _LOCK_SUFFIX
+        path = os.path.join(entry, os.path.basename(zippath.at))
+
+        while True:
+            # Only the shared lock is needed to use an existing entry,
+            # so several sessions can hold the same entry at once
+            with _locked(lock, shared=True):
+                if os.path.isdir(entry):
+                    # The entry directory's mtime records when it was last used
+                    os.utime(entry)
+                    self.evict(keep=key)
+                    yield path
+                    return
+
+            with _locked(lock):
+                # Another process may have extracted the entry between the two locks
+                if not os.path.isdir(entry):
+                    self.__populate(zippath, key, entry)
+
+    def __populate(self, zippath: ZipPath, key: str, entry: str) -> None:
+        # Extract to a staging directory first so that a crash can't leave a partial entry
+        name = os.path.basename(zippath.at)
+        staging = tempfile.mkdtemp(dir=self._directory, prefix=f".{key}-")
+        try:
+            with zippath.root.open(zippath.at) as src:
+                with open(os.path.join(staging, name), "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
+
+            os.replace(staging, entry)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+    def evict(self, keep: str | None = None) -> int:
+        """
+        Deletes the least recently used entries until the cache fits in ``max_bytes``.
+        Entries that another process is using are skipped.
+
+        :param keep: The key of an entry that must not be deleted.
+        :return: The number of bytes freed.
+        """
+        entries: list[tuple[int, int, str]] = []
+        locks: list[str] = []
+        total = 0
+        with os.scandir(self._directory) as it:
+            for e in it:
+                if e.name.endswith(_LOCK_SUFFIX):
+                    locks.append(e.path)
+                    continue
+
+                if e.name.startswith(".") or not e.is_dir(follow_symlinks=False):
+                    continue
+
+                size = _tree_size(e.path)
+                total += size
+                if e.name != keep:
+                    entries.append((e.stat().st_mtime_ns, size, e.name))
+
+        freed = 0
+        entries.sort()
+        for _, size, name in entries:
+            if total - freed <= self._max_bytes:
+                break
+
+            entry = os.path.join(self._directory, name)
+            with _locked(entry + _LOCK_SUFFIX, blocking=False) as acquired:
+                if not acquired:
+                    continue
+
+                shutil.rmtree(entry, ignore_errors=True)
+                if not os.path.exists(entry):
+                    freed += size
+                    _unlink_lock(entry + _LOCK_SUFFIX)
+
+        # Lock files of entries that were evicted (or never finished extracting)
+        for lock in locks:
+            if not os.path.isdir(lock[: -len(_LOCK_SUFFIX)]):
+                with _locked(lock, blocking=False) as acquired:
+                    # The entry may have been extracted since the scan
+                    if acquired and not os.path.isdir(lock[: -len(_LOCK_SUFFIX)]):
+                        _unlink_lock(lock)
+
+        return freed
+
+    def clear(self) -> None:
+        """
+        Deletes every entry that isn't in use.
+        """
+        max_bytes = self._max_bytes
+        try:
+            self._max_bytes = 0
+            self.evict()
+        finally:
+            self._max_bytes = max_bytes
+
+
+def _unlink_lock(path: str) -> None:
+    # Must hold the lock; anyone waiting for it will see that it's gone and open a new one.
+    # Windows won't delete it while it's open, so it's left for a later eviction
+    with suppress(OSError):
+        os.unlink(path)
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            try:
+                size += os.path.getsize(os.path.join(root, f))
+            except OSError:
+                pass
+
+    return size
+
+
+__all__ = [
+    "ContentCache",
+]
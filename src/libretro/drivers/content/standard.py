@@ -22,6 +22,7 @@ from libretro.api import (
 )
 from libretro.api._utils import addressof_buffer, mmap_file
 
+from .cache import ContentCache
 from .driver import (
     ContentAttributes,
     ContentDriver,
@@ -32,14 +33,23 @@ from .driver import (
 
 
 class _PersistentBuffer:
-    def __init__(self, ptr: c_void_p, backing: AbstractContextManager | None):
+    def __init__(
+        self,
+        ptr: c_void_p,
+        backing: AbstractContextManager | None,
+        data: memoryview | bytearray | None = None,
+    ):
         self.ptr = ptr
         self.backing = backing
+        # Keeps the buffer that ptr points to alive
+        self.data = data
 
     def __del__(self):
         self.close()
 
     def close(self) -> None:
+        # Let go of the buffer before its mapping (if any) is closed
+        self.data = None
         if self.backing:
             self.backing.__exit__(None, None, None)
             del self.backing
@@ -51,7 +61,15 @@ class _PersistentBuffer:
 
 
 class StandardContentDriver(ContentDriver):
-    def __init__(self, enable_extended_info: bool = True):
+    def __init__(self, enable_extended_info: bool = True, cache: ContentCache | None = None):
+        """
+        :param enable_extended_info: Whether to expose ``retro_game_info_ext`` to the core.
+        :param cache: Where to extract content from zip archives.
+            If ``None``, each load extracts to a new temporary directory.
+        """
+        if cache is not None and not isinstance(cache, ContentCache):
+            raise TypeError(f"Expected ContentCache or None, got {type(cache).__name__}")
+
         self._subsystems: Subsystems | None = None
         self._overrides: ContentInfoOverrides | None = None
         self._content: Sequence[retro_game_info] | None = None
@@ -60,6 +78,7 @@ class StandardContentDriver(ContentDriver):
         self._support_no_game: bool | None = None
         self._enable_extended_info = bool(enable_extended_info)
         self._persistent_buffers: set[_PersistentBuffer] = set()
+        self._cache = cache
 
     def __del__(self):
         self._persistent_buffers.clear()
@@ -73,6 +92,10 @@ class StandardContentDriver(ContentDriver):
     def enable_extended_info(self, value: bool) -> None:
         self._enable_extended_info = bool(value)
 
+    @property
+    def cache(self) -> ContentCache | None:
+        return self._cache
+
     @property
     @override
     def game_info_ext(self) -> Array[retro_game_info_ext] | None:
@@ -242,35 +265,41 @@ class StandardContentDriver(ContentDriver):
                 # Give the loaded content to the environment
                 yield LoadedContentFile(loaded_info, loaded_info_ext)
 
-            case ZipPath(zippath), ContentAttributes(
+            case ZipPath() as zippath, ContentAttributes(
                 need_fullpath=True, block_extract=False, persistent_data=False
             ):
                 # If the core needs a full path...
                 zippath: ZipPath
-                with TemporaryDirectory() as tmp:
-                    tmpfile = zippath.root.extract(zippath.at, tmp)
+                with self.__extract(zippath) as tmpfile:
                     loaded_info = retro_game_info(os.fsencode(tmpfile), None, 0, None)
                     loaded_info_ext = _make_game_info_ext(loaded_info)
                     yield LoadedContentFile(loaded_info, loaded_info_ext)
-            case ZipPath(zippath), ContentAttributes(need_fullpath=True, block_extract=True):
+            case ZipPath() as zippath, ContentAttributes(need_fullpath=True, block_extract=True):
                 # If the core needs a full path and we're blocking extraction...
                 raise ContentError(
                     f"Cannot extract {zippath}; core requires a full path, but block_extract is enabled"
                 )
-            case ZipPath(zippath), ContentAttributes(
+            case ZipPath() as zippath, ContentAttributes(
                 need_fullpath=False
             ):  # TODO: Is block_extract significant here?
                 path = f"{zippath.filename}#{zippath.name}".encode()
-                data = zippath.read_bytes()
+                context = self.__read(zippath)
+                data = context.__enter__()
                 loaded_info = retro_game_info(path, addressof_buffer(data), len(data), None)
                 loaded_info_ext = _make_game_info_ext(loaded_info)
 
                 if attributes.persistent_data:
+                    # The buffer (and its mapping, if any) will be released in __del__ later
                     self._persistent_buffers.add(
-                        _PersistentBuffer(c_void_p(loaded_info.data), None)
+                        _PersistentBuffer(c_void_p(loaded_info.data), context, data)
                     )
-
-                yield LoadedContentFile(loaded_info, loaded_info_ext)
+                    yield LoadedContentFile(loaded_info, loaded_info_ext)
+                else:
+                    try:
+                        yield LoadedContentFile(loaded_info, loaded_info_ext)
+                    finally:
+                        del data
+                        context.__exit__(None, None, None)
 
             # For test cases that provide content by path
             case str(path) | PathLike(path), ContentAttributes(need_fullpath=True):
@@ -310,7 +339,7 @@ class StandardContentDriver(ContentDriver):
 
                 if persistent_data:
                     self._persistent_buffers.add(
-                        _PersistentBuffer(c_void_p(loaded_info.data), None)
+                        _PersistentBuffer(c_void_p(loaded_info.data), None, rom)
                     )
 
                 yield LoadedContentFile(loaded_info, loaded_info_ext)
@@ -334,6 +363,37 @@ class StandardContentDriver(ContentDriver):
             if loaded_info_ext:
                 loaded_info_ext.data = None
 
+    @contextmanager
+    def __extract(self, zippath: ZipPath) -> AbstractContextManager[str]:
+        if self._cache is not None and zippath.root.filename is not None:
+            with self._cache.extract(zippath) as path:
+                yield path
+        else:
+            with TemporaryDirectory() as tmp:
+                yield zippath.root.extract(zippath.at, tmp)
+
+    @contextmanager
+    def __read(self, zippath: ZipPath) -> AbstractContextManager[memoryview | bytearray]:
+        if self._cache is not None and zippath.root.filename is not None:
+            with ExitStack() as stack:
+                # Map the cached file instead of decompressing the member again.
+                # The mapping stays valid even if the cache entry is evicted,
+                # so the entry's lock is released as soon as it's mapped
+                # (persistent content would otherwise hold it for the whole session)
+                with self._cache.extract(zippath) as path:
+                    if os.path.getsize(path) == 0:
+                        # Empty files can't be mapped
+                        view = bytearray()
+                    else:
+                        view = stack.enter_context(mmap_file(path))
+
+                yield view
+        else:
+            # The data must be writable for addressof_buffer to accept it,
+            # and must stay referenced here until the context exits
+            data = bytearray(zippath.read_bytes())
+            yield data
+
     @property
     @override
     def system_info(self) -> retro_system_info | None:
@@ -1,4 +1,6 @@
-from collections.abc import Callable, Sequence
+from array import array
+from collections.abc import Callable, Iterator, MutableSequence, Sequence
+from contextlib import AbstractContextManager, nullcontext
 from copy import deepcopy
 from ctypes import (
     POINTER,
@@ -16,7 +18,9 @@ from ctypes import (
     sizeof,
     string_at,
 )
-from typing import AnyStr, Required, TypedDict
+from enum import Enum
+from threading import Lock
+from typing import AnyStr, NamedTuple, Required, TypedDict
 
 from _ctypes import CFuncPtr
 
@@ -28,7 +32,6 @@ from libretro.api import (
     LogLevel,
     MemoryAccess,
     PixelFormat,
-    Port,
     Rotation,
     RumbleEffect,
     SavestateContext,
@@ -98,7 +101,7 @@ from libretro.api._utils import (
     from_zero_terminated,
     memoryview_at,
 )
-from libretro.drivers.audio import AudioDriver
+from libretro.drivers.audio import AudioDriver, ThreadedAudioDriver
 from libretro.drivers.camera import CameraDriver
 from libretro.drivers.content import ContentDriver
 from libretro.drivers.input import InputDriver
@@ -119,9 +122,64 @@ from libretro.drivers.video import FrameBufferSpecial, VideoDriver
 
 from .default import DefaultEnvironmentDriver
 
+# Enough for a frame of single samples at 48kHz and 24 FPS
+_AUDIO_STAGING_SAMPLES = 4096
+
+# Indexed by device ID, as InputDevice(device) is too slow to call for every input_state
+_INPUT_DEVICES = tuple(InputDevice)
+
 # TODO: Match envcalls even if the experimental flag is unset (but still consider it for ABI differences)
 
 
+class InputPollPolicy(Enum):
+    """
+    When ``CompositeEnvironmentDriver`` polls its input driver
+    in response to the core's calls to ``retro_input_poll_t``.
+
+    Except for ``EVERY``, the input driver is polled at most once per frame;
+    frames are delimited by ``CompositeEnvironmentDriver.begin_frame``,
+    which ``Session`` calls before each frame.
+    """
+
+    EVERY = "every"
+    """Poll the input driver every time the core polls input."""
+
+    FIRST = "first"
+    """Poll the input driver the first time the core polls input during a frame."""
+
+    LAST = "last"
+    """
+    Defer polling until the core first queries input during a frame,
+    so that the poll happens at the most recent ``retro_input_poll_t`` call before the query.
+    Frames in which the core polls but never queries input don't poll the input driver.
+    """
+
+    LAZY = "lazy"
+    """
+    Poll the input driver the first time the core queries input during a frame,
+    whether or not the core polled first.
+    Frames in which the core never queries input don't poll the input driver.
+    """
+
+
+class InputPollStats(NamedTuple):
+    """
+    Counters kept by ``CompositeEnvironmentDriver`` about input polling.
+    """
+
+    calls: int
+    """The number of times the core called ``retro_input_poll_t``."""
+
+    polls: int
+    """The number of times the input driver was actually polled."""
+
+    redundant: int
+    """The number of ``retro_input_poll_t`` calls after the first in the same frame."""
+
+    skipped: int
+    """The number of frames in which the input driver wasn't polled because the core didn't query input."""
+
+
 class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
     class Args(TypedDict, total=False):
         audio: Required[AudioDriver]
@@ -148,6 +206,8 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
         jit_capable: bool | None
         mic_interface: MicrophoneDriver | None
         device_power: PowerDriver | None
+        input_poll_policy: InputPollPolicy | None
+        coalesce_audio: bool | None
 
     @override
     def __init__(self, kwargs: Args):
@@ -156,6 +216,12 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
         if not isinstance(self._audio, AudioDriver):
             raise TypeError(f"Expected AudioDriver, got {type(self._audio).__qualname__}")
 
+        # Optional; lets drivers like RingBufferAudioDriver line audio up with video frames
+        self._audio_begin_frame: Callable[[], None] | None = getattr(
+            self._audio, "begin_frame", None
+        )
+        self._audio_end_frame: Callable[[], None] | None = getattr(self._audio, "end_frame", None)
+
         self._input = kwargs["input"]
         if not isinstance(self._input, InputDriver):
             raise TypeError(f"Expected InputDriver, got {type(self._input).__qualname__}")
@@ -286,10 +352,52 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
                 f"Expected PowerDriver or None, got {type(self._device_power).__qualname__}"
             )
 
+        self._input_poll_policy = kwargs.get("input_poll_policy") or InputPollPolicy.EVERY
+        if not isinstance(self._input_poll_policy, InputPollPolicy):
+            raise TypeError(
+                f"Expected InputPollPolicy or None, got {type(self._input_poll_policy).__qualname__}"
+            )
+
+        coalesce_audio = kwargs.get("coalesce_audio")
+        if coalesce_audio is not None and not isinstance(coalesce_audio, bool):
+            raise TypeError(f"Expected bool or None, got {type(coalesce_audio).__qualname__}")
+
+        # The audio thread calls audio_sample from the core's audio callback,
+        # so the staging buffer would be shared with the main thread
+        # and its contents wouldn't reach the device until the next frame ended
+        threaded = isinstance(self._audio, ThreadedAudioDriver)
+
+        # Single samples are staged here and passed to the audio driver in batches
+        self._audio_staging: array | None = None
+        self._audio_staging_view: memoryview | None = None
+        if coalesce_audio and not threaded:
+            self._audio_staging = array("h", bytes(_AUDIO_STAGING_SAMPLES * sizeof(c_int16)))
+            self._audio_staging_view = memoryview(self._audio_staging)
+
+        self._audio_staged = 0
+
         self._rumble: retro_rumble_interface | None = None
         self._sensor: retro_sensor_interface | None = None
         self._log_cb: retro_log_callback | None = None
         self._led_cb: retro_led_interface | None = None
+        self._state_version = 0
+        self._video_refreshes = 0
+        self._video_dupes = 0
+        self._audio_frames = 0
+        # Guards _audio_frames if the audio thread can submit samples too
+        self._audio_frames_lock: AbstractContextManager = Lock() if threaded else nullcontext()
+        self._input_recording: MutableSequence[int] | None = None
+        self._input_playback: Iterator[int] | None = None
+        self._input_poll_calls = 0
+        self._input_polls = 0
+        self._redundant_input_polls = 0
+        self._skipped_input_polls = 0
+        self._frame_poll_calls = 0
+        self._frame_polled = False
+        self._frame_started = False
+        self._poll_due = False
+        self._discard_video = False
+        self._discard_audio = False
 
     @property
     def audio(self) -> AudioDriver:
@@ -323,11 +431,75 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
     def timing(self) -> TimingDriver | None:
         return self._timing
 
+    @property
+    def state_version(self) -> int:
+        """
+        A counter that increases whenever the core makes an environment call
+        that may require the frontend to reinitialize something between frames,
+        such as changing the pixel format, system AV info, or memory maps, or shutting down.
+        """
+        return self._state_version
+
+    @property
+    def video_refreshes(self) -> int:
+        """
+        The number of times the core has called ``retro_video_refresh_t``, including dupes.
+        """
+        return self._video_refreshes
+
+    @property
+    def video_dupes(self) -> int:
+        """
+        The number of times the core has asked to duplicate the previous frame.
+        """
+        return self._video_dupes
+
+    @property
+    def audio_frames(self) -> int:
+        """
+        The number of stereo audio frames that the core has produced.
+        """
+        return self._audio_frames + self._audio_staged // 2
+
+    @property
+    def discarded_output(self) -> AvEnableFlags:
+        """
+        Which kinds of output the core produces that should *not* reach the video or audio drivers.
+        ``AvEnableFlags.VIDEO`` discards video refreshes
+        and ``AvEnableFlags.AUDIO`` discards audio samples;
+        other flags are ignored.
+
+        Unlike ``av_enable``, this isn't exposed to the core.
+        Discarded output isn't counted by ``video_refreshes``, ``video_dupes``, or ``audio_frames``.
+        While audio is discarded (as in the hidden frames that ``RunAhead`` runs),
+        the input driver isn't polled either,
+        so that drivers which count polls (like ``InputMovieRecorder``) only see presented frames.
+        """
+        flags = AvEnableFlags(0)
+        if self._discard_video:
+            flags |= AvEnableFlags.VIDEO
+        if self._discard_audio:
+            flags |= AvEnableFlags.AUDIO
+        return flags
+
+    @discarded_output.setter
+    def discarded_output(self, value: AvEnableFlags) -> None:
+        if not isinstance(value, (int, AvEnableFlags)):
+            raise TypeError(f"Expected AvEnableFlags, got {type(value).__name__}")
+
+        self._discard_video = bool(value & AvEnableFlags.VIDEO)
+        self._discard_audio = bool(value & AvEnableFlags.AUDIO)
+
     @override
     def video_refresh(self, data: c_void_p, width: int, height: int, pitch: int) -> None:
+        if self._discard_video:
+            return
+
+        self._video_refreshes += 1
         # Handle the constants and their equivalent ints, just to be safe
         match data:
             case FrameBufferSpecial.DUPE | 0 | None:
+                self._video_dupes += 1
                 self._video.refresh(FrameBufferSpecial.DUPE, width, height, pitch)
             case FrameBufferSpecial.HARDWARE | -1 | 18446744073709551615:
                 self._video.refresh(FrameBufferSpecial.HARDWARE, width, height, pitch)
@@ -344,23 +516,192 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
 
     @override
     def audio_sample(self, left: int, right: int) -> None:
-        self._audio.sample(left, right)
+        if self._discard_audio:
+            return
+
+        staging = self._audio_staging
+        if staging is None:
+            with self._audio_frames_lock:
+                self._audio_frames += 1
+
+            self._audio.sample(left, right)
+            return
+
+        # Staged samples are added to the audio frame count when they're flushed
+        i = self._audio_staged
+        staging[i] = left
+        staging[i + 1] = right
+        i += 2
+        self._audio_staged = i
+        if i == _AUDIO_STAGING_SAMPLES:
+            self.flush_audio()
+
+    def flush_audio(self) -> None:
+        """
+        Passes any audio samples that the core submitted with ``retro_audio_sample_t``
+        to the audio driver as a single batch.
+
+        Called automatically at the end of each frame (see ``end_frame``),
+        before each ``retro_audio_sample_batch_t`` call to keep the samples in order,
+        and whenever the staging buffer fills up.
+        """
+        staged = self._audio_staged
+        if staged:
+            self._audio_staged = 0
+            self._audio_frames += staged // 2
+            with self._audio_staging_view[:staged] as view:
+                self._audio.sample_batch(view)
+
+    @property
+    def coalesce_audio(self) -> bool:
+        """
+        Whether single samples from ``retro_audio_sample_t`` are passed to the audio driver
+        in batches (via ``AudioDriver.sample_batch``) instead of one at a time.
+        Always ``False`` if the audio driver is a ``ThreadedAudioDriver``.
+        """
+        return self._audio_staging is not None
 
     @override
     def audio_sample_batch(self, data: POINTER(c_int16), frames: int) -> int:
+        if self._discard_audio:
+            return frames
+
+        if self._audio_staged:
+            self.flush_audio()
+
         sample_view = memoryview_at(data, frames * 2 * sizeof(c_int16)).cast("h")
         assert (
             len(sample_view) == frames * 2
         ), f"Expected view to have {frames * 2} samples, got {len(sample_view)} samples"
+        with self._audio_frames_lock:
+            self._audio_frames += frames
+
         return self._audio.sample_batch(sample_view)
 
+    @property
+    def input_recording(self) -> MutableSequence[int] | None:
+        """
+        If set, every value returned to the core by ``input_state`` is appended to this sequence.
+        """
+        return self._input_recording
+
+    @input_recording.setter
+    def input_recording(self, recording: MutableSequence[int] | None) -> None:
+        self._input_recording = recording
+
+    @property
+    def input_playback(self) -> Iterator[int] | None:
+        """
+        If set, ``input_state`` returns values from this iterator
+        (in the order the core asks for them) instead of consulting the input driver,
+        and ``input_poll`` doesn't poll the input driver.
+        Once the iterator is exhausted, ``input_state`` returns 0.
+        """
+        return self._input_playback
+
+    @input_playback.setter
+    def input_playback(self, playback: Iterator[int] | None) -> None:
+        self._input_playback = playback
+
+    @property
+    def input_poll_policy(self) -> InputPollPolicy:
+        return self._input_poll_policy
+
+    @input_poll_policy.setter
+    def input_poll_policy(self, policy: InputPollPolicy) -> None:
+        if not isinstance(policy, InputPollPolicy):
+            raise TypeError(f"Expected InputPollPolicy, got {type(policy).__qualname__}")
+
+        self._input_poll_policy = policy
+        self._poll_due = False
+
+    @property
+    def input_poll_stats(self) -> InputPollStats:
+        return InputPollStats(
+            self._input_poll_calls,
+            self._input_polls,
+            self._redundant_input_polls,
+            self._skipped_input_polls,
+        )
+
+    def begin_frame(self) -> None:
+        """
+        Starts a new frame for the purposes of ``input_poll_policy``,
+        and tells the audio driver about it if it has a ``begin_frame`` method.
+        Call this just before ``retro_run``.
+        """
+        if (
+            self._frame_started
+            and not self._frame_polled
+            and self._input_playback is None
+            and self._input_poll_policy in (InputPollPolicy.LAST, InputPollPolicy.LAZY)
+            and (self._frame_poll_calls or self._input_poll_policy == InputPollPolicy.LAZY)
+        ):
+            self._skipped_input_polls += 1
+
+        if self._audio_begin_frame is not None:
+            self._audio_begin_frame()
+
+        self._frame_started = True
+        self._frame_poll_calls = 0
+        self._frame_polled = False
+        self._poll_due = self._input_poll_policy == InputPollPolicy.LAZY
+
+    def end_frame(self) -> None:
+        """
+        Finishes a frame by flushing any audio samples that were staged during it,
+        then tells the audio driver about it if it has an ``end_frame`` method.
+        Call this just after ``retro_run``.
+        """
+        if self._audio_staged:
+            self.flush_audio()
+
+        if self._audio_end_frame is not None:
+            self._audio_end_frame()
+
+    def __poll_input(self) -> None:
+        self._frame_polled = True
+        self._poll_due = False
+        self._input_polls += 1
+        self._input.poll()
+
     @override
     def input_poll(self) -> None:
-        self._input.poll()
+        self._input_poll_calls += 1
+        self._frame_poll_calls += 1
+        if self._frame_poll_calls > 1:
+            self._redundant_input_polls += 1
+
+        if self._input_playback is not None or self._discard_audio:
+            return
+
+        match self._input_poll_policy:
+            case InputPollPolicy.EVERY:
+                self.__poll_input()
+            case InputPollPolicy.FIRST if not self._frame_polled:
+                self.__poll_input()
+            case InputPollPolicy.LAST if not self._frame_polled:
+                self._poll_due = True
 
     @override
     def input_state(self, port: int, device: int, index: int, id: int) -> int:
-        return self._input.state(Port(port), InputDevice(device), index, id)
+        if self._input_playback is not None:
+            value = next(self._input_playback, 0)
+        else:
+            if self._poll_due:
+                self.__poll_input()
+
+            try:
+                input_device = _INPUT_DEVICES[device]
+            except IndexError:
+                input_device = InputDevice(device)
+
+            value = self._input.state(port, input_device, index, id)
+
+        if self._input_recording is not None:
+            self._input_recording.append(value)
+
+        return value
 
     @property
     def rotation(self) -> Rotation:
@@ -431,6 +772,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
     @override
     def _shutdown(self) -> bool:
         self.__shutdown = True  # TODO: Add a shutdown driver?
+        self._state_version += 1
         return True
 
     @property
@@ -474,6 +816,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
             raise ValueError("RETRO_ENVIRONMENT_SET_PIXEL_FORMAT doesn't accept NULL")
 
         self._video.pixel_format = PixelFormat(format_ptr[0])
+        self._state_version += 1
         return True
 
     @property
@@ -514,6 +857,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
             return False
 
         hw_render_ptr[0] = context
+        self._state_version += 1
         # Give the core the callbacks that the video driver defines
 
         return True
@@ -781,9 +1125,12 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
 
         # TODO: Provide a way to disable this envcall
         av_info: retro_system_av_info = info_ptr[0]
+        # Staged samples were produced under the old timing
+        self.flush_audio()
         self._video.system_av_info = av_info
         self._audio.system_av_info = av_info
         self._system_av_info = deepcopy(av_info)
+        self._state_version += 1
         return True
 
     @property
@@ -866,6 +1213,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
 
         memorymaps: retro_memory_map = map_ptr[0]
         self._memory_maps = deepcopy(memorymaps)
+        self._state_version += 1
         return True
 
     @property
@@ -878,6 +1226,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
             raise ValueError("RETRO_ENVIRONMENT_SET_GEOMETRY doesn't accept NULL")
 
         self._video.geometry = geometry_ptr[0]
+        self._state_version += 1
         return True
 
     @override
@@ -974,6 +1323,7 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
 
     def _set_hw_shared_context(self) -> bool:
         self._video.shared_context = True
+        self._state_version += 1
         return True
 
     @property
@@ -1458,4 +1808,8 @@ class CompositeEnvironmentDriver(DefaultEnvironmentDriver):
         return True
 
 
-__all__ = ["CompositeEnvironmentDriver"]
+__all__ = [
+    "CompositeEnvironmentDriver",
+    "InputPollPolicy",
+    "InputPollStats",
+]
@@ -10,8 +10,6 @@ from .driver import EnvironmentDriver
 
 EnvironmentCallbackFunction = Callable[[c_void_p], bool]
 
-_ENVCALL_MEMBERS = EnvironmentCall.__members__.values()
-
 
 class DictEnvironmentDriver(
     EnvironmentDriver, Mapping[EnvironmentCall, EnvironmentCallbackFunction]
@@ -20,6 +18,11 @@ class DictEnvironmentDriver(
         self._envcalls: Mapping[EnvironmentCall, EnvironmentCallbackFunction] = MappingProxyType(
             envcalls
         )
+        # Keyed by the raw command number (experimental bit included)
+        # so that environment() can dispatch without constructing an EnvironmentCall
+        self._dispatch: dict[int, EnvironmentCallbackFunction] = {
+            int(k): v for k, v in envcalls.items()
+        }
 
     @override
     def __getitem__(self, __key: EnvironmentCall) -> EnvironmentCallbackFunction:
@@ -35,17 +38,14 @@ class DictEnvironmentDriver(
 
     @override
     def environment(self, cmd: int, data: c_void_p) -> bool:
-        if cmd not in _ENVCALL_MEMBERS:
+        envcall = self._dispatch.get(cmd)
+        if envcall is None:
             return False
 
-        envcall = EnvironmentCall(cmd)
-        if envcall in self._envcalls:
-            try:
-                return self._envcalls[envcall](data)
-            except UnsupportedEnvCall:
-                pass
-
-        return False
+        try:
+            return envcall(data)
+        except UnsupportedEnvCall:
+            return False
 
 
 __all__ = [
@@ -0,0 +1,329 @@
+import csv
+import json
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from ctypes import c_void_p
+from enum import Enum
+from os import PathLike
+from time import perf_counter_ns
+from typing import NamedTuple, TextIO, final
+
+from libretro.api import EnvironmentCall
+from libretro.error import UnsupportedEnvCall
+
+from .dict import DictEnvironmentDriver, EnvironmentCallbackFunction
+
+_ENVCALL_VALUES = frozenset(EnvironmentCall.__members__.values())
+
+
+class EnvcallPhase(Enum):
+    """
+    The part of a session's lifetime in which an envcall was made.
+    """
+
+    INIT = "init"
+    """From ``retro_set_environment`` through ``retro_init``."""
+
+    LOAD = "load"
+    """While content is loaded, up to ``retro_get_system_av_info``."""
+
+    RUN = "run"
+    """After content is loaded, including ``retro_run`` and savestate operations."""
+
+    UNLOAD = "unload"
+    """During ``retro_unload_game`` and ``retro_deinit``."""
+
+
+class EnvcallStats:
+    """
+    Running totals for one envcall in one phase.
+
+    ``succeeded`` and ``failed`` count calls that returned ``True`` and ``False``
+    (including unsupported and unknown envcalls),
+    and ``raised`` counts calls whose handler raised an exception.
+    """
+
+    __slots__ = ("calls", "succeeded", "failed", "raised", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.calls = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.raised = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.calls if self.calls else 0.0
+
+
+class EnvcallRecord(NamedTuple):
+    """
+    One row of an ``EnvcallTracer``'s report.
+    """
+
+    envcall: str
+    """The envcall's name, or its number in hex if libretro.py doesn't know it."""
+
+    phase: EnvcallPhase
+    calls: int
+    succeeded: int
+    failed: int
+    raised: int
+    total_ns: int
+    max_ns: int
+
+
+_FIELDS = EnvcallRecord._fields
+
+
+def _name(cmd: int) -> str:
+    return EnvironmentCall(cmd).name if cmd in _ENVCALL_VALUES else f"{cmd:#x}"
+
+
+class _TracedDispatch(dict[int, EnvironmentCallbackFunction]):
+    """
+    A dispatch table whose handlers are all wrapped by a tracer,
+    including handlers for envcalls that the driver doesn't support.
+    """
+
+    def __init__(
+        self, tracer: "EnvcallTracer", dispatch: Mapping[int, EnvironmentCallbackFunction]
+    ):
+        super().__init__({cmd: tracer._wrap(cmd, f) for cmd, f in dispatch.items()})
+        self.tracer = tracer
+        self.original = dispatch
+
+    def get(self, cmd: int, default=None) -> EnvironmentCallbackFunction:
+        # Overridden so that envcalls the driver can't handle are recorded too
+        return self[cmd]
+
+    def __missing__(self, cmd: int) -> EnvironmentCallbackFunction:
+        handler = self.tracer._wrap(cmd, _unsupported)
+        self[cmd] = handler
+        return handler
+
+
+def _unsupported(_: c_void_p) -> bool:
+    return False
+
+
+@final
+class EnvcallTracer:
+    """
+    Counts and times every envcall that reaches a ``DictEnvironmentDriver``,
+    including calls that it doesn't support.
+
+    Attaching a tracer replaces the driver's dispatch table with instrumented handlers;
+    detaching it restores the original table,
+    so a driver with no tracer attached pays nothing for this feature.
+
+    Usually created with ``Session.trace_envcalls``,
+    which also keeps ``phase`` up to date.
+    """
+
+    def __init__(self, clock: Callable[[], int] = perf_counter_ns):
+        """
+        :param clock: Returns the current time in nanoseconds.
+        """
+        if not callable(clock):
+            raise TypeError(f"Expected a callable, got {type(clock).__name__}")
+
+        self._clock = clock
+        self._phase = EnvcallPhase.INIT
+        self._stats: dict[EnvcallPhase, dict[int, EnvcallStats]] = {p: {} for p in EnvcallPhase}
+        self._current = self._stats[self._phase]
+        self._driver: DictEnvironmentDriver | None = None
+
+    @property
+    def phase(self) -> EnvcallPhase:
+        """
+        The phase that new envcalls are attributed to.
+        """
+        return self._phase
+
+    @phase.setter
+    def phase(self, phase: EnvcallPhase) -> None:
+        if not isinstance(phase, EnvcallPhase):
+            raise TypeError(f"Expected an EnvcallPhase, got {type(phase).__name__}")
+
+        self._phase = phase
+        self._current = self._stats[phase]
+
+    @property
+    def driver(self) -> DictEnvironmentDriver | None:
+        return self._driver
+
+    def attach(self, driver: DictEnvironmentDriver) -> None:
+        """
+        Starts tracing ``driver``'s envcalls.
+
+        :raises TypeError: If ``driver`` is not a ``DictEnvironmentDriver``.
+        :raises RuntimeError: If this tracer or another is already attached to a driver.
+        """
+        if not isinstance(driver, DictEnvironmentDriver):
+            raise TypeError(f"Expected a DictEnvironmentDriver, got {type(driver).__name__}")
+
+        if self._driver is not None:
+            raise RuntimeError("This tracer is already attached to a driver")
+
+        if isinstance(driver._dispatch, _TracedDispatch):
+            raise RuntimeError("Another tracer is already attached to this driver")
+
+        driver._dispatch = _TracedDispatch(self, driver._dispatch)
+        self._driver = driver
+
+    def detach(self) -> None:
+        """
+        Stops tracing, restoring the driver's original dispatch table.
+        The recorded statistics are kept.
+        """
+        if self._driver is None:
+            return
+
+        dispatch = self._driver._dispatch
+        if isinstance(dispatch, _TracedDispatch) and dispatch.tracer is self:
+            self._driver._dispatch = dispatch.original
+
+        self._driver = None
+
+    @contextmanager
+    def tracing(self, driver: DictEnvironmentDriver) -> Iterator["EnvcallTracer"]:
+        """
+        Attaches this tracer to ``driver`` for the duration of a ``with`` block.
+        """
+        self.attach(driver)
+        try:
+            yield self
+        finally:
+            self.detach()
+
+    def _wrap(self, cmd: int, handler: EnvironmentCallbackFunction) -> EnvironmentCallbackFunction:
+        clock = self._clock
+
+        def _traced(data: c_void_p) -> bool:
+            stats = self._current.get(cmd)
+            if stats is None:
+                stats = self._current[cmd] = EnvcallStats()
+
+            stats.calls += 1
+            start = clock()
+            try:
+                result = handler(data)
+            except UnsupportedEnvCall:
+                # The driver would've returned False anyway
+                result = False
+            except BaseException:
+                stats.raised += 1
+                raise
+            finally:
+                elapsed = clock() - start
+                stats.total_ns += elapsed
+                if elapsed > stats.max_ns:
+                    stats.max_ns = elapsed
+
+            if result:
+                stats.succeeded += 1
+            else:
+                stats.failed += 1
+
+            return result
+
+        return _traced
+
+    @property
+    def stats(self) -> Mapping[EnvcallPhase, Mapping[int, EnvcallStats]]:
+        """
+        The live statistics for each phase, keyed by raw envcall number.
+        """
+        return self._stats
+
+    def records(self) -> Sequence[EnvcallRecord]:
+        """
+        :return: One record per envcall and phase, sorted by phase,
+            then by total time spent in the handler (most first).
+        """
+        records = []
+        for phase, table in self._stats.items():
+            rows = sorted(table.items(), key=lambda item: item[1].total_ns, reverse=True)
+            for cmd, s in rows:
+                records.append(
+                    EnvcallRecord(
+                        _name(cmd),
+                        phase,
+                        s.calls,
+                        s.succeeded,
+                        s.failed,
+                        s.raised,
+                        s.total_ns,
+                        s.max_ns,
+                    )
+                )
+
+        return records
+
+    def clear(self) -> None:
+        """
+        Discards all recorded statistics.
+        """
+        for table in self._stats.values():
+            table.clear()
+
+    def table(self) -> str:
+        """
+        :return: The recorded statistics as a plain-text table, with times in microseconds.
+        """
+        records = self.records()
+        width = max((len(r.envcall) for r in records), default=7)
+        lines = [
+            f"{'envcall':<{width}} {'phase':<6} {'calls':>8} {'true':>8} {'false':>8} "
+            f"{'raised':>6} {'total us':>10} {'mean us':>8} {'max us':>8}"
+        ]
+        for r in records:
+            mean = r.total_ns / r.calls if r.calls else 0.0
+            lines.append(
+                f"{r.envcall:<{width}} {r.phase.value:<6} {r.calls:>8} {r.succeeded:>8} "
+                f"{r.failed:>8} {r.raised:>6} {r.total_ns / 1000:>10.1f} {mean / 1000:>8.2f} "
+                f"{r.max_ns / 1000:>8.1f}"
+            )
+
+        return "\n".join(lines)
+
+    def write_json(self, file: TextIO | str | PathLike) -> None:
+        """
+        Writes the recorded statistics as a JSON array of objects, one per record.
+        """
+        rows = [{**r._asdict(), "phase": r.phase.value} for r in self.records()]
+        with _open(file) as f:
+            json.dump(rows, f, indent=2)
+
+    def write_csv(self, file: TextIO | str | PathLike) -> None:
+        """
+        Writes the recorded statistics as CSV, with a header row.
+        """
+        with _open(file) as f:
+            writer = csv.writer(f)
+            writer.writerow(_FIELDS)
+            for r in self.records():
+                writer.writerow((*r[:1], r.phase.value, *r[2:]))
+
+
+@contextmanager
+def _open(file: TextIO | str | PathLike) -> Iterator[TextIO]:
+    match file:
+        case str() | PathLike():
+            with open(file, "w", newline="") as f:
+                yield f
+        case _ if hasattr(file, "write"):
+            yield file
+        case _:
+            raise TypeError(f"Expected a text file or a path, got {type(file).__name__}")
+
+
+__all__ = [
+    "EnvcallPhase",
+    "EnvcallRecord",
+    "EnvcallStats",
+    "EnvcallTracer",
+]
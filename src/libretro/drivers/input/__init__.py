@@ -1,2 +1,3 @@
 from .driver import *
 from .generator import *
+from .movie import *
@@ -1,6 +1,10 @@
+import sys
+from array import array
 from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum, auto
+from functools import cache
+from operator import attrgetter
 
 from libretro._typing import override
 from libretro._utils import Pollable
@@ -40,6 +44,49 @@ _DEVICEID_LIGHTGUN_MEMBERS = DeviceIdLightgun.__members__.values()
 _DEVICEID_MOUSE_MEMBERS = DeviceIdMouse.__members__.values()
 _KEY_MEMBERS = Key.__members__.values()
 
+# Layout of GeneratorInputDriver's compiled input table.
+# Entries are indexed by ((port * _DEVICES + device) * _INDEXES + index) * _IDS + id;
+# index is only meaningful for the analog device, and is 0 for all others.
+_IDS = 512  # Enough for every Key and for DeviceIdJoypad.MASK
+_INDEXES = 4
+_DEVICES = 8
+_PORT_SIZE = _DEVICES * _INDEXES * _IDS
+_JOYPAD_BUTTONS = tuple(b for b in DeviceIdJoypad if b != DeviceIdJoypad.MASK)
+
+
+class _Exotic(Exception):
+    """
+    Raised while compiling a poll result that the input table can't represent.
+    """
+
+
+@cache
+def _device_fields(
+    cls: type[InputDeviceState], ids: tuple[int, ...]
+) -> tuple[tuple[int, ...], attrgetter]:
+    """
+    Works out which field of ``cls`` each of ``ids`` reads from,
+    by indexing an instance whose fields all have distinct values.
+
+    :return: The IDs that correspond to a field,
+        and a function that gets those fields' values (in the same order) from an instance.
+    """
+    names = [f.name for f in fields(cls) if f.type in (bool, int, "bool", "int")]
+    probe = cls(**{name: i + 1 for i, name in enumerate(names)})
+    found_ids = []
+    found_names = []
+    for id in ids:
+        try:
+            value = probe[id]
+        except (IndexError, KeyError, AttributeError):
+            continue
+
+        if isinstance(value, int) and 1 <= value <= len(names):
+            found_ids.append(int(id))
+            found_names.append(names[value - 1])
+
+    return tuple(found_ids), attrgetter(*found_names)
+
 
 @dataclass(order=True, slots=True)
 class Point:
@@ -144,6 +191,29 @@ class GeneratorInputDriver(InputDriver):
         self._rumble = rumble
         self._sensor = sensor
 
+        # The current poll result, flattened into a table that state() can index directly
+        self._table = array("l", bytes(array("l").itemsize * _PORT_SIZE))
+        self._table_entries: list[int] = []
+        self._table_ports = 0
+        self._table_broadcast = False
+        self._table_valid = True
+
+    @property
+    def input_generator(self) -> InputStateSource | None:
+        """
+        The source of input states.
+        Setting it replaces the current source, starting with the next poll.
+        """
+        return self._input_generator
+
+    @input_generator.setter
+    def input_generator(self, generator: InputStateSource | None) -> None:
+        self._input_generator = generator
+        self._input_generator_state = None
+        self._input_poll_result = None
+        self._last_input_poll_result = None
+        self._compile()
+
     @property
     @override
     def device_capabilities(self) -> InputDeviceFlag | None:
@@ -157,11 +227,13 @@ class GeneratorInputDriver(InputDriver):
 
         # Unrecognized devices will be filtered out by the CONFORM boundary on InputDeviceFlag
         self._device_capabilities = InputDeviceFlag(value)
+        self._compile()
 
     @device_capabilities.deleter
     @override
     def device_capabilities(self) -> None:
         self._device_capabilities = None
+        self._compile()
 
     @property
     @override
@@ -172,11 +244,13 @@ class GeneratorInputDriver(InputDriver):
     @override
     def bitmasks_supported(self, value: bool) -> None:
         self._bitmasks_supported = bool(value)
+        self._compile()
 
     @bitmasks_supported.deleter
     @override
     def bitmasks_supported(self) -> None:
         self._bitmasks_supported = None
+        self._compile()
 
     @property
     @override
@@ -196,10 +270,13 @@ class GeneratorInputDriver(InputDriver):
             case _:
                 raise TypeError(f"Expected None or a non-negative int, got {max_users!r}")
 
+        self._compile()
+
     @max_users.deleter
     @override
     def max_users(self) -> None:
         self._max_users = None
+        self._compile()
 
     def poll(self) -> None:
         if self._input_generator:
@@ -208,10 +285,11 @@ class GeneratorInputDriver(InputDriver):
                     case Callable() as func:
                         self._input_generator_state = func()
                     case Iterable() | Iterator() | Generator() as it:
-                        self._input_generator_state = it
+                        self._input_generator_state = iter(it)
 
             self._last_input_poll_result = self._input_poll_result
             self._input_poll_result = next(self._input_generator_state, None)
+            self._compile()
 
             # TODO: Send keyboard callback events
 
@@ -222,6 +300,176 @@ class GeneratorInputDriver(InputDriver):
             self._rumble.poll()
 
     def state(self, port: int, device: int, index: int, id: int) -> int:
+        if not self._table_valid:
+            return self._match_state(port, device, index, id)
+
+        if device != InputDevice.ANALOG:
+            # Only the analog device distinguishes between indexes
+            index = 0
+
+        if (
+            0 <= port < self._table_ports
+            and 0 <= device < _DEVICES
+            and 0 <= index < _INDEXES
+            and 0 <= id < _IDS
+        ):
+            if self._table_broadcast:
+                port = 0
+
+            return self._table[((port * _DEVICES + device) * _INDEXES + index) * _IDS + id]
+
+        return 0
+
+    def _compile(self) -> None:
+        """
+        Flattens the current poll result into the input table,
+        or marks the table invalid if the result contains types it can't represent
+        (in which case state() falls back to matching the result directly).
+        """
+        table = self._table
+        for i in self._table_entries:
+            table[i] = 0
+
+        self._table_entries.clear()
+        self._table_ports = 0
+        self._table_broadcast = False
+        self._table_valid = True
+
+        result = self._input_poll_result
+        max_users = self._max_users
+        try:
+            match result:
+                case PortState() | InputDeviceState() | None | int():
+                    # Yielding a type that's _not_ a sequence will expose it to all ports
+                    self._compile_port(0, result)
+                    self._table_ports = max_users if max_users is not None else sys.maxsize
+                    self._table_broadcast = True
+                case [*results]:
+                    ports = len(results) if max_users is None else min(len(results), max_users)
+                    if len(table) < ports * _PORT_SIZE:
+                        table.extend(bytes(table.itemsize * (ports * _PORT_SIZE - len(table))))
+
+                    for port in range(ports):
+                        self._compile_port(port, results[port])
+
+                    self._table_ports = ports
+                case _:
+                    raise _Exotic()
+        except (_Exotic, OverflowError):
+            for i in self._table_entries:
+                table[i] = 0
+
+            self._table_entries.clear()
+            self._table_valid = False
+
+    def _compile_port(self, port: int, result: InputPollResult) -> None:
+        match result:
+            case PortState() as port_state:
+                for device in InputDevice:
+                    state = port_state[device]
+                    if state is not None and self.__device_of(state) == device:
+                        self._compile_port(port, state)
+                    elif state is not None and self.__device_of(state) is None:
+                        # e.g. a PortState whose joypad is an int
+                        raise _Exotic()
+                return
+            case DeviceIdJoypad.MASK:
+                return
+            case DeviceIdJoypad() as button:
+                base = self.__device_base(port, InputDevice.JOYPAD)
+                if base is not None:
+                    self.__set(base + button, 1)
+                    if self._bitmasks_supported:
+                        self.__set(base + DeviceIdJoypad.MASK, 1 << button)
+                return
+            case Key() | DeviceIdMouse() | DeviceIdLightgun():
+                raise _Exotic()
+            case None:
+                return
+            case bool() | int() if not result:
+                return
+            case JoypadState():
+                base = self.__device_base(port, InputDevice.JOYPAD)
+                if base is not None:
+                    # The mask is exposed even if bitmasks aren't supported,
+                    # because JoypadState[DeviceIdJoypad.MASK] returns it
+                    self.__set(base + DeviceIdJoypad.MASK, result.mask)
+                    self.__set_fields(base, result, _JOYPAD_BUTTONS)
+                return
+            case AnalogState():
+                base = self.__device_base(port, InputDevice.ANALOG)
+                if base is not None:
+                    left = base + DeviceIndexAnalog.LEFT * _IDS
+                    right = base + DeviceIndexAnalog.RIGHT * _IDS
+                    for id in DeviceIdAnalog:
+                        self.__set(left + id, result.lstick[id])
+                        self.__set(right + id, result.rstick[id])
+
+                    self.__set_fields(
+                        base + DeviceIndexAnalog.BUTTON * _IDS, result, _JOYPAD_BUTTONS
+                    )
+                return
+            case MouseState():
+                base = self.__device_base(port, InputDevice.MOUSE)
+                if base is not None:
+                    self.__set_fields(base, result, _DEVICEID_MOUSE_MEMBERS)
+                return
+            case KeyboardState():
+                base = self.__device_base(port, InputDevice.KEYBOARD)
+                if base is not None:
+                    self.__set_fields(base, result, _KEY_MEMBERS)
+                return
+            case LightGunState():
+                base = self.__device_base(port, InputDevice.LIGHTGUN)
+                if base is not None:
+                    self.__set_fields(base, result, _DEVICEID_LIGHTGUN_MEMBERS)
+                return
+            case _:
+                # Pointers, points, nonzero constants, and anything unexpected
+                raise _Exotic()
+
+    @staticmethod
+    def __device_of(state: InputPollResult) -> InputDevice | None:
+        match state:
+            case JoypadState():
+                return InputDevice.JOYPAD
+            case MouseState():
+                return InputDevice.MOUSE
+            case KeyboardState():
+                return InputDevice.KEYBOARD
+            case LightGunState():
+                return InputDevice.LIGHTGUN
+            case AnalogState():
+                return InputDevice.ANALOG
+            case PointerState():
+                return InputDevice.POINTER
+            case _:
+                return None
+
+    def __device_base(self, port: int, device: InputDevice) -> int | None:
+        if self._device_capabilities is not None and device.flag not in self._device_capabilities:
+            # If we filter by devices, any device not in the flag will default to 0
+            return None
+
+        return (port * _DEVICES + device) * _INDEXES * _IDS
+
+    def __set(self, i: int, value: int) -> None:
+        if value:
+            self._table[i] = value
+            self._table_entries.append(i)
+
+    def __set_fields(self, base: int, state: InputDeviceState, ids: Iterable[int]) -> None:
+        field_ids, getter = _device_fields(type(state), tuple(ids))
+        values = getter(state)
+        if len(field_ids) == 1:
+            values = (values,)
+
+        for id, value in zip(field_ids, values):
+            if value:
+                self._table[base + id] = value
+                self._table_entries.append(base + id)
+
+    def _match_state(self, port: int, device: int, index: int, id: int) -> int:
         match (
             self._input_generator,
             self._input_poll_result,
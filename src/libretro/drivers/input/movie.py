@@ -0,0 +1,663 @@
+"""
+Recording and replaying the exact input that a core reads, in a compact binary format.
+
+A movie file consists of a header, a table of columns,
+one fixed-width record per frame, and a table of keyboard events.
+All integers are little-endian.
+
+===========  ===================================================================
+Section      Layout
+===========  ===================================================================
+Header       ``magic: 4s, version: u16, reserved: u16,
+             columns: u32, frames: u32, events: u32, reserved: u32``
+Columns      ``port: u16, device: u16, index: u16, id: u16`` for each column;
+             every distinct ``input_state`` query that the core made gets one column.
+Frames       ``polls: i16`` followed by one ``i16`` per column;
+             ``polls`` is how many times the core polled input during the frame,
+             and each column holds the last value returned for its query
+             (or 0 if the core didn't make that query).
+Events       ``frame: u32, keycode: u16, modifiers: u16, character: u32, down: u8, 3x``
+             for each keyboard event, sorted by frame.
+===========  ===================================================================
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Sequence
+from os import PathLike
+from typing import BinaryIO, NamedTuple, final
+
+from libretro._typing import override
+from libretro.api import (
+    InputDevice,
+    InputDeviceFlag,
+    Key,
+    KeyModifier,
+    Port,
+    retro_controller_description,
+    retro_input_descriptor,
+    retro_keyboard_callback,
+)
+from libretro.drivers.rumble import RumbleInterface
+from libretro.drivers.sensor import SensorInterface
+
+from .driver import InputDriver
+from .generator import GeneratorInputDriver
+
+MOVIE_MAGIC = b"LRMV"
+MOVIE_VERSION = 1
+
+_HEADER = struct.Struct("<4sHHIIII")
+_COLUMN = struct.Struct("<HHHH")
+_EVENT = struct.Struct("<IHHI?3x")
+_CELL = 2  # Size of each value in a frame record, in bytes
+
+# Bounds of InputMoviePlayer's dense column lookup table;
+# queries outside of these bounds are looked up in a dict instead
+_DEVICES = 8
+_INDEXES = 4
+_IDS = 512
+_PORT_SIZE = _DEVICES * _INDEXES * _IDS
+
+
+class MovieColumn(NamedTuple):
+    """
+    One kind of ``input_state`` query recorded in a movie.
+    """
+
+    port: int
+    device: int
+    index: int
+    id: int
+
+
+class KeyboardEvent(NamedTuple):
+    """
+    A keyboard event recorded in a movie.
+    """
+
+    frame: int
+    """The frame during which the event was sent to the core."""
+
+    down: bool
+    keycode: Key
+    character: int
+    modifiers: KeyModifier
+
+
+def _int16(value: int) -> int:
+    return ((int(value) + 0x8000) & 0xFFFF) - 0x8000
+
+
+@final
+class InputMovie:
+    """
+    A read-only movie backed by a memory-mapped file.
+
+    Frames are fixed-width, so any frame can be read without reading the ones before it.
+    """
+
+    def __init__(self, file: str | PathLike | bytes | bytearray | memoryview):
+        """
+        :param file: The path to a movie file, or the contents of one.
+        :raises TypeError: If ``file`` is not a path or a bytes-like object.
+        :raises ValueError: If ``file`` is not a valid movie.
+        """
+        self._mmap: mmap.mmap | None = None
+        match file:
+            case str() | PathLike():
+                with open(file, "rb") as f:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        raise ValueError("Expected a movie file, got an empty file")
+
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                buffer = memoryview(self._mmap)
+            case bytes() | bytearray() | memoryview():
+                buffer = memoryview(file).cast("B").toreadonly()
+            case _:
+                raise TypeError(
+                    f"Expected a path or a bytes-like object, got {type(file).__name__}"
+                )
+
+        try:
+            self.__parse(buffer)
+        except BaseException:
+            buffer.release()
+            self.close()
+            raise
+
+    def __parse(self, buffer: memoryview) -> None:
+        if len(buffer) < _HEADER.size:
+            raise ValueError(f"Expected at least {_HEADER.size} bytes, got {len(buffer)}")
+
+        magic, version, _, columns, frames, events, _ = _HEADER.unpack_from(buffer)
+        if magic != MOVIE_MAGIC:
+            raise ValueError(f"Expected a movie file, got one that starts with {magic!r}")
+
+        if version != MOVIE_VERSION:
+            raise ValueError(f"Expected movie version {MOVIE_VERSION}, got {version}")
+
+        stride = 1 + columns
+        frames_start = _HEADER.size + columns * _COLUMN.size
+        events_start = frames_start + frames * stride * _CELL
+        size = events_start + events * _EVENT.size
+        if len(buffer) < size:
+            raise ValueError(f"Expected a movie of at least {size} bytes, got {len(buffer)}")
+
+        self._buffer = buffer
+        self._columns = tuple(
+            MovieColumn(*_COLUMN.unpack_from(buffer, _HEADER.size + i * _COLUMN.size))
+            for i in range(columns)
+        )
+        self._frame_count = frames
+        self._stride = stride
+
+        records = buffer[frames_start:events_start]
+        if sys.byteorder == "little":
+            self._records = records.cast("h")
+        else:
+            self._records = array("h", records)
+            self._records.byteswap()
+
+        self._events = buffer[events_start:size]
+        self._event_count = events
+        self._event_frames = array(
+            "I", (_EVENT.unpack_from(self._events, i * _EVENT.size)[0] for i in range(events))
+        )
+
+    def close(self) -> None:
+        """
+        Releases the underlying file.
+        Views returned by ``record`` must not be used afterwards.
+        """
+        for name in ("_records", "_events", "_buffer"):
+            view = getattr(self, name, None)
+            if isinstance(view, memoryview):
+                view.release()
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._frame_count
+
+    @property
+    def frame_count(self) -> int:
+        return self._frame_count
+
+    @property
+    def columns(self) -> Sequence[MovieColumn]:
+        return self._columns
+
+    @property
+    def stride(self) -> int:
+        """
+        The number of values in each frame record, including the poll count.
+        """
+        return self._stride
+
+    @property
+    def records(self) -> Sequence[int]:
+        """
+        Every frame record, concatenated.
+        Frame ``f``'s poll count is at ``f * stride``,
+        and its value for column ``c`` is at ``f * stride + 1 + c``.
+        """
+        return self._records
+
+    def record(self, frame: int) -> Sequence[int]:
+        """
+        :return: The values of ``frame``'s record, one per column, without the poll count.
+        :raises IndexError: If ``frame`` is out of range.
+        """
+        if not (0 <= frame < self._frame_count):
+            raise IndexError(f"Expected a frame in [0, {self._frame_count}), got {frame}")
+
+        start = frame * self._stride
+        return self._records[start + 1 : start + self._stride]
+
+    def polls(self, frame: int) -> int:
+        """
+        :return: How many times the core polled input during ``frame``.
+        :raises IndexError: If ``frame`` is out of range.
+        """
+        if not (0 <= frame < self._frame_count):
+            raise IndexError(f"Expected a frame in [0, {self._frame_count}), got {frame}")
+
+        return self._records[frame * self._stride]
+
+    @property
+    def event_count(self) -> int:
+        return self._event_count
+
+    def event(self, i: int) -> KeyboardEvent:
+        """
+        :return: The ``i``-th keyboard event in the movie.
+        :raises IndexError: If ``i`` is out of range.
+        """
+        if not (0 <= i < self._event_count):
+            raise IndexError(f"Expected an event in [0, {self._event_count}), got {i}")
+
+        frame, keycode, modifiers, character, down = _EVENT.unpack_from(
+            self._events, i * _EVENT.size
+        )
+        return KeyboardEvent(frame, down, Key(keycode), character, KeyModifier(modifiers))
+
+    def first_event(self, frame: int) -> int:
+        """
+        :return: The index of the first keyboard event sent during or after ``frame``.
+        """
+        return bisect_left(self._event_frames, frame)
+
+    def events(self, frame: int) -> Sequence[KeyboardEvent]:
+        """
+        :return: The keyboard events sent during ``frame``.
+        """
+        start = self.first_event(frame)
+        end = bisect_left(self._event_frames, frame + 1, start)
+        return tuple(self.event(i) for i in range(start, end))
+
+
+def write_movie(
+    file: str | PathLike | BinaryIO,
+    columns: Sequence[MovieColumn],
+    records: Sequence[Sequence[int]],
+    events: Sequence[KeyboardEvent] = (),
+) -> None:
+    """
+    Writes a movie file.
+
+    :param file: The path or binary file to write to.
+    :param columns: The queries that each record's values correspond to.
+    :param records: One sequence per frame, starting with the number of polls
+        and followed by at most one value per column;
+        missing values are written as 0, and all values are truncated to 16 bits.
+    :param events: Keyboard events, sorted by frame.
+    :raises ValueError: If a record has more values than there are columns.
+    """
+    stride = 1 + len(columns)
+    body = array("h")
+    for record in records:
+        if len(record) > stride:
+            raise ValueError(f"Expected at most {stride} values per record, got {len(record)}")
+
+        body.extend(_int16(v) for v in record)
+        body.extend(0 for _ in range(stride - len(record)))
+
+    if sys.byteorder != "little":
+        body.byteswap()
+
+    def _write(f: BinaryIO) -> None:
+        f.write(
+            _HEADER.pack(MOVIE_MAGIC, MOVIE_VERSION, 0, len(columns), len(records), len(events), 0)
+        )
+        for c in columns:
+            f.write(_COLUMN.pack(*c))
+
+        f.write(body.tobytes())
+        for e in events:
+            f.write(_EVENT.pack(e.frame, e.keycode, e.modifiers, e.character, e.down))
+
+    match file:
+        case str() | PathLike():
+            with open(file, "wb") as f:
+                _write(f)
+        case _ if hasattr(file, "write"):
+            _write(file)
+        case _:
+            raise TypeError(f"Expected a binary file or a path, got {type(file).__name__}")
+
+
+class _InputDriverWrapper(InputDriver):
+    """
+    Forwards everything except polling and input state to another input driver.
+    """
+
+    def __init__(self, driver: InputDriver):
+        if not isinstance(driver, InputDriver):
+            raise TypeError(f"Expected an InputDriver, got {type(driver).__name__}")
+
+        self._driver = driver
+
+    @property
+    def driver(self) -> InputDriver:
+        return self._driver
+
+    @property
+    @override
+    def descriptors(self) -> Sequence[retro_input_descriptor] | None:
+        return self._driver.descriptors
+
+    @descriptors.setter
+    @override
+    def descriptors(self, descriptors: Sequence[retro_input_descriptor]) -> None:
+        self._driver.descriptors = descriptors
+
+    @property
+    @override
+    def keyboard_callback(self) -> retro_keyboard_callback | None:
+        return self._driver.keyboard_callback
+
+    @keyboard_callback.setter
+    @override
+    def keyboard_callback(self, callback: retro_keyboard_callback) -> None:
+        self._driver.keyboard_callback = callback
+
+    @property
+    @override
+    def rumble(self) -> RumbleInterface | None:
+        return self._driver.rumble
+
+    @property
+    @override
+    def sensor(self) -> SensorInterface | None:
+        return self._driver.sensor
+
+    @property
+    @override
+    def device_capabilities(self) -> InputDeviceFlag | None:
+        return self._driver.device_capabilities
+
+    @device_capabilities.setter
+    @override
+    def device_capabilities(self, capabilities: InputDeviceFlag) -> None:
+        self._driver.device_capabilities = capabilities
+
+    @device_capabilities.deleter
+    @override
+    def device_capabilities(self) -> None:
+        del self._driver.device_capabilities
+
+    @property
+    @override
+    def controller_info(self) -> Sequence[retro_controller_description] | None:
+        return self._driver.controller_info
+
+    @controller_info.setter
+    @override
+    def controller_info(self, info: Sequence[retro_controller_description]) -> None:
+        self._driver.controller_info = info
+
+    @property
+    @override
+    def bitmasks_supported(self) -> bool | None:
+        return self._driver.bitmasks_supported
+
+    @bitmasks_supported.setter
+    @override
+    def bitmasks_supported(self, bitmask_supported: bool) -> None:
+        self._driver.bitmasks_supported = bitmask_supported
+
+    @bitmasks_supported.deleter
+    @override
+    def bitmasks_supported(self) -> None:
+        del self._driver.bitmasks_supported
+
+    @property
+    @override
+    def max_users(self) -> int | None:
+        return self._driver.max_users
+
+    @max_users.setter
+    @override
+    def max_users(self, max_users: int) -> None:
+        self._driver.max_users = max_users
+
+    @max_users.deleter
+    @override
+    def max_users(self) -> None:
+        del self._driver.max_users
+
+
+@final
+class InputMovieRecorder(_InputDriverWrapper):
+    """
+    An input driver that passes everything through to another input driver
+    while recording every value it returns to the core, every poll, and every keyboard event.
+
+    ``end_frame`` must be called after each frame;
+    ``Session`` does this automatically if this is its input driver.
+    """
+
+    def __init__(self, driver: InputDriver):
+        """
+        :param driver: The input driver whose answers will be recorded.
+        :raises TypeError: If ``driver`` is not an ``InputDriver``.
+        """
+        super().__init__(driver)
+        self._columns: dict[tuple[int, int, int, int], int] = {}
+        self._row = array("h", [0])
+        self._records: list[array] = []
+        self._events: list[KeyboardEvent] = []
+
+    @property
+    def frame(self) -> int:
+        """
+        The number of frames recorded so far, which is also the index of the current frame.
+        """
+        return len(self._records)
+
+    @property
+    def columns(self) -> Sequence[MovieColumn]:
+        return tuple(MovieColumn(*c) for c in self._columns)
+
+    @override
+    def poll(self) -> None:
+        self._row[0] += 1
+        self._driver.poll()
+
+    @override
+    def state(self, port: Port, device: InputDevice, index: int, id: int) -> int:
+        value = self._driver.state(port, device, index, id)
+        key = (port, device, index, id)
+        column = self._columns.get(key)
+        if column is None:
+            column = self._columns[key] = len(self._columns)
+            self._row.append(0)
+
+        self._row[1 + column] = _int16(value)
+        return value
+
+    @override
+    def keyboard_event(
+        self, down: bool, keycode: Key, character: int, modifiers: KeyModifier
+    ) -> None:
+        self._events.append(
+            KeyboardEvent(len(self._records), bool(down), keycode, character, modifiers)
+        )
+        self._driver.keyboard_event(down, keycode, character, modifiers)
+
+    def end_frame(self) -> None:
+        """
+        Finishes recording the current frame.
+        """
+        self._records.append(self._row)
+        self._row = array("h", bytes(len(self._row) * _CELL))
+
+    def truncate(self, frame: int) -> None:
+        """
+        Discards every frame (and keyboard event) from ``frame`` onward,
+        so that recording continues from there.
+        ``Session.rewind`` calls this with the frame it rewound to.
+
+        :raises ValueError: If ``frame`` is negative.
+        """
+        if frame < 0:
+            raise ValueError(f"Expected a non-negative frame, got {frame}")
+
+        del self._records[frame:]
+        self._events = [e for e in self._events if e.frame < frame]
+        self._row = array("h", bytes(len(self._row) * _CELL))
+
+    def save(self, file: str | PathLike | BinaryIO) -> None:
+        """
+        Writes every completed frame to a movie file.
+        """
+        write_movie(file, self.columns, self._records, self._events)
+
+
+@final
+class InputMoviePlayer(_InputDriverWrapper):
+    """
+    An input driver that replays a movie,
+    returning the recorded value of each ``input_state`` query
+    and sending the recorded keyboard events to the core
+    when it first polls input during the frame they were recorded in.
+
+    Looking up a value doesn't allocate anything,
+    as the player indexes the movie's memory-mapped records directly.
+    Queries that weren't recorded, and queries made after the movie ends, return 0.
+
+    ``end_frame`` must be called after each frame;
+    ``Session`` does this automatically if this is its input driver.
+    """
+
+    def __init__(self, movie: InputMovie | str | PathLike, driver: InputDriver | None = None):
+        """
+        :param movie: The movie to replay, or a path to one.
+        :param driver: The input driver that provides everything besides the recorded input,
+            such as descriptors and rumble.
+            Its ``poll`` and ``state`` methods aren't called.
+            Defaults to a new ``GeneratorInputDriver``.
+        :raises TypeError: If ``movie`` or ``driver`` is not one of the documented types.
+        """
+        super().__init__(driver if driver is not None else GeneratorInputDriver())
+        match movie:
+            case InputMovie():
+                self._movie = movie
+            case str() | PathLike():
+                self._movie = InputMovie(movie)
+            case _:
+                raise TypeError(f"Expected an InputMovie or a path, got {type(movie).__name__}")
+
+        ports = 1 + max((c.port for c in self._movie.columns), default=-1)
+        self._lookup = array("i", [-1]) * (ports * _PORT_SIZE)
+        self._overflow: dict[tuple[int, int, int, int], int] = {}
+        for column, (port, device, index, id) in enumerate(self._movie.columns):
+            if device < _DEVICES and index < _INDEXES and id < _IDS:
+                self._lookup[((port * _DEVICES + device) * _INDEXES + index) * _IDS + id] = column
+            else:
+                self._overflow[(port, device, index, id)] = column
+
+        self._records = self._movie.records
+        self._stride = self._movie.stride
+        self._end = self._movie.frame_count * self._stride
+        self._desync_frame: int | None = None
+        self.seek(0)
+
+    @property
+    def movie(self) -> InputMovie:
+        return self._movie
+
+    @property
+    def frame(self) -> int:
+        """
+        The index of the frame currently being replayed.
+        """
+        return self._frame
+
+    @property
+    def finished(self) -> bool:
+        """
+        ``True`` once every frame in the movie has been replayed.
+        """
+        return self._frame >= self._movie.frame_count
+
+    @property
+    def desync_frame(self) -> int | None:
+        """
+        The first frame during which the core polled input a different number of times
+        than it did while recording, or ``None`` if every frame so far matched.
+        A mismatch usually means that the replay has desynchronized.
+        """
+        return self._desync_frame
+
+    def seek(self, frame: int) -> None:
+        """
+        Continues the replay from ``frame``.
+
+        Call this after loading a savestate
+        with the index of the frame the savestate was taken before.
+        ``Session.rewind`` calls this with the frame it rewound to.
+        A ``desync_frame`` before ``frame`` is kept.
+
+        :raises ValueError: If ``frame`` is negative.
+        """
+        if frame < 0:
+            raise ValueError(f"Expected a non-negative frame, got {frame}")
+
+        self._frame = frame
+        self._base = frame * self._stride
+        self._polls = 0
+        self._next_event = self._movie.first_event(frame)
+        if self._desync_frame is not None and self._desync_frame >= frame:
+            self._desync_frame = None
+
+    @override
+    def poll(self) -> None:
+        self._polls += 1
+        if self._polls == 1:
+            movie = self._movie
+            while (
+                self._next_event < movie.event_count
+                and movie._event_frames[self._next_event] == self._frame
+            ):
+                event = movie.event(self._next_event)
+                self._next_event += 1
+                self._driver.keyboard_event(
+                    event.down, event.keycode, event.character, event.modifiers
+                )
+
+    @override
+    def state(self, port: Port, device: InputDevice, index: int, id: int) -> int:
+        if self._base >= self._end:
+            return 0
+
+        if 0 <= device < _DEVICES and 0 <= index < _INDEXES and 0 <= id < _IDS:
+            i = ((port * _DEVICES + device) * _INDEXES + index) * _IDS + id
+            column = self._lookup[i] if 0 <= i < len(self._lookup) else -1
+        else:
+            column = self._overflow.get((port, device, index, id), -1)
+
+        if column < 0:
+            return 0
+
+        return self._records[self._base + 1 + column]
+
+    def end_frame(self) -> None:
+        """
+        Advances the replay to the next frame.
+        """
+        if (
+            self._desync_frame is None
+            and self._base < self._end
+            and self._polls != self._records[self._base]
+        ):
+            self._desync_frame = self._frame
+
+        self._frame += 1
+        self._base += self._stride
+        self._polls = 0
+
+
+__all__ = [
+    "MOVIE_MAGIC",
+    "MOVIE_VERSION",
+    "InputMovie",
+    "InputMoviePlayer",
+    "InputMovieRecorder",
+    "KeyboardEvent",
+    "MovieColumn",
+    "write_movie",
+]
@@ -37,11 +37,13 @@ from libretro.api.video import (
     MemoryAccess,
     PixelFormat,
     Rotation,
+    flip_vertical,
     retro_framebuffer,
     retro_hw_get_current_framebuffer_t,
     retro_hw_get_proc_address_t,
     retro_hw_render_callback,
     retro_hw_render_interface,
+    rotate_rgba,
 )
 
 from ..driver import FrameBufferSpecial, Screenshot, VideoDriver
@@ -554,19 +556,17 @@ class ModernGlVideoDriver(VideoDriver):
 
         if not self._callback or not self._callback.bottom_left_origin:
             # If we're using software rendering or the origin is at the bottom-left...
-            bytes_per_row = self._last_width * self._pixel_format.bytes_per_pixel
-            reversed_frame = array("B", frame)
-            reversed_frame_view = memoryview(reversed_frame)
-            frame_view = memoryview(frame)
-            frame_len = len(frame)
-            for i in range(self._last_height):
-                # For each row...
-                start = i * bytes_per_row
-                end = start + bytes_per_row
-                reversed_frame_view[start:end] = frame_view[frame_len - end : frame_len - start]
-                # ...copy row number (height - i) to row i
-
-            frame = reversed_frame_view
+            frame = flip_vertical(frame, self._last_width, self._last_height, 4)
+
+        if prerotate and self._rotation != Rotation.NONE:
+            rotated = rotate_rgba(frame, self._last_width, self._last_height, self._rotation)
+            return Screenshot(
+                rotated.data,
+                rotated.width,
+                rotated.height,
+                self._rotation,
+                self._pixel_format,
+            )
 
         return Screenshot(
             memoryview(frame),
@@ -1,21 +1,59 @@
-import itertools
-from array import array
 from copy import deepcopy
+from enum import Enum, auto
 from typing import final
 from warnings import warn
 
 from libretro._typing import override
 from libretro.api.av import retro_game_geometry, retro_system_av_info
-from libretro.api.video import MemoryAccess, PixelFormat, Rotation, retro_framebuffer
+from libretro.api.video import (
+    MemoryAccess,
+    PixelFormat,
+    Rotation,
+    convert_to_rgba,
+    retro_framebuffer,
+)
 
 from ..driver import FrameBufferSpecial, Screenshot
 from .base import SoftwareVideoDriver
 
 
+class FrameRetention(Enum):
+    """
+    How an ``ArrayVideoDriver`` holds on to the frames that the core gives it.
+    """
+
+    COPY = auto()
+    """
+    Copy each frame into a single preallocated buffer.
+    """
+
+    DOUBLE_BUFFER = auto()
+    """
+    Copy each frame into the back of two preallocated buffers, then swap them.
+    The buffer holding the previous frame is left untouched until the next refresh.
+    """
+
+    BORROW = auto()
+    """
+    Keep the ``memoryview`` that the core passed to ``refresh`` without copying it,
+    and only copy the frame when ``screenshot()`` is called.
+
+    The core must not free or overwrite the frame until then;
+    most cores render to a static buffer that's only touched during ``retro_run``,
+    so calling ``screenshot()`` between frames is usually safe.
+    """
+
+
 @final
 class ArrayVideoDriver(SoftwareVideoDriver):
-    def __init__(self):
-        self._frame: array | None = None
+    def __init__(self, retention: FrameRetention = FrameRetention.COPY):
+        if not isinstance(retention, FrameRetention):
+            raise TypeError(f"Expected a FrameRetention, got {type(retention).__name__}")
+
+        self._retention = retention
+        self._buffers: list[bytearray] | None = None
+        self._front = 0
+        self._borrowed: memoryview | None = None
         self._pixel_format: PixelFormat = PixelFormat.RGB1555
         self._system_av_info: retro_system_av_info | None = None
         self._rotation: Rotation = Rotation.NONE
@@ -23,17 +61,30 @@ class ArrayVideoDriver(SoftwareVideoDriver):
         self._last_height: int | None = None
         self._last_pitch: int | None = None
 
+    @property
+    def retention(self) -> FrameRetention:
+        return self._retention
+
+    def _store(self, data: memoryview) -> None:
+        length = len(data)
+        if length > len(self._buffers[self._front]):
+            # Only reallocate the buffer being written;
+            # the other one (if any) still holds the previous frame
+            self._buffers[self._front] = bytearray(length)
+
+        self._buffers[self._front][:length] = data
+
     @override
     def refresh(
         self, data: memoryview | FrameBufferSpecial, width: int, height: int, pitch: int
     ) -> None:
         match data:
+            case memoryview() if self._retention == FrameRetention.BORROW:
+                self._borrowed = data
             case memoryview():
-                if len(data) > len(self._frame):
-                    # Reallocate frame buffer
-                    self._frame = array("B", itertools.repeat(0, len(data)))
-                frameview = memoryview(self._frame)
-                frameview[: len(data)] = data
+                if self._retention == FrameRetention.DOUBLE_BUFFER:
+                    self._front ^= 1
+                self._store(data)
 
             case FrameBufferSpecial.DUPE:
                 pass  # Do nothing
@@ -53,13 +104,16 @@ class ArrayVideoDriver(SoftwareVideoDriver):
     @override
     @property
     def needs_reinit(self) -> bool:
-        return self._frame is None
+        return self._buffers is None
 
     @override
     def reinit(self) -> None:
         geometry = self._system_av_info.geometry
         bufsize = geometry.max_width * geometry.max_height * self._pixel_format.bytes_per_pixel
-        self._frame = array("B", itertools.repeat(0, bufsize))
+        count = 2 if self._retention == FrameRetention.DOUBLE_BUFFER else 1
+        self._buffers = [bytearray(bufsize) for _ in range(count)]
+        self._front = 0
+        self._borrowed = None
 
     @property
     @override
@@ -93,103 +147,36 @@ class ArrayVideoDriver(SoftwareVideoDriver):
 
         if self._pixel_format != format:
             # If the pixel format has changed, recreate the frame buffer
-            self._frame = None
+            self._buffers = None
+            self._borrowed = None
 
         self._pixel_format = format
 
     @override
     def screenshot(self, prerotate: bool = True) -> Screenshot | None:
-        if not self._frame:
+        if not self._buffers or self._last_pitch is None:
             return None
 
-        last_frame_length = self._last_pitch * self._last_height
-        screen = self._frame[:last_frame_length]
-        screen_out = bytearray(self._last_width * self._last_height * 4)
-        pixel_buf = array("B", (0, 0, 0, 255))
+        if self._borrowed is not None:
+            # Copy the borrowed frame now, in case the core reuses its memory later
+            self._store(self._borrowed)
+            self._borrowed = None
 
         rot = self._rotation if prerotate else Rotation.NONE
-
-        # Select rotation coefficients
-        # NOTE: output buffer is assumed to be four bytes per pixel (ABGR)
-        match rot:
-            case Rotation.NONE:
-                start_y = 0
-                delta_x = 4
-                delta_y = self._last_width * 4
-                is_sideways = False
-            case Rotation.NINETY:
-                start_y = (self._last_width - 4) * self._last_height * 4
-                delta_x = self._last_height * -4
-                delta_y = 4
-                is_sideways = True
-            case Rotation.ONE_EIGHTY:
-                start_y = self._last_width * self._last_height * 4 - 4
-                delta_x = -4
-                delta_y = self._last_width * -4
-                is_sideways = False
-            case Rotation.TWO_SEVENTY:
-                start_y = self._last_height * 4 - 4
-                delta_x = self._last_height * 4
-                delta_y = -4
-                is_sideways = True
-
-        # Copy from input buffer to output buffer, converting the pixel format
-        #   and taking into account rotation (if prerotate is True).
-        if self._pixel_format == PixelFormat.XRGB8888:
-            for y in range(self._last_height):
-                i = y * self._last_pitch
-                o = start_y + y * delta_y
-                for x in range(self._last_width):
-                    next_i = i + 3
-                    pixel_buf[2::-1] = screen[i:next_i]
-                    screen_out[o : o + 4] = pixel_buf
-                    i = next_i + 1
-                    o += delta_x
-        elif self._pixel_format == PixelFormat.RGB565:
-            for y in range(self._last_height):
-                i = y * self._last_pitch
-                o = start_y + y * delta_y
-                for x in range(self._last_width):
-                    next_i = i + 2
-                    b, r = screen[i:next_i]
-                    g = ((b & 0xE0) >> 3) | ((r & 0x07) << 5)
-                    b = (b & 0x1F) << 3
-                    pixel_buf[0] = (r & 0xF8) | (r >> 5)
-                    pixel_buf[1] = g | (g >> 6)
-                    pixel_buf[2] = b | (b >> 5)
-                    screen_out[o : o + 4] = pixel_buf
-                    i = next_i
-                    o += delta_x
-        elif self._pixel_format == PixelFormat.RGB1555:
-            for y in range(self._last_height):
-                i = y * self._last_pitch
-                o = start_y + y * delta_y
-                for x in range(self._last_width):
-                    next_i = i + 2
-                    b, g = screen[i:next_i]
-                    r = (g & 0x7C) << 1
-                    g = ((b & 0xE0) >> 2) | ((g & 0x03) << 6)
-                    b = (b & 0x1F) << 3
-                    pixel_buf[0] = r | (r >> 5)
-                    pixel_buf[1] = g | (g >> 5)
-                    pixel_buf[2] = b | (b >> 5)
-                    screen_out[o : o + 4] = pixel_buf
-                    i = next_i
-                    o += delta_x
-
-        # Swap width and height if buffer is rotated 90 or 270 degrees.
-        if is_sideways:
-            return Screenshot(
-                memoryview(screen_out),
-                self._last_height,
-                self._last_width,
-                self._rotation,
-                self._pixel_format,
-            )
-        return Screenshot(
-            memoryview(screen_out),
+        frame = convert_to_rgba(
+            memoryview(self._buffers[self._front]),
             self._last_width,
             self._last_height,
+            self._last_pitch,
+            self._pixel_format,
+            rot,
+        )
+
+        # Width and height are already swapped if the frame was rotated 90 or 270 degrees.
+        return Screenshot(
+            frame.data,
+            frame.width,
+            frame.height,
             self._rotation,
             self._pixel_format,
         )
@@ -232,4 +219,4 @@ class ArrayVideoDriver(SoftwareVideoDriver):
         self._system_av_info.geometry.aspect_ratio = geometry.aspect_ratio
 
 
-__all__ = ["ArrayVideoDriver"]
+__all__ = ["ArrayVideoDriver", "FrameRetention"]
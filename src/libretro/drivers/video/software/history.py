@@ -0,0 +1,291 @@
+from array import array
+from collections import deque
+from collections.abc import Iterable, Sequence
+from typing import NamedTuple, final
+from zlib import crc32
+
+from libretro._typing import override
+from libretro.api.av import retro_game_geometry, retro_system_av_info
+from libretro.api.video import MemoryAccess, PixelFormat, Rotation, retro_framebuffer
+
+from ..driver import FrameBufferSpecial, Screenshot
+from .base import SoftwareVideoDriver
+
+
+class HistoryFrame(NamedTuple):
+    """
+    One frame recorded by a ``FrameHistoryVideoDriver``.
+    """
+
+    index: int
+    """The number of video refreshes that preceded this one."""
+
+    hash: int
+    """The CRC-32 of the frame's dimensions and visible pixels."""
+
+    width: int
+    height: int
+
+    slot: int | None
+    """
+    The ring buffer slot that holds this frame's pixels,
+    or ``None`` if the core hasn't rendered anything yet.
+    Duplicate frames share a slot with the frame they duplicate.
+    """
+
+    duplicate: bool
+    """``True`` if this frame is identical to the one before it."""
+
+
+def _hash_frame(data: memoryview, width: int, height: int) -> int:
+    return crc32(data, crc32(width.to_bytes(4, "little") + height.to_bytes(4, "little")))
+
+
+def first_mismatch(a: Iterable[int], b: Iterable[int]) -> int | None:
+    """
+    Compares two frame hash logs.
+
+    :return: The index of the first frame whose hashes differ,
+        the length of the shorter log if one is a prefix of the other,
+        or ``None`` if both logs are identical.
+    """
+    a = array("I", a)
+    b = array("I", b)
+    if a == b:
+        return None
+
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+
+    return min(len(a), len(b))
+
+
+@final
+class FrameHistoryVideoDriver(SoftwareVideoDriver):
+    """
+    A video driver that wraps another software video driver
+    and keeps the last several frames in a preallocated ring buffer.
+
+    Every refresh is hashed with CRC-32 and appended to a hash log that covers the whole session,
+    so two runs can be compared without converting or saving any pixels.
+    Frames identical to their predecessor (including ``FrameBufferSpecial.DUPE``)
+    refer to the previous frame's slot instead of taking a new one.
+    """
+
+    def __init__(self, driver: SoftwareVideoDriver, capacity: int):
+        """
+        :param driver: The video driver that frames are passed through to.
+        :param capacity: The number of frames to keep.
+        :raises TypeError: If ``driver`` is not a ``SoftwareVideoDriver``
+            or ``capacity`` is not an ``int``.
+        :raises ValueError: If ``capacity`` is less than 1.
+        """
+        if not isinstance(driver, SoftwareVideoDriver):
+            raise TypeError(f"Expected a SoftwareVideoDriver, got {type(driver).__name__}")
+
+        if not isinstance(capacity, int):
+            raise TypeError(f"Expected an int, got {type(capacity).__name__}")
+
+        if capacity < 1:
+            raise ValueError(f"Expected a capacity of at least 1, got {capacity}")
+
+        self._driver = driver
+        self._capacity = capacity
+        self._slots: list[bytearray] | None = None
+        self._lengths = [0] * capacity
+        self._next_slot = 0
+        self._history: deque[HistoryFrame] = deque(maxlen=capacity)
+        self._hashes = array("I")
+
+    @property
+    def driver(self) -> SoftwareVideoDriver:
+        return self._driver
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def history(self) -> Sequence[HistoryFrame]:
+        """
+        The most recent frames, oldest first.
+        """
+        return tuple(self._history)
+
+    @property
+    def hashes(self) -> array:
+        """
+        A copy of the hash of every frame since the driver was created or cleared, oldest first.
+        Suitable for saving with ``array.tofile`` and comparing with ``first_mismatch``.
+        """
+        return array("I", self._hashes)
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._hashes)
+
+    def frame_data(self, frame: HistoryFrame) -> memoryview | None:
+        """
+        Returns the tightly-packed pixels of a recorded frame,
+        in the pixel format that was active when it was recorded.
+
+        :return: A read-only view of the frame's pixels,
+            or ``None`` if the frame has no pixels or is no longer in the ring buffer.
+        """
+        if frame.slot is None or self._slots is None or frame not in self._history:
+            return None
+
+        return memoryview(self._slots[frame.slot])[: self._lengths[frame.slot]].toreadonly()
+
+    def clear(self) -> None:
+        """
+        Forgets all recorded frames and hashes.
+        """
+        self._history.clear()
+        self._hashes = array("I")
+        self._next_slot = 0
+
+    def _record(self, data: memoryview, width: int, height: int, pitch: int) -> None:
+        row_length = width * self._driver.pixel_format.bytes_per_pixel
+        length = row_length * height
+        slot_index = self._next_slot
+        slot = self._slots[slot_index]
+        if length > len(slot):
+            slot = self._slots[slot_index] = bytearray(length)
+
+        # Pack the visible rows; any padding between them isn't deterministic
+        if pitch == row_length:
+            slot[:length] = data[:length]
+        else:
+            for y in range(height):
+                slot[y * row_length : (y + 1) * row_length] = data[
+                    y * pitch : y * pitch + row_length
+                ]
+
+        packed = memoryview(slot)[:length]
+        digest = _hash_frame(packed, width, height)
+        previous = self._history[-1] if self._history else None
+        if (
+            previous is not None
+            and previous.slot is not None
+            and previous.hash == digest
+            and self._lengths[previous.slot] == length
+            and self._slots[previous.slot][:length] == packed
+        ):
+            self._append(digest, width, height, previous.slot, True)
+        else:
+            self._lengths[slot_index] = length
+            self._next_slot = (slot_index + 1) % self._capacity
+            self._append(digest, width, height, slot_index, False)
+
+    def _append(self, digest: int, width: int, height: int, slot: int | None, dupe: bool) -> None:
+        frame = HistoryFrame(len(self._hashes), digest, width, height, slot, dupe)
+        self._history.append(frame)
+        self._hashes.append(digest)
+
+    @override
+    def refresh(
+        self, data: memoryview | FrameBufferSpecial, width: int, height: int, pitch: int
+    ) -> None:
+        self._driver.refresh(data, width, height, pitch)
+
+        match data:
+            case memoryview():
+                if self._slots is None:
+                    self._allocate()
+                self._record(data, width, height, pitch)
+            case FrameBufferSpecial.DUPE if self._history:
+                previous = self._history[-1]
+                self._append(previous.hash, previous.width, previous.height, previous.slot, True)
+            case FrameBufferSpecial.DUPE:
+                self._append(_hash_frame(memoryview(b""), 0, 0), 0, 0, None, True)
+            case _:
+                pass  # The wrapped driver already complained about it
+
+    def _allocate(self) -> None:
+        size = 0
+        if av_info := self._driver.system_av_info:
+            geometry = av_info.geometry
+            size = geometry.max_width * geometry.max_height
+            size *= self._driver.pixel_format.bytes_per_pixel
+
+        self._slots = [bytearray(size) for _ in range(self._capacity)]
+        self._lengths = [0] * self._capacity
+        self._next_slot = 0
+        # Any recorded frames no longer have pixels to refer to
+        self._history = deque(
+            (f._replace(slot=None) for f in self._history), maxlen=self._capacity
+        )
+
+    @property
+    @override
+    def needs_reinit(self) -> bool:
+        return self._slots is None or self._driver.needs_reinit
+
+    @override
+    def reinit(self) -> None:
+        self._driver.reinit()
+        self._allocate()
+
+    @property
+    @override
+    def rotation(self) -> Rotation:
+        return self._driver.rotation
+
+    @rotation.setter
+    @override
+    def rotation(self, rotation: Rotation) -> None:
+        self._driver.rotation = rotation
+
+    @property
+    @override
+    def pixel_format(self) -> PixelFormat:
+        return self._driver.pixel_format
+
+    @pixel_format.setter
+    @override
+    def pixel_format(self, format: PixelFormat) -> None:
+        changed = self._driver.pixel_format != format
+        self._driver.pixel_format = format
+        if changed:
+            # Slot sizes depend on the pixel format
+            self._slots = None
+
+    @override
+    def screenshot(self, prerotate: bool = True) -> Screenshot | None:
+        return self._driver.screenshot(prerotate)
+
+    @override
+    def get_software_framebuffer(
+        self, width: int, height: int, flags: MemoryAccess
+    ) -> retro_framebuffer | None:
+        return self._driver.get_software_framebuffer(width, height, flags)
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return self._driver.system_av_info
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, av_info: retro_system_av_info) -> None:
+        self._driver.system_av_info = av_info
+        self._allocate()
+
+    @property
+    @override
+    def geometry(self) -> retro_game_geometry | None:
+        return self._driver.geometry
+
+    @geometry.setter
+    @override
+    def geometry(self, geometry: retro_game_geometry) -> None:
+        self._driver.geometry = geometry
+
+
+__all__ = [
+    "FrameHistoryVideoDriver",
+    "HistoryFrame",
+    "first_mismatch",
+]
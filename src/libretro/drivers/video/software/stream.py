@@ -0,0 +1,533 @@
+"""
+A video driver that streams raw frames to a file, pipe, or encoder process.
+"""
+
+import os
+import subprocess  # nosec B404
+from collections.abc import Callable, Sequence
+from copy import deepcopy
+from enum import Enum, auto
+from queue import Full, Queue
+from tempfile import TemporaryFile
+from threading import Lock, Thread
+from typing import BinaryIO, NamedTuple, final
+from warnings import warn
+
+from libretro._typing import override
+from libretro.api.av import retro_game_geometry, retro_system_av_info
+from libretro.api.video import (
+    MemoryAccess,
+    PixelFormat,
+    Rotation,
+    convert_to_rgba,
+    retro_framebuffer,
+)
+
+from ..driver import FrameBufferSpecial, Screenshot
+from .base import SoftwareVideoDriver
+
+
+class Backpressure(Enum):
+    """
+    What a ``StreamingVideoDriver`` does with a new frame
+    when the writer thread has fallen behind and its queue is full.
+    """
+
+    BLOCK = auto()
+    """
+    Wait for the writer thread to make room.
+    No frames are lost, but ``Session.run`` may stall.
+    """
+
+    DROP = auto()
+    """
+    Discard the frame, shortening the output stream.
+    """
+
+    SPILL = auto()
+    """
+    Append the frame to a temporary file,
+    which the writer thread will drain once it catches up.
+    No frames are lost and ``Session.run`` doesn't stall, but disk usage may grow.
+    """
+
+
+class VideoStreamInfo(NamedTuple):
+    """
+    Describes the raw video stream written by a ``StreamingVideoDriver``.
+    Frames are tightly packed, with no padding between rows.
+    """
+
+    width: int
+    height: int
+    pixel_format: PixelFormat
+    fps: float
+    rotation: Rotation
+    """The rotation requested by the core; frames are written without applying it."""
+
+    @property
+    def frame_size(self) -> int:
+        return self.width * self.height * self.pixel_format.bytes_per_pixel
+
+
+VideoStreamOutput = BinaryIO | subprocess.Popen
+VideoStreamFactory = Callable[[VideoStreamInfo], VideoStreamOutput]
+
+_FFMPEG_PIXEL_FORMATS = {
+    PixelFormat.RGB1555: "rgb555le",
+    PixelFormat.XRGB8888: "bgr0",
+    PixelFormat.RGB565: "rgb565le",
+}
+
+
+def ffmpeg_pixel_format(pixel_format: PixelFormat) -> str:
+    """
+    :return: The name that ffmpeg uses for ``pixel_format``'s memory layout.
+    :raises ValueError: If ``pixel_format`` is not a valid ``PixelFormat``.
+    """
+    if pixel_format not in _FFMPEG_PIXEL_FORMATS:
+        raise ValueError(f"Invalid pixel format: {pixel_format}")
+
+    return _FFMPEG_PIXEL_FORMATS[pixel_format]
+
+
+@final
+class FfmpegOutput:
+    """
+    A stream factory that launches ffmpeg and feeds it raw video through its standard input.
+    """
+
+    def __init__(
+        self,
+        output: str | os.PathLike,
+        *args: str,
+        executable: str | os.PathLike = "ffmpeg",
+        overwrite: bool = True,
+    ):
+        """
+        :param output: The file that ffmpeg should write to.
+        :param args: Extra output options for ffmpeg, such as ``"-c:v", "libx264"``.
+        :param executable: The ffmpeg executable to run.
+        :param overwrite: Whether ffmpeg may overwrite ``output`` if it exists.
+        """
+        self._output = os.fspath(output)
+        self._args = tuple(args)
+        self._executable = os.fspath(executable)
+        self._overwrite = overwrite
+
+    def command(self, info: VideoStreamInfo) -> Sequence[str]:
+        """
+        :return: The ffmpeg command line for a stream described by ``info``.
+        """
+        return (
+            self._executable,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-y" if self._overwrite else "-n",
+            "-f",
+            "rawvideo",
+            "-pixel_format",
+            ffmpeg_pixel_format(info.pixel_format),
+            "-video_size",
+            f"{info.width}x{info.height}",
+            "-framerate",
+            f"{info.fps:g}",
+            "-i",
+            "-",
+            *self._args,
+            self._output,
+        )
+
+    def __call__(self, info: VideoStreamInfo) -> subprocess.Popen:
+        # The arguments are passed straight to the executable (no shell),
+        # and the caller chose both the executable and the extra arguments
+        return subprocess.Popen(self.command(info), stdin=subprocess.PIPE)  # nosec B603
+
+
+_STOP = None
+
+
+@final
+class StreamingVideoDriver(SoftwareVideoDriver):
+    """
+    A software video driver that writes every frame to a stream
+    in the core's native pixel format, without converting it.
+
+    Frames are written by a background thread so that slow encoders or disks
+    don't stall the session; the ``backpressure`` policy decides what happens
+    when the thread can't keep up.
+
+    The output stream is opened when the core renders its first frame.
+    All frames in the stream have the same dimensions;
+    frames of other sizes are cropped or padded with black to fit.
+    Call ``close()`` when finished to flush the remaining frames.
+    """
+
+    def __init__(
+        self,
+        output: VideoStreamFactory | BinaryIO,
+        *,
+        queue_size: int = 8,
+        backpressure: Backpressure = Backpressure.BLOCK,
+        size: tuple[int, int] | None = None,
+    ):
+        """
+        :param output: A writable binary stream,
+            or a callable that accepts a ``VideoStreamInfo``
+            and returns a writable binary stream or a ``subprocess.Popen`` with a piped stdin
+            (such as an ``FfmpegOutput``).
+        :param queue_size: How many frames may be waiting for the writer thread.
+        :param backpressure: What to do when ``queue_size`` frames are already waiting.
+        :param size: The width and height of the output stream, in pixels.
+            If ``None``, the dimensions of the first frame are used.
+        :raises TypeError: If any parameter is not consistent with its documented types.
+        :raises ValueError: If ``queue_size`` is less than 1.
+        """
+        if not callable(output) and not hasattr(output, "write"):
+            raise TypeError(
+                f"Expected a writable stream or a stream factory, got {type(output).__name__}"
+            )
+
+        if not isinstance(backpressure, Backpressure):
+            raise TypeError(f"Expected a Backpressure, got {type(backpressure).__name__}")
+
+        if not isinstance(queue_size, int):
+            raise TypeError(f"Expected an int, got {type(queue_size).__name__}")
+
+        if queue_size < 1:
+            raise ValueError(f"Expected a queue size of at least 1, got {queue_size}")
+
+        self._output = output
+        self._backpressure = backpressure
+        self._size = size
+        self._queue: Queue[bytes | bytearray | None] = Queue(queue_size)
+        self._pixel_format: PixelFormat = PixelFormat.RGB1555
+        self._system_av_info: retro_system_av_info | None = None
+        self._rotation: Rotation = Rotation.NONE
+        self._info: VideoStreamInfo | None = None
+        self._stream: BinaryIO | None = None
+        self._process: subprocess.Popen | None = None
+        self._thread: Thread | None = None
+        self._error: BaseException | None = None
+        self._closed = False
+        self._last: bytes | bytearray | None = None
+        self._last_width: int | None = None
+        self._last_height: int | None = None
+        self._frames_written = 0
+        self._frames_dropped = 0
+        self._frames_spilled = 0
+        self._spill: BinaryIO | None = None
+        self._spill_lock = Lock()
+        self._spill_written = 0
+        self._spill_read = 0
+
+    @property
+    def info(self) -> VideoStreamInfo | None:
+        """
+        A description of the output stream, or ``None`` if it hasn't been opened yet.
+        """
+        return self._info
+
+    @property
+    def backpressure(self) -> Backpressure:
+        return self._backpressure
+
+    @property
+    def frames_written(self) -> int:
+        return self._frames_written
+
+    @property
+    def frames_dropped(self) -> int:
+        return self._frames_dropped
+
+    @property
+    def frames_spilled(self) -> int:
+        return self._frames_spilled
+
+    @property
+    def error(self) -> BaseException | None:
+        """
+        The exception that stopped the writer thread, if any.
+        """
+        return self._error
+
+    def _open(self, width: int, height: int) -> None:
+        if self._closed:
+            raise RuntimeError("Cannot write frames to a closed StreamingVideoDriver")
+
+        fps = self._system_av_info.timing.fps if self._system_av_info else 60.0
+        out_width, out_height = self._size or (width, height)
+        self._info = VideoStreamInfo(
+            out_width, out_height, self._pixel_format, fps, self._rotation
+        )
+
+        match self._output(self._info) if callable(self._output) else self._output:
+            case subprocess.Popen(stdin=None):
+                raise ValueError("The encoder process must be started with stdin=subprocess.PIPE")
+            case subprocess.Popen() as process:
+                self._process = process
+                self._stream = process.stdin
+            case stream:
+                self._stream = stream
+
+        self._thread = Thread(target=self._write_frames, name="StreamingVideoDriver", daemon=True)
+        self._thread.start()
+
+    def _write(self, frame: bytes | bytearray) -> None:
+        if self._error is not None:
+            return  # Keep draining the queue so that the session doesn't block
+
+        try:
+            self._stream.write(frame)
+            self._frames_written += 1
+        except BaseException as e:
+            self._error = e
+
+    def _drain_spill(self) -> None:
+        frame_size = self._info.frame_size
+        while True:
+            with self._spill_lock:
+                if self._spill_read == self._spill_written:
+                    # Caught up; new frames can go through the queue again
+                    self._spill.seek(0)
+                    self._spill.truncate()
+                    self._spill_read = self._spill_written = 0
+                    return
+
+                self._spill.seek(self._spill_read * frame_size)
+                frame = self._spill.read(frame_size)
+                self._spill_read += 1
+
+            self._write(frame)
+
+    def _write_frames(self) -> None:
+        while True:
+            frame = self._queue.get()
+            if frame is not _STOP:
+                self._write(frame)
+
+            if self._spill is not None and (frame is _STOP or self._queue.empty()):
+                self._drain_spill()
+
+            if frame is _STOP:
+                return
+
+    def _submit(self, frame: bytes | bytearray) -> None:
+        match self._backpressure:
+            case Backpressure.BLOCK:
+                self._queue.put(frame)
+            case Backpressure.DROP:
+                try:
+                    self._queue.put_nowait(frame)
+                except Full:
+                    self._frames_dropped += 1
+            case Backpressure.SPILL:
+                with self._spill_lock:
+                    if self._spill_written == self._spill_read:
+                        # Not spilling yet, so the queue still preserves the frame order
+                        try:
+                            self._queue.put_nowait(frame)
+                            return
+                        except Full:
+                            pass
+
+                    if self._spill is None:
+                        self._spill = TemporaryFile()
+
+                    self._spill.seek(self._spill_written * self._info.frame_size)
+                    self._spill.write(frame)
+                    self._spill_written += 1
+                    self._frames_spilled += 1
+
+    def _pack(self, data: memoryview, width: int, height: int, pitch: int) -> bytes | bytearray:
+        bpp = self._info.pixel_format.bytes_per_pixel
+        row_length = self._info.width * bpp
+        if width == self._info.width and height == self._info.height and pitch == row_length:
+            return bytes(data[: row_length * height])
+
+        frame = bytearray(self._info.frame_size)
+        copy_length = min(width, self._info.width) * bpp
+        for y in range(min(height, self._info.height)):
+            frame[y * row_length : y * row_length + copy_length] = data[
+                y * pitch : y * pitch + copy_length
+            ]
+
+        return frame
+
+    @override
+    def refresh(
+        self, data: memoryview | FrameBufferSpecial, width: int, height: int, pitch: int
+    ) -> None:
+        match data:
+            case memoryview():
+                if self._info is None:
+                    self._open(width, height)
+                frame = self._pack(data, width, height, pitch)
+                self._last = frame
+                self._last_width = min(width, self._info.width)
+                self._last_height = min(height, self._info.height)
+
+            case FrameBufferSpecial.DUPE:
+                if self._last is None:
+                    return  # Nothing to repeat yet
+                frame = self._last
+
+            case FrameBufferSpecial.HARDWARE:
+                warn("RETRO_HW_FRAME_BUFFER_VALID passed to software-only video refresh callback")
+                return
+
+            case _:
+                raise TypeError(
+                    f"Expected a memoryview or a FrameBufferSpecial, got {type(data).__name__}"
+                )
+
+        if self._error is None:
+            self._submit(frame)
+
+    def close(self) -> None:
+        """
+        Writes all pending frames, then closes the output stream
+        and waits for the encoder process (if any) to exit.
+
+        :raises RuntimeError: If the writer thread or the encoder process failed.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+
+        if self._spill is not None:
+            self._spill.close()
+
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except OSError as e:
+                self._error = self._error or e
+
+        if self._process is not None:
+            returncode = self._process.wait()
+            if returncode != 0 and self._error is None:
+                raise RuntimeError(f"Encoder process exited with status {returncode}")
+
+        if self._error is not None:
+            raise RuntimeError("Failed to write video stream") from self._error
+
+    @property
+    @override
+    def needs_reinit(self) -> bool:
+        return False
+
+    @override
+    def reinit(self) -> None:
+        pass  # The stream's dimensions are fixed once it's opened
+
+    @property
+    @override
+    def rotation(self) -> Rotation:
+        return self._rotation
+
+    @rotation.setter
+    @override
+    def rotation(self, rotation: Rotation) -> None:
+        if not isinstance(rotation, Rotation):
+            raise TypeError(f"Expected a Rotation, got {type(rotation).__name__}")
+
+        if rotation not in Rotation:
+            raise ValueError(f"Invalid rotation: {rotation}")
+
+        self._rotation = rotation
+
+    @property
+    @override
+    def pixel_format(self) -> PixelFormat:
+        return self._pixel_format
+
+    @pixel_format.setter
+    @override
+    def pixel_format(self, format: PixelFormat) -> None:
+        if format not in PixelFormat:
+            raise ValueError(f"Invalid pixel format: {format}")
+
+        if not isinstance(format, PixelFormat):
+            raise TypeError(f"Expected a PixelFormat, got {type(format).__name__}")
+
+        if self._info is not None and format != self._info.pixel_format:
+            raise RuntimeError("Cannot change the pixel format after the stream has started")
+
+        self._pixel_format = format
+
+    @override
+    def screenshot(self, prerotate: bool = True) -> Screenshot | None:
+        if self._last is None:
+            return None
+
+        rot = self._rotation if prerotate else Rotation.NONE
+        frame = convert_to_rgba(
+            self._last,
+            self._last_width,
+            self._last_height,
+            self._info.width * self._info.pixel_format.bytes_per_pixel,
+            self._info.pixel_format,
+            rot,
+        )
+
+        return Screenshot(
+            frame.data,
+            frame.width,
+            frame.height,
+            self._rotation,
+            self._info.pixel_format,
+        )
+
+    @override
+    def get_software_framebuffer(
+        self, width: int, height: int, flags: MemoryAccess
+    ) -> retro_framebuffer | None:
+        return None
+
+    @property
+    @override
+    def system_av_info(self) -> retro_system_av_info | None:
+        return deepcopy(self._system_av_info) if self._system_av_info else None
+
+    @system_av_info.setter
+    @override
+    def system_av_info(self, av_info: retro_system_av_info) -> None:
+        if not isinstance(av_info, retro_system_av_info):
+            raise TypeError(f"Expected a retro_system_av_info, got {type(av_info).__name__}")
+
+        self._system_av_info = deepcopy(av_info)
+
+    @property
+    @override
+    def geometry(self) -> retro_game_geometry | None:
+        if not self._system_av_info:
+            return None
+
+        return deepcopy(self._system_av_info.geometry)
+
+    @geometry.setter
+    @override
+    def geometry(self, geometry: retro_game_geometry) -> None:
+        if not isinstance(geometry, retro_game_geometry):
+            raise TypeError(f"Expected a retro_game_geometry, got {type(geometry).__name__}")
+
+        self._system_av_info.geometry.base_width = geometry.base_width
+        self._system_av_info.geometry.base_height = geometry.base_height
+        self._system_av_info.geometry.aspect_ratio = geometry.aspect_ratio
+
+
+__all__ = [
+    "Backpressure",
+    "FfmpegOutput",
+    "StreamingVideoDriver",
+    "VideoStreamFactory",
+    "VideoStreamInfo",
+    "VideoStreamOutput",
+    "ffmpeg_pixel_format",
+]
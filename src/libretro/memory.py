@@ -0,0 +1,607 @@
+"""
+Access to a core's memory through the emulated system's address space,
+as described by ``EnvironmentCall.SET_MEMORY_MAPS``.
+"""
+
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterable, Iterator, Sequence
+from typing import NamedTuple, final
+
+from libretro._typing import Buffer
+from libretro.api._utils import memoryview_at
+from libretro.api.memory import (
+    MemoryDescriptorFlag,
+    retro_memory_descriptor,
+    retro_memory_map,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_WORD = (1 << 64) - 1
+_MAX_PIECES = 1 << 12  # Per descriptor; descriptors that need more are translated on demand
+_TYPECODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def _add_bits_down(n: int) -> int:
+    n |= n >> 1
+    n |= n >> 2
+    n |= n >> 4
+    n |= n >> 8
+    n |= n >> 16
+    n |= n >> 32
+    return n
+
+
+def _highest_bit(n: int) -> int:
+    n = _add_bits_down(n)
+    return n ^ (n >> 1)
+
+
+def _inflate(address: int, mask: int) -> int:
+    while mask:
+        below = (mask - 1) & ~mask
+        address = ((address & ~below) << 1) | (address & below)
+        mask &= mask - 1
+
+    return address & _WORD
+
+
+def _reduce(address: int, mask: int) -> int:
+    while mask:
+        below = (mask - 1) & ~mask
+        address = (address & below) | ((address >> 1) & ~below)
+        mask = (mask & (mask - 1)) >> 1
+
+    return address
+
+
+class MemoryRegion(NamedTuple):
+    """
+    A memory descriptor after the defaults that libretro specifies have been filled in.
+    """
+
+    index: int
+    """The position of the descriptor in the memory map; earlier descriptors take precedence."""
+
+    start: int
+    select: int
+    disconnect: int
+
+    length: int
+    """The number of bytes in ``buffer``."""
+
+    flags: MemoryDescriptorFlag
+    addrspace: str | None
+
+    buffer: memoryview | None
+    """The descriptor's memory, or ``None`` if it has none."""
+
+    @property
+    def big_endian(self) -> bool:
+        return MemoryDescriptorFlag.BIGENDIAN in self.flags
+
+    @property
+    def align(self) -> int:
+        """
+        The alignment (in bytes) that the emulated system uses when accessing this memory.
+        """
+        return 1 << ((self.flags >> 16) & 3)
+
+    @property
+    def min_size(self) -> int:
+        """
+        The smallest unit (in bytes) that the emulated system accesses this memory in.
+        """
+        return 1 << ((self.flags >> 24) & 3)
+
+    def translate(self, address: int) -> int | None:
+        """
+        :return: The offset into ``buffer`` that ``address`` refers to,
+            or ``None`` if this region doesn't contain ``address``.
+        """
+        if (address & self.select) != self.start:
+            return None
+
+        offset = _reduce(address & ~self.select, self.disconnect)
+        while offset >= self.length:
+            # Mirrored; libretro clears the highest bits until the address fits
+            offset -= _highest_bit(offset)
+
+        return offset
+
+
+def _regions(descriptors: Sequence[retro_memory_descriptor]) -> tuple[list[MemoryRegion], int]:
+    # Fills in select, len, and disconnect like RetroArch does
+    top = 1
+    for desc in descriptors:
+        top |= desc.select if desc.select else desc.start + desc.len - 1
+
+    top = _add_bits_down(top)
+    regions = []
+    for i, desc in enumerate(descriptors):
+        select = desc.select
+        length = desc.len
+        disconnect = desc.disconnect
+        if not select:
+            if not length or length & (length - 1):
+                raise ValueError(
+                    f"Memory descriptor {i} has no select mask, "
+                    f"so its length must be a nonzero power of two (got {length:#x})"
+                )
+
+            select = top & ~_inflate(_add_bits_down(length - 1), disconnect)
+
+        if not length:
+            length = _add_bits_down(_reduce(top & ~select, disconnect)) + 1
+
+        if desc.start & ~select:
+            raise ValueError(
+                f"Memory descriptor {i} starts at {desc.start:#x}, "
+                f"outside its select mask {select:#x}"
+            )
+
+        while _reduce(top & ~select, disconnect) >> 1 > length - 1:
+            disconnect |= _highest_bit(top & ~select & ~disconnect)
+
+        mask = _add_bits_down(length - 1)
+        disconnect &= mask
+        while (~mask >> 1) & disconnect:
+            mask >>= 1
+            disconnect &= mask
+
+        addrspace = desc.addrspace.decode() if desc.addrspace else None
+        buffer = None
+        if desc.ptr:
+            # Not desc.buffer, since len may have been zero
+            readonly = bool(desc.flags & MemoryDescriptorFlag.CONST)
+            buffer = memoryview_at(desc.ptr + desc.offset, length, readonly=readonly)
+
+        regions.append(
+            MemoryRegion(
+                i,
+                desc.start,
+                select,
+                disconnect,
+                length,
+                MemoryDescriptorFlag(desc.flags),
+                addrspace,
+                buffer,
+            )
+        )
+
+    return regions, top
+
+
+def _pieces(region: MemoryRegion, top: int) -> list[tuple[int, int, int]] | None:
+    """
+    Splits the addresses that ``region`` contains into runs
+    that map to consecutive offsets in its buffer.
+
+    :return: ``(address, size, offset)`` for each run in ascending order,
+        or ``None`` if there are too many.
+    """
+    free = top & ~region.select
+    low = (free ^ (free + 1)) >> 1  # The free bits below the lowest selected bit
+    block = low.bit_length()
+    if region.disconnect:
+        block = min(block, (region.disconnect & -region.disconnect).bit_length() - 1)
+
+    high = free & ~((1 << block) - 1)
+    if 1 << high.bit_count() > _MAX_PIECES:
+        return None
+
+    pieces: list[tuple[int, int, int]] = []
+    pending = []
+    sub = 0
+    while True:
+        pending.append((region.start | sub, 1 << block))
+        while pending:
+            address, size = pending.pop()
+            first = region.translate(address)
+            if size == 1 or region.translate(address + size - 1) - first == size - 1:
+                previous = pieces[-1] if pieces else None
+                if (
+                    previous
+                    and previous[0] + previous[1] == address
+                    and previous[2] + previous[1] == first
+                ):
+                    pieces[-1] = (previous[0], previous[1] + size, previous[2])
+                else:
+                    pieces.append((address, size, first))
+
+                if len(pieces) > _MAX_PIECES:
+                    return None
+            else:
+                # Mirroring kicks in partway through; the upper half goes on the stack first
+                half = size // 2
+                pending.append((address + half, half))
+                pending.append((address, half))
+
+        sub = (sub - high) & high  # Next subset of the high free bits, in ascending order
+        if not sub:
+            return pieces
+
+
+@final
+class MemoryBus:
+    """
+    Reads and writes a core's memory by the addresses that the emulated system uses,
+    according to the memory map that the core provides with ``EnvironmentCall.SET_MEMORY_MAPS``.
+
+    The memory map's descriptors (including their ``select``, ``disconnect``, and ``len`` masks)
+    are compiled into a sorted index of address ranges,
+    each with a zero-copy ``memoryview`` of the memory it maps to,
+    so that most lookups are a single binary search.
+    Descriptors whose mirroring is too irregular to index are translated on demand.
+
+    Views share memory with the core, so they're only valid while the core is loaded.
+    """
+
+    def __init__(self, memory_map: retro_memory_map | Sequence[retro_memory_descriptor]):
+        """
+        :param memory_map: The memory map to compile.
+        :raises TypeError: If ``memory_map`` is not a ``retro_memory_map``
+            or a sequence of ``retro_memory_descriptor``.
+        :raises ValueError: If a descriptor is invalid.
+        """
+        match memory_map:
+            case retro_memory_map():
+                descriptors = [memory_map[i] for i in range(len(memory_map))]
+            case Sequence() if all(isinstance(d, retro_memory_descriptor) for d in memory_map):
+                descriptors = list(memory_map)
+            case _:
+                raise TypeError(
+                    "Expected a retro_memory_map or a sequence of retro_memory_descriptor, "
+                    f"got {type(memory_map).__name__}"
+                )
+
+        self._regions, self._top = _regions(descriptors)
+
+        # Parallel lists, sorted by start address; earlier descriptors win where ranges overlap
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._owners: list[int] = []
+        self._offsets: list[int] = []
+        self._complex = len(self._regions)  # Index of the first descriptor that isn't indexed
+        for region in self._regions:
+            pieces = _pieces(region, self._top)
+            if pieces is None:
+                self._complex = min(self._complex, region.index)
+                continue
+
+            for address, size, offset in pieces:
+                self.__insert(region.index, address, address + size, offset)
+
+        self._views = [
+            (None if self._regions[r].buffer is None else self._regions[r].buffer[o : o + (e - s)])
+            for s, e, r, o in zip(self._starts, self._ends, self._owners, self._offsets)
+        ]
+
+    def __insert(self, owner: int, start: int, end: int, offset: int) -> None:
+        # Only insert the parts of [start, end) that no earlier descriptor claims
+        starts = self._starts
+        ends = self._ends
+        i = bisect_right(starts, start) - 1
+        if i < 0 or ends[i] <= start:
+            i += 1
+
+        gaps = []
+        cursor = start
+        while cursor < end:
+            if i < len(starts) and starts[i] <= cursor:
+                cursor = max(cursor, ends[i])
+                i += 1
+            else:
+                gap_end = min(end, starts[i]) if i < len(starts) else end
+                gaps.append((cursor, gap_end))
+                cursor = gap_end
+
+        for gap_start, gap_end in gaps:
+            j = bisect_right(starts, gap_start)
+            starts.insert(j, gap_start)
+            ends.insert(j, gap_end)
+            self._owners.insert(j, owner)
+            self._offsets.insert(j, offset + gap_start - start)
+
+    @property
+    def regions(self) -> Sequence[MemoryRegion]:
+        return tuple(self._regions)
+
+    @property
+    def top(self) -> int:
+        """
+        The highest address in the emulated address space.
+        """
+        return self._top
+
+    @property
+    def ranges(self) -> Sequence[tuple[int, int, MemoryRegion]]:
+        """
+        The indexed address ranges as ``(start, end, region)`` tuples, in ascending order.
+        ``end`` is exclusive.
+        Addresses not listed here may still be mapped by descriptors that aren't indexed.
+        """
+        return tuple(
+            (s, e, self._regions[r]) for s, e, r in zip(self._starts, self._ends, self._owners)
+        )
+
+    def find(self, address: int) -> tuple[MemoryRegion, int] | None:
+        """
+        :return: The region that ``address`` belongs to and the offset into its buffer,
+            or ``None`` if ``address`` isn't mapped.
+        """
+        i = bisect_right(self._starts, address) - 1
+        if i >= 0 and address < self._ends[i] and self._owners[i] < self._complex:
+            return self._regions[self._owners[i]], self._offsets[i] + address - self._starts[i]
+
+        if self._complex == len(self._regions) or not 0 <= address <= self._top:
+            return None
+
+        # Some descriptor might shadow the index; fall back to checking them in order
+        for region in self._regions:
+            offset = region.translate(address)
+            if offset is not None:
+                return region, offset
+
+        return None
+
+    def _resolve(self, address: int, size: int) -> tuple[MemoryRegion, int]:
+        """
+        :return: The region and offset of ``size`` bytes at ``address``.
+        :raises IndexError: If the bytes aren't mapped to one contiguous piece of memory.
+        """
+        found = self.find(address)
+        if found is None:
+            raise IndexError(f"Address {address:#x} is not mapped")
+
+        region, offset = found
+        if region.buffer is None:
+            raise IndexError(f"Address {address:#x} has no backing memory")
+
+        for i in range(1, size):
+            if self.find(address + i) != (region, offset + i):
+                raise IndexError(f"Range {address:#x}+{size} isn't contiguous in memory")
+
+        return region, offset
+
+    def __locate(self, address: int, size: int) -> tuple[memoryview, int]:
+        # The view and offset that [address, address + size) lies within
+        i = bisect_right(self._starts, address) - 1
+        if i >= 0 and address + size <= self._ends[i] and self._owners[i] < self._complex:
+            view = self._views[i]
+            if view is None:
+                raise IndexError(f"Address {address:#x} has no backing memory")
+
+            return view, address - self._starts[i]
+
+        region, offset = self._resolve(address, size)
+        return region.buffer, offset
+
+    def view(self, address: int, size: int = 1) -> memoryview:
+        """
+        :return: A zero-copy view of ``size`` bytes starting at ``address``.
+        :raises IndexError: If the range isn't mapped to one contiguous piece of memory.
+        """
+        view, offset = self.__locate(address, size)
+        return view[offset : offset + size]
+
+    def read(self, address: int, size: int) -> bytes:
+        """
+        Copies ``size`` bytes starting at ``address``,
+        even if they span several regions.
+
+        :raises IndexError: If any byte in the range isn't mapped.
+        """
+        return b"".join(bytes(view) for view, _ in self.__chunks(address, size))
+
+    def write(self, address: int, data: Buffer) -> None:
+        """
+        Writes ``data`` starting at ``address``, even if it spans several regions.
+
+        :raises IndexError: If any byte in the range isn't mapped.
+        :raises TypeError: If the range includes read-only (``CONST``) memory.
+        """
+        with memoryview(data).cast("B") as source:
+            for view, position in self.__chunks(address, len(source)):
+                view[:] = source[position : position + len(view)]
+
+    def __chunks(self, address: int, size: int) -> Iterator[tuple[memoryview, int]]:
+        # The contiguous views that make up [address, address + size), and where each begins
+        position = 0
+        while position < size:
+            current = address + position
+            i = bisect_right(self._starts, current) - 1
+            if i >= 0 and current < self._ends[i] and self._owners[i] < self._complex:
+                view = self._views[i]
+                offset = current - self._starts[i]
+                n = min(size - position, self._ends[i] - current)
+                if view is None:
+                    raise IndexError(f"Address {current:#x} has no backing memory")
+            else:
+                region, offset = self._resolve(current, 1)
+                view = region.buffer
+                n = 1
+
+            yield view[offset : offset + n], position
+            position += n
+
+    def __getitem__(self, address: int) -> int:
+        view, offset = self.__locate(address, 1)
+        return view[offset]
+
+    def __setitem__(self, address: int, value: int) -> None:
+        view, offset = self.__locate(address, 1)
+        view[offset] = value
+
+    def __big_endian(self, address: int, big_endian: bool | None) -> bool:
+        if big_endian is not None:
+            return big_endian
+
+        found = self.find(address)
+        return found is not None and found[0].big_endian
+
+    def read_int(
+        self, address: int, size: int, *, signed: bool = False, big_endian: bool | None = None
+    ) -> int:
+        """
+        Reads an integer of ``size`` bytes at ``address``.
+
+        :param big_endian: The byte order to read in.
+            Defaults to the region's (see ``MemoryDescriptorFlag.BIGENDIAN``).
+        :raises IndexError: If the integer isn't mapped to one contiguous piece of memory.
+        """
+        view, offset = self.__locate(address, size)
+        order = "big" if self.__big_endian(address, big_endian) else "little"
+        return int.from_bytes(view[offset : offset + size], order, signed=signed)
+
+    def write_int(
+        self,
+        address: int,
+        size: int,
+        value: int,
+        *,
+        signed: bool = False,
+        big_endian: bool | None = None,
+    ) -> None:
+        """
+        Writes ``value`` as an integer of ``size`` bytes at ``address``.
+
+        :raises IndexError: If the integer isn't mapped to one contiguous piece of memory.
+        :raises OverflowError: If ``value`` doesn't fit in ``size`` bytes.
+        """
+        view, offset = self.__locate(address, size)
+        order = "big" if self.__big_endian(address, big_endian) else "little"
+        view[offset : offset + size] = value.to_bytes(size, order, signed=signed)
+
+    def read_u8(self, address: int) -> int:
+        return self[address]
+
+    def read_u16(self, address: int, *, big_endian: bool | None = None) -> int:
+        return self.read_int(address, 2, big_endian=big_endian)
+
+    def read_u32(self, address: int, *, big_endian: bool | None = None) -> int:
+        return self.read_int(address, 4, big_endian=big_endian)
+
+    def gatherer(
+        self, addresses: Iterable[int], size: int = 1, *, big_endian: bool | None = None
+    ) -> "MemoryGather":
+        """
+        Prepares to read the same set of addresses repeatedly (e.g. once per frame).
+        See ``MemoryGather``.
+        """
+        return MemoryGather(self, addresses, size, big_endian=big_endian)
+
+    def gather(
+        self, addresses: Iterable[int], size: int = 1, *, big_endian: bool | None = None
+    ) -> "numpy.ndarray | array":
+        """
+        Reads an unsigned integer of ``size`` bytes at each of ``addresses``.
+        Equivalent to ``self.gatherer(addresses, size, big_endian=big_endian)()``;
+        use ``gatherer`` to read the same addresses more than once.
+        """
+        return self.gatherer(addresses, size, big_endian=big_endian)()
+
+
+@final
+class MemoryGather:
+    """
+    Reads unsigned integers from a fixed set of addresses in a single call.
+
+    Addresses are translated once, when this object is created;
+    each call then only copies the values out of memory,
+    with one vectorized NumPy operation per region if NumPy is installed.
+    """
+
+    def __init__(
+        self,
+        bus: MemoryBus,
+        addresses: Iterable[int],
+        size: int = 1,
+        *,
+        big_endian: bool | None = None,
+    ):
+        """
+        :param bus: The memory bus to read from.
+        :param addresses: The addresses to read, in the order they should be returned.
+        :param size: The size of each integer in bytes; one of 1, 2, 4, or 8.
+        :param big_endian: The byte order of the integers.
+            Defaults to each region's own byte order.
+        :raises ValueError: If ``size`` is invalid.
+        :raises IndexError: If any of the integers isn't mapped to one contiguous piece of memory.
+        """
+        if size not in _TYPECODES:
+            raise ValueError(f"Expected a size of 1, 2, 4, or 8, got {size}")
+
+        self._addresses = array("Q", addresses)
+        self._size = size
+
+        # Group the addresses by the memory they're in
+        groups: dict[int, tuple[memoryview, bool, list[int], list[int]]] = {}
+        for position, address in enumerate(self._addresses):
+            region, offset = bus._resolve(address, size)
+            big = region.big_endian if big_endian is None else big_endian
+            key = (region.index, big)
+            if key not in groups:
+                groups[key] = (region.buffer, big, [], [])
+
+            groups[key][2].append(position)
+            groups[key][3].append(offset)
+
+        self._groups = []
+        for buffer, big, positions, offsets in groups.values():
+            if numpy is not None:
+                memory = numpy.frombuffer(buffer, dtype=numpy.uint8)
+                index = numpy.array(offsets, dtype=numpy.intp)
+                if size > 1:
+                    index = index[:, None] + numpy.arange(size)
+
+                dtype = numpy.dtype(f"{'>' if big else '<'}u{size}")
+                self._groups.append(
+                    (memory, index, dtype, numpy.array(positions, dtype=numpy.intp))
+                )
+            else:
+                self._groups.append((buffer, offsets, "big" if big else "little", positions))
+
+    @property
+    def addresses(self) -> array:
+        return self._addresses
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+    def __call__(self) -> "numpy.ndarray | array":
+        """
+        :return: The current value at each address, in the order they were given:
+            a NumPy array of unsigned integers if NumPy is installed,
+            or an ``array`` otherwise.
+        """
+        size = self._size
+        if numpy is not None:
+            out = numpy.empty(len(self._addresses), dtype=numpy.dtype(f"u{size}"))
+            for memory, index, dtype, positions in self._groups:
+                values = memory[index]
+                out[positions] = values.view(dtype).reshape(-1) if size > 1 else values
+
+            return out
+
+        out = array(_TYPECODES[size], bytes(size * len(self._addresses)))
+        for buffer, offsets, order, positions in self._groups:
+            for position, offset in zip(positions, offsets):
+                out[position] = int.from_bytes(buffer[offset : offset + size], order)
+
+        return out
+
+
+__all__ = [
+    "MemoryBus",
+    "MemoryGather",
+    "MemoryRegion",
+]
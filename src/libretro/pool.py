@@ -0,0 +1,438 @@
+"""
+Runs sessions in worker processes so that many copies of a core can run in parallel.
+
+A core's global state is shared by every ``Session`` in a process that loads it,
+so parallelism requires one process per session.
+"""
+
+import multiprocessing
+import os
+from array import array
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from contextlib import suppress
+from multiprocessing.connection import Connection, wait
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from types import TracebackType
+from typing import Any, NamedTuple, TypeVar, final
+
+from libretro.builder import SessionBuilder
+from libretro.drivers import (
+    FrameHistoryVideoDriver,
+    GeneratorInputDriver,
+    InputStateSource,
+    Screenshot,
+)
+from libretro.savestate import SavestateManager
+from libretro.session import RunSummary, Session
+
+T = TypeVar("T")
+
+SessionRecipe = Callable[[], SessionBuilder | Session]
+"""
+A picklable callable (such as a module-level function)
+that each worker process calls to create its session.
+"""
+
+Job = Callable[[Session], T]
+"""
+A picklable callable that a worker process calls with its session.
+Its return value is sent back to the parent process.
+"""
+
+
+class FrameJobResult(NamedTuple):
+    summary: RunSummary
+
+    hashes: array | None
+    """
+    The hash of each frame rendered during the job,
+    if requested and the session's video driver is a ``FrameHistoryVideoDriver``.
+    """
+
+    screenshot: Screenshot | None
+    """The last frame rendered during the job, if requested."""
+
+    memory: Mapping[int, bytes]
+    """The contents of each requested memory region at the end of the job."""
+
+    savestate: bytes | None
+    """The core's state at the end of the job, if requested."""
+
+
+class FrameJob(NamedTuple):
+    """
+    A job that runs a worker's session for a number of frames
+    and collects the results.
+    """
+
+    frames: int
+
+    inputs: InputStateSource | None = None
+    """
+    The input states to use, in the same forms accepted by ``GeneratorInputDriver``.
+    Must be picklable, so use a sequence or a module-level generator function.
+    If ``None``, the worker's input driver is left alone.
+    """
+
+    hashes: bool = True
+    screenshot: bool = False
+
+    memory: Sequence[int] = ()
+    """The IDs of the memory regions to return (see ``retro_get_memory_data``)."""
+
+    load_state: bytes | None = None
+    """A savestate to load before running any frames."""
+
+    save_state: bool = False
+
+    def __call__(self, session: Session) -> FrameJobResult:
+        if self.load_state is not None and not session.core.unserialize(self.load_state):
+            raise RuntimeError("Core failed to load the job's savestate")
+
+        if self.inputs is not None:
+            if not isinstance(session.input, GeneratorInputDriver):
+                raise TypeError(
+                    f"FrameJob.inputs requires a GeneratorInputDriver, got {type(session.input).__name__}"
+                )
+            session.input.input_generator = self.inputs
+
+        history = session.video if isinstance(session.video, FrameHistoryVideoDriver) else None
+        start = history.frame_count if history else 0
+        summary = session.run_frames(self.frames)
+
+        memory = {}
+        for id in self.memory:
+            region = session.core.get_memory(id)
+            memory[id] = bytes(region) if region is not None else b""
+
+        return FrameJobResult(
+            summary,
+            history.hashes[start:] if history and self.hashes else None,
+            session.video.screenshot() if self.screenshot else None,
+            memory,
+            bytes(SavestateManager(session.core).serialize()) if self.save_state else None,
+        )
+
+
+class _Shared(NamedTuple):
+    """
+    Stands in for a large buffer that was written to the worker's shared memory.
+    """
+
+    offset: int
+    length: int
+    kind: type
+    format: str
+
+
+def _find_buffers(value: Any, found: list) -> None:
+    match value:
+        case bytes() | bytearray() | memoryview() | array():
+            found.append(value)
+        case dict():
+            for v in value.values():
+                _find_buffers(v, found)
+        case tuple() | list():
+            for v in value:
+                _find_buffers(v, found)
+
+
+def _replace_buffers(value: Any, replace: Callable[[Any], Any]) -> Any:
+    match value:
+        case bytes() | bytearray() | memoryview() | array():
+            return replace(value)
+        case dict():
+            return {k: _replace_buffers(v, replace) for k, v in value.items()}
+        case tuple() if hasattr(value, "_fields"):
+            return value._make(_replace_buffers(v, replace) for v in value)
+        case tuple() | list():
+            return type(value)(_replace_buffers(v, replace) for v in value)
+        case _:
+            return value
+
+
+def _worker_main(recipe: SessionRecipe, conn: Connection, threshold: int) -> None:
+    arena: SharedMemory | None = None
+    try:
+        match recipe():
+            case SessionBuilder() as builder:
+                session = builder.build()
+            case Session() as session:
+                pass
+            case other:
+                raise TypeError(
+                    f"Expected a SessionBuilder or Session, got {type(other).__name__}"
+                )
+
+        with session:
+            conn.send(("ready", None))
+            while (job := conn.recv()) is not None:
+                try:
+                    result = job(session)
+                except BaseException as e:
+                    conn.send(("error", e))
+                    continue
+
+                buffers: list = []
+                _find_buffers(result, buffers)
+                large = [b for b in buffers if memoryview(b).nbytes >= threshold]
+                needed = sum(memoryview(b).nbytes for b in large)
+                if needed and (arena is None or arena.size < needed):
+                    # Ask the parent for a bigger arena, since the parent owns them
+                    conn.send(("grow", needed))
+                    if arena is not None:
+                        arena.close()
+                    arena = SharedMemory(conn.recv())
+
+                offset = 0
+                large_ids = {id(b) for b in large}
+
+                def _share(buffer):
+                    nonlocal offset
+                    if id(buffer) not in large_ids:
+                        # memoryviews can't be pickled
+                        return bytes(buffer) if isinstance(buffer, memoryview) else buffer
+
+                    view = memoryview(buffer)
+                    length = view.nbytes
+                    arena.buf[offset : offset + length] = view.cast("B")
+                    fmt = buffer.typecode if isinstance(buffer, array) else view.format
+                    shared = _Shared(offset, length, type(buffer), fmt)
+                    offset += length
+                    return shared
+
+                conn.send(("done", _replace_buffers(result, _share)))
+    except BaseException as e:
+        # The parent may already be gone, in which case there's no one to tell
+        with suppress(Exception):
+            conn.send(("error", e))
+    finally:
+        if arena is not None:
+            arena.close()
+        conn.close()
+
+
+def _unshare(value: Any, arena: SharedMemory | None) -> Any:
+    def _copy(shared: _Shared) -> Any:
+        data = arena.buf[shared.offset : shared.offset + shared.length]
+        if shared.kind is array:
+            result = array(shared.format)
+            result.frombytes(data)
+            return result
+        if shared.kind is memoryview:
+            return memoryview(bytes(data)).cast(shared.format)
+        return shared.kind(data)
+
+    match value:
+        case _Shared():
+            return _copy(value)
+        case dict():
+            return {k: _unshare(v, arena) for k, v in value.items()}
+        case tuple() if hasattr(value, "_fields"):
+            return value._make(_unshare(v, arena) for v in value)
+        case tuple() | list():
+            return type(value)(_unshare(v, arena) for v in value)
+        case _:
+            return value
+
+
+@final
+class _Worker:
+    def __init__(self, process: multiprocessing.Process, conn: Connection):
+        self.process = process
+        self.conn = conn
+        self.arena: SharedMemory | None = None
+        self.job: int | None = None
+
+    def receive(self) -> tuple[bool, Any]:
+        """
+        Handles messages from the worker until it finishes its job.
+
+        :return: Whether the job succeeded, and its result or exception.
+        """
+        while True:
+            try:
+                kind, payload = self.conn.recv()
+            except EOFError:
+                self.process.join(1)
+                raise RuntimeError(
+                    f"Worker process {self.process.pid} exited with code {self.process.exitcode}"
+                ) from None
+
+            match kind:
+                case "grow":
+                    if self.arena is not None:
+                        self.arena.close()
+                        self.arena.unlink()
+                    self.arena = SharedMemory(create=True, size=payload)
+                    self.conn.send(self.arena.name)
+                case "done":
+                    return True, _unshare(payload, self.arena)
+                case "ready":
+                    return True, None
+                case "error":
+                    return False, payload
+
+    def close(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+
+        self.process.join()
+        self.conn.close()
+        if self.arena is not None:
+            self.arena.close()
+            self.arena.unlink()
+            self.arena = None
+
+
+@final
+class SessionPool:
+    """
+    A pool of worker processes that each own one session.
+
+    Each worker builds its session once by calling ``recipe``,
+    then runs jobs on it until the pool is closed.
+    Sessions persist between jobs, so jobs that need a known starting point
+    should reset the core or load a savestate first (see ``FrameJob.load_state``).
+
+    Buffers in job results that are at least ``share_threshold`` bytes long
+    (e.g. screenshots, memory dumps, savestates)
+    are returned through shared memory instead of being pickled.
+    """
+
+    def __init__(
+        self,
+        recipe: SessionRecipe,
+        workers: int | None = None,
+        *,
+        share_threshold: int = 64 * 1024,
+        context: BaseContext | None = None,
+    ):
+        """
+        :param recipe: A picklable callable that returns a ``SessionBuilder`` or a ``Session``.
+        :param workers: The number of worker processes; defaults to the number of CPUs.
+        :param share_threshold: The smallest buffer (in bytes) to return through shared memory.
+        :param context: The ``multiprocessing`` context used to start workers;
+            defaults to the ``spawn`` context, which works on every platform.
+        :raises ValueError: If ``workers`` is less than 1.
+        :raises RuntimeError: If a worker fails to create or start its session.
+        """
+        if not callable(recipe):
+            raise TypeError(f"Expected a callable, got {type(recipe).__name__}")
+
+        workers = workers if workers is not None else os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"Expected at least 1 worker, got {workers}")
+
+        context = context or multiprocessing.get_context("spawn")
+        self._workers: list[_Worker] = []
+        self._closed = False
+        try:
+            for _ in range(workers):
+                parent, child = context.Pipe()
+                process = context.Process(
+                    target=_worker_main, args=(recipe, child, share_threshold), daemon=True
+                )
+                process.start()
+                child.close()
+                self._workers.append(_Worker(process, parent))
+
+            for worker in self._workers:
+                ok, error = worker.receive()
+                if not ok:
+                    raise RuntimeError("Worker failed to start its session") from error
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type: type[Exception], exc_val: Exception, exc_tb: TracebackType):
+        self.close()
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    def imap_unordered(self, jobs: Iterable[Job[T]]) -> Iterator[tuple[int, T]]:
+        """
+        Runs each job on the first idle worker.
+
+        :return: An iterator of ``(index, result)`` pairs in the order the jobs finish,
+            where ``index`` is the job's position in ``jobs``.
+        :raises Exception: Whatever a job raised, once its result is reached.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot run jobs on a closed SessionPool")
+
+        pending = enumerate(jobs)
+        idle = list(self._workers)
+        busy: dict[Connection, _Worker] = {}
+
+        def _dispatch() -> None:
+            while idle:
+                try:
+                    index, job = next(pending)
+                except StopIteration:
+                    return
+                worker = idle.pop()
+                worker.job = index
+                worker.conn.send(job)
+                busy[worker.conn] = worker
+
+        try:
+            _dispatch()
+            while busy:
+                for conn in wait(list(busy)):
+                    worker = busy.pop(conn)
+                    ok, result = worker.receive()
+                    index, worker.job = worker.job, None
+                    idle.append(worker)
+                    if not ok:
+                        raise result
+
+                    _dispatch()
+                    yield index, result
+        finally:
+            # Let the other workers finish (after an error or if the caller stops early),
+            # so their results aren't mistaken for those of the next jobs
+            for other in busy.values():
+                other.receive()
+                other.job = None
+
+    def map(self, jobs: Iterable[Job[T]]) -> list[T]:
+        """
+        Runs every job and returns their results in the same order as ``jobs``.
+        """
+        results = dict(self.imap_unordered(jobs))
+        return [results[i] for i in range(len(results))]
+
+    def run(self, job: Job[T]) -> T:
+        """
+        Runs a single job on an idle worker and returns its result.
+        """
+        return self.map((job,))[0]
+
+    def close(self) -> None:
+        """
+        Shuts down every worker's session and process and releases their shared memory.
+        """
+        if self._closed:
+            return
+
+        self._closed = True
+        for worker in self._workers:
+            worker.close()
+
+
+__all__ = [
+    "FrameJob",
+    "FrameJobResult",
+    "Job",
+    "SessionPool",
+    "SessionRecipe",
+]
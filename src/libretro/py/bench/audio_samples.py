@@ -0,0 +1,79 @@
+from math import sin, tau
+from time import perf_counter
+from typing import Annotated
+
+import typer
+
+from libretro.api import AvEnableFlags, retro_audio_sample_t
+from libretro.drivers import (
+    ArrayAudioDriver,
+    ArrayVideoDriver,
+    AudioDriver,
+    CompositeEnvironmentDriver,
+    GeneratorInputDriver,
+    RingBufferAudioDriver,
+)
+
+
+def _environment(audio: AudioDriver, coalesce: bool) -> CompositeEnvironmentDriver:
+    return CompositeEnvironmentDriver(
+        {
+            "audio": audio,
+            "input": GeneratorInputDriver(),
+            "video": ArrayVideoDriver(),
+            "av_enable": AvEnableFlags.VIDEO | AvEnableFlags.AUDIO,
+            "coalesce_audio": coalesce,
+        }
+    )
+
+
+def main(
+    samples: Annotated[int, typer.Option(help="Stereo samples the core emits per frame.")] = 800,
+    seconds: Annotated[float, typer.Option(help="Time to spend on each combination.")] = 1.0,
+):
+    """
+    Measures how many audio frames per second a synthetic core can submit
+    one at a time through retro_audio_sample_t,
+    with and without CompositeEnvironmentDriver's coalescing,
+    for a few audio drivers.
+    """
+
+    # A short sine wave, so the samples aren't all identical
+    wave = [round(sin(tau * i / samples) * 0x3FFF) for i in range(samples)]
+
+    drivers = {
+        "array": ArrayAudioDriver,
+        "ring": RingBufferAudioDriver,
+    }
+
+    print(f"{'driver':>8} {'path':>10} {'audio frames/s':>16} {'video frames/s':>16}")
+    for name, driver in drivers.items():
+        for coalesce in (False, True):
+            env = _environment(driver(), coalesce)
+
+            # Call through ctypes, as a core would
+            sample = retro_audio_sample_t(env.audio_sample)
+            frames = 0
+            start = perf_counter()
+            elapsed = 0.0
+            while elapsed < seconds:
+                env.begin_frame()
+                for s in wave:
+                    sample(s, -s)
+
+                env.end_frame()
+                frames += 1
+                if isinstance(env.audio, ArrayAudioDriver):
+                    # Don't let the buffer grow for the whole run
+                    del env.audio.buffer[:]
+
+                elapsed = perf_counter() - start
+
+            path = "coalesced" if coalesce else "per-sample"
+            print(
+                f"{name:>8} {path:>10} {frames * samples / elapsed:16.0f} {frames / elapsed:16.1f}"
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
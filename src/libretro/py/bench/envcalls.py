@@ -0,0 +1,113 @@
+from ctypes import POINTER, addressof, c_bool, c_void_p, cast
+from time import perf_counter
+from typing import Annotated
+
+import typer
+
+from libretro.api import (
+    AvEnableFlags,
+    EnvironmentCall,
+    MemoryAccess,
+    retro_av_enable_flags,
+    retro_environment_t,
+    retro_framebuffer,
+    retro_variable,
+)
+from libretro.drivers import (
+    ArrayAudioDriver,
+    ArrayVideoDriver,
+    CompositeEnvironmentDriver,
+    DictOptionDriver,
+    GeneratorInputDriver,
+)
+from libretro.drivers.environment.default import _ENVCALLS
+from libretro.error import UnsupportedEnvCall
+
+_UNKNOWN = 0xFFFF
+
+
+def _enum_dispatch(driver: CompositeEnvironmentDriver):
+    """
+    Reproduces how envcalls were dispatched before the lookup table,
+    to serve as a baseline.
+    """
+    members = EnvironmentCall.__members__.values()
+    envcalls = {
+        call: lambda data, m=getattr(driver, name), t=argtype: (
+            m() if t is None else m(cast(data, POINTER(t)))
+        )
+        for call, (name, argtype) in _ENVCALLS.items()
+    }
+
+    def environment(cmd: int, data: c_void_p) -> bool:
+        if cmd not in members:
+            return False
+
+        envcall = EnvironmentCall(cmd)
+        if envcall in envcalls:
+            try:
+                return envcalls[envcall](data)
+            except UnsupportedEnvCall:
+                pass
+
+        return False
+
+    return environment
+
+
+def main(
+    seconds: Annotated[float, typer.Option(help="Time to spend on each envcall.")] = 1.0,
+):
+    """
+    Measures how many times per second the core can call the environment callback
+    for a few envcalls that cores tend to use every frame,
+    with the current dispatch table and with the old enum-based dispatch.
+    """
+
+    driver = CompositeEnvironmentDriver(
+        {
+            "audio": ArrayAudioDriver(),
+            "input": GeneratorInputDriver(),
+            "video": ArrayVideoDriver(),
+            "options": DictOptionDriver(),
+            "av_enable": AvEnableFlags.VIDEO | AvEnableFlags.AUDIO,
+        }
+    )
+
+    updated = c_bool()
+    variable = retro_variable(b"nonexistent", None)
+    framebuffer = retro_framebuffer(width=320, height=240, access_flags=MemoryAccess.WRITE)
+    av_enable = retro_av_enable_flags()
+    calls = (
+        (EnvironmentCall.GET_VARIABLE_UPDATE, addressof(updated)),
+        (EnvironmentCall.GET_VARIABLE, addressof(variable)),
+        (EnvironmentCall.GET_CURRENT_SOFTWARE_FRAMEBUFFER, addressof(framebuffer)),
+        (EnvironmentCall.GET_AUDIO_VIDEO_ENABLE, addressof(av_enable)),
+        (EnvironmentCall.GET_INPUT_BITMASKS, None),
+    )
+
+    # Call through ctypes, as a core would
+    dispatchers = {
+        "table": retro_environment_t(driver.environment),
+        "enum": retro_environment_t(_enum_dispatch(driver)),
+    }
+
+    print(f"{'envcall':>32} {'dispatch':>8} {'calls/s':>12}")
+    for cmd, data in (*calls, (_UNKNOWN, None)):
+        name = cmd.name if isinstance(cmd, EnvironmentCall) else f"unknown ({cmd:#x})"
+        for dispatch, environment in dispatchers.items():
+            n = 0
+            start = perf_counter()
+            elapsed = 0.0
+            while elapsed < seconds:
+                for _ in range(1000):
+                    environment(cmd, data)
+
+                n += 1000
+                elapsed = perf_counter() - start
+
+            print(f"{name:>32} {dispatch:>8} {n / elapsed:12.0f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
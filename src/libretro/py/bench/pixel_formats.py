@@ -0,0 +1,48 @@
+import os
+from time import perf_counter
+from typing import Annotated
+
+import typer
+
+from libretro.api.video import PixelFormat, Rotation, convert, convert_to_rgba
+
+
+def main(
+    width: Annotated[int, typer.Option(help="Width of each frame, in pixels.")] = 640,
+    height: Annotated[int, typer.Option(help="Height of each frame, in pixels.")] = 480,
+    seconds: Annotated[float, typer.Option(help="Time to spend on each combination.")] = 1.0,
+    pure_python: Annotated[
+        bool,
+        typer.Option(
+            "--pure-python", help="Benchmark the fallback path even if NumPy is installed."
+        ),
+    ] = False,
+):
+    """
+    Measures how many frames per second convert_to_rgba can process
+    for each combination of PixelFormat and Rotation.
+    """
+
+    if pure_python:
+        convert.numpy = None
+
+    backend = "numpy" if convert.numpy is not None else "python"
+    print(f"backend: {backend}, frame size: {width}x{height}")
+
+    for pixel_format in PixelFormat:
+        pitch = width * pixel_format.bytes_per_pixel
+        frame = memoryview(os.urandom(pitch * height))
+        for rotation in Rotation:
+            frames = 0
+            start = perf_counter()
+            elapsed = 0.0
+            while elapsed < seconds:
+                convert_to_rgba(frame, width, height, pitch, pixel_format, rotation)
+                frames += 1
+                elapsed = perf_counter() - start
+
+            print(f"{pixel_format.name:>8} {rotation.name:>11}: {frames / elapsed:10.1f} frames/s")
+
+
+if __name__ == "__main__":
+    typer.run(main)
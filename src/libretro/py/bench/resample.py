@@ -0,0 +1,66 @@
+from array import array
+from math import sin, tau
+from time import perf_counter
+from typing import Annotated
+
+import typer
+
+from libretro.api import retro_system_av_info
+from libretro.drivers import RingBufferAudioDriver
+from libretro.drivers.audio import resample
+from libretro.drivers.audio.resample import ResamplingAudioDriver
+
+
+def _measure(
+    input_rate: float, output_rate: float, taps: int, fps: float, seconds: float
+) -> float:
+    driver = ResamplingAudioDriver(RingBufferAudioDriver(1.0), output_rate, taps=taps)
+    info = retro_system_av_info()
+    info.timing.fps = fps
+    info.timing.sample_rate = input_rate
+    driver.system_av_info = info
+
+    # One video frame's worth of a 440 Hz tone, as a core would submit it
+    frames = round(input_rate / fps)
+    tone = [round(sin(tau * 440 * i / input_rate) * 0x3FFF) for i in range(frames)]
+    batch = memoryview(array("h", (s for s in tone for _ in range(2))))
+
+    submitted = 0
+    start = perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        driver.sample_batch(batch)
+        submitted += frames
+        elapsed = perf_counter() - start
+
+    # Seconds of audio converted per second of wall time
+    return submitted / input_rate / elapsed
+
+
+def main(
+    output_rate: Annotated[float, typer.Option(help="Sample rate to convert to.")] = 48000.0,
+    seconds: Annotated[float, typer.Option(help="Time to spend on each combination.")] = 1.0,
+    pure_python: Annotated[
+        bool, typer.Option(help="Measure the pure-Python fallback instead of NumPy.")
+    ] = False,
+):
+    """
+    Measures the realtime factor of ResamplingAudioDriver
+    (seconds of audio converted per second of wall time)
+    for a few common core sample rates and filter lengths.
+    """
+
+    if pure_python:
+        resample.numpy = None
+    elif resample.numpy is None:
+        raise typer.BadParameter("NumPy is not installed; pass --pure-python")
+
+    print(f"{'input Hz':>10} {'taps':>5} {'realtime factor':>16}")
+    for input_rate, fps in ((32040.5, 60.0988), (44100.0, 60.0), (48000.0, 59.7275)):
+        for taps in (8, 32, 64):
+            factor = _measure(input_rate, output_rate, taps, fps, seconds)
+            print(f"{input_rate:>10} {taps:>5} {factor:16.1f}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
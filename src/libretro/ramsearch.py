@@ -0,0 +1,331 @@
+"""
+Finding the memory addresses that hold a game's variables, for cheats and tools.
+"""
+
+from collections.abc import Callable, Sequence
+from enum import Enum
+from typing import final
+
+from libretro._typing import Buffer
+from libretro.core import CoreInterface
+from libretro.h import RETRO_MEMORY_SYSTEM_RAM
+from libretro.memory import MemoryRegion
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class SearchComparison(Enum):
+    """
+    How ``RamSearch.narrow`` decides which candidates to keep.
+    Comparisons against the previous values use the values from the last call to ``narrow``
+    (or from when the search was started or reset).
+    """
+
+    EQUAL = "=="
+    """The value equals the given operand."""
+
+    NOT_EQUAL = "!="
+    """The value does not equal the given operand."""
+
+    GREATER = ">"
+    """The value is greater than the given operand."""
+
+    GREATER_EQUAL = ">="
+    """The value is greater than or equal to the given operand."""
+
+    LESS = "<"
+    """The value is less than the given operand."""
+
+    LESS_EQUAL = "<="
+    """The value is less than or equal to the given operand."""
+
+    CHANGED = "changed"
+    """The value differs from its previous value."""
+
+    UNCHANGED = "unchanged"
+    """The value is the same as its previous value."""
+
+    INCREASED = "increased"
+    """The value is greater than its previous value."""
+
+    DECREASED = "decreased"
+    """The value is less than its previous value."""
+
+    DELTA = "delta"
+    """The value minus its previous value equals the given operand (with wraparound)."""
+
+
+_CONSTANT = {
+    SearchComparison.EQUAL: "__eq__",
+    SearchComparison.NOT_EQUAL: "__ne__",
+    SearchComparison.GREATER: "__gt__",
+    SearchComparison.GREATER_EQUAL: "__ge__",
+    SearchComparison.LESS: "__lt__",
+    SearchComparison.LESS_EQUAL: "__le__",
+}
+
+_RELATIVE = {
+    SearchComparison.CHANGED: "__ne__",
+    SearchComparison.UNCHANGED: "__eq__",
+    SearchComparison.INCREASED: "__gt__",
+    SearchComparison.DECREASED: "__lt__",
+}
+
+
+@final
+class RamSearch:
+    """
+    Narrows down which addresses in a block of memory hold a particular value,
+    by repeatedly comparing the memory's current contents
+    against constants or against the values it had the last time.
+
+    Candidates are kept as a compact NumPy array of indexes
+    (along with their previous values), not as a set,
+    so each step costs a few vectorized operations over the remaining candidates.
+    Requires NumPy.
+    """
+
+    def __init__(
+        self,
+        memory: Buffer | Callable[[], Buffer],
+        *,
+        base: int = 0,
+        size: int = 1,
+        big_endian: bool = False,
+        signed: bool = False,
+        step: int | None = None,
+    ):
+        """
+        :param memory: The memory to search,
+            or a callable that returns it (if it may be reallocated between steps).
+            Not copied; each step reads its current contents.
+        :param base: The address of the first byte of ``memory``, for reporting results.
+        :param size: The width of the values to search for, in bytes; 1, 2, or 4.
+        :param big_endian: Whether multi-byte values are stored big-endian.
+        :param signed: Whether values are compared as signed integers.
+        :param step: The distance between candidate addresses in bytes.
+            Defaults to ``size``, so only aligned values are considered;
+            pass 1 to consider every byte offset.
+        :raises RuntimeError: If NumPy isn't installed.
+        :raises ValueError: If ``size`` or ``step`` is invalid.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is required for RamSearch but is not installed")
+
+        if size not in (1, 2, 4):
+            raise ValueError(f"Expected a size of 1, 2, or 4, got {size}")
+
+        step = size if step is None else step
+        if step <= 0:
+            raise ValueError(f"Expected a positive step, got {step}")
+
+        self._memory = memory if callable(memory) else (lambda: memory)
+        self._base = base
+        self._size = size
+        self._step = step
+        self._big_endian = big_endian
+        self._signed = signed
+        self._dtype = numpy.dtype(f"{'>' if big_endian else '<'}{'i' if signed else 'u'}{size}")
+        self.reset()
+
+    @classmethod
+    def from_core(
+        cls, core: CoreInterface, memory_id: int = RETRO_MEMORY_SYSTEM_RAM, **kwargs
+    ) -> "RamSearch":
+        """
+        Searches the memory that ``core.get_memory(memory_id)`` returns.
+        Other arguments are passed to the constructor.
+
+        :raises ValueError: If the core doesn't expose that memory.
+        """
+        if core.get_memory(memory_id) is None:
+            raise ValueError(f"Core does not expose memory with ID {memory_id}")
+
+        return cls(lambda: core.get_memory(memory_id), **kwargs)
+
+    @classmethod
+    def from_region(cls, region: MemoryRegion, **kwargs) -> "RamSearch":
+        """
+        Searches a region of a ``MemoryBus``,
+        reporting addresses relative to the region's start
+        and using its byte order and minimum access size as defaults.
+        Other arguments are passed to the constructor.
+
+        :raises ValueError: If the region has no memory.
+        """
+        if region.buffer is None:
+            raise ValueError(f"Memory region {region.index} has no backing memory")
+
+        kwargs.setdefault("base", region.start)
+        kwargs.setdefault("big_endian", region.big_endian)
+        kwargs.setdefault("size", region.min_size if region.min_size <= 4 else 4)
+        return cls(region.buffer, **kwargs)
+
+    def __values(self, indexes: "numpy.ndarray | None") -> "numpy.ndarray":
+        memory = numpy.frombuffer(self._memory(), dtype=numpy.uint8)
+        count = (len(memory) - self._size) // self._step + 1 if len(memory) >= self._size else 0
+        values = numpy.ndarray((count,), dtype=self._dtype, buffer=memory, strides=(self._step,))
+        if indexes is None:
+            return values.copy()
+
+        return values[indexes]
+
+    def reset(self) -> None:
+        """
+        Makes every address a candidate again,
+        and records the memory's current values for the next relative comparison.
+        """
+        self._indexes: numpy.ndarray | None = None  # None means every address
+        self._previous = self.__values(None)
+        self._steps = 0
+
+    def snapshot(self) -> None:
+        """
+        Records the current values of the candidates without narrowing them,
+        so that the next relative comparison is against now.
+        """
+        self._previous = self.__values(self._indexes)
+
+    def narrow(self, comparison: SearchComparison, operand: int | None = None) -> int:
+        """
+        Keeps only the candidates whose current value satisfies ``comparison``,
+        then records their current values for the next relative comparison.
+
+        :param comparison: How to compare each candidate.
+        :param operand: The constant to compare against,
+            or the expected difference for ``SearchComparison.DELTA``.
+            Not used by the other relative comparisons.
+        :return: The number of candidates that remain.
+        :raises TypeError: If ``comparison`` isn't a ``SearchComparison``.
+        :raises ValueError: If ``operand`` is missing or out of range.
+        """
+        if not isinstance(comparison, SearchComparison):
+            raise TypeError(f"Expected a SearchComparison, got {type(comparison).__name__}")
+
+        current = self.__values(self._indexes)
+        if comparison in _CONSTANT:
+            if operand is None:
+                raise ValueError(f"{comparison.name} requires an operand")
+
+            info = numpy.iinfo(self._dtype)
+            if not info.min <= operand <= info.max:
+                raise ValueError(f"Expected an operand in [{info.min}, {info.max}], got {operand}")
+
+            keep = getattr(current, _CONSTANT[comparison])(operand)
+        elif comparison == SearchComparison.DELTA:
+            if operand is None:
+                raise ValueError("DELTA requires an operand")
+
+            # Unsigned subtraction wraps around like the emulated system would
+            unsigned = self._dtype.newbyteorder("=").str.replace("i", "u")
+            difference = current.astype(unsigned) - self._previous.astype(unsigned)
+            keep = difference == operand % (1 << (8 * self._size))
+        else:
+            keep = getattr(current, _RELATIVE[comparison])(self._previous)
+
+        survivors = numpy.flatnonzero(keep)
+        if self._indexes is None:
+            self._indexes = survivors.astype(numpy.uint32)
+        else:
+            self._indexes = self._indexes[survivors]
+
+        self._previous = current[survivors]
+        self._steps += 1
+        return len(self._indexes)
+
+    def __len__(self) -> int:
+        """
+        The number of remaining candidates.
+        """
+        return len(self._previous)
+
+    @property
+    def steps(self) -> int:
+        """
+        How many times ``narrow`` has been called since the search began.
+        """
+        return self._steps
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def offsets(self) -> "numpy.ndarray":
+        """
+        The byte offsets of the remaining candidates within the memory, in ascending order.
+        """
+        if self._indexes is None:
+            return numpy.arange(len(self._previous), dtype=numpy.int64) * self._step
+
+        return self._indexes.astype(numpy.int64) * self._step
+
+    @property
+    def addresses(self) -> "numpy.ndarray":
+        """
+        The addresses of the remaining candidates (``base`` plus their offsets).
+        """
+        return self.offsets + self._base
+
+    @property
+    def values(self) -> "numpy.ndarray":
+        """
+        The current values of the remaining candidates.
+        """
+        return self.__values(self._indexes)
+
+    @property
+    def previous_values(self) -> "numpy.ndarray":
+        """
+        The candidates' values as of the last call to ``narrow``, ``snapshot``, or ``reset``.
+        """
+        return self._previous.copy()
+
+    def cheats(self, value: int, template: str = "{address:06X}:{value:02X}") -> Sequence[str]:
+        """
+        Formats cheat codes that set every remaining candidate to ``value``.
+
+        Most cores that accept raw memory cheats set one byte per code,
+        so each candidate gets one code per byte, in the search's byte order.
+
+        :param value: The value to write.
+        :param template: A format string for each code,
+            given ``address`` and ``value`` (a single byte) as keyword arguments.
+        """
+        data = value.to_bytes(
+            self._size, "big" if self._big_endian else "little", signed=value < 0
+        )
+        return [
+            template.format(address=int(address) + i, value=byte)
+            for address in self.addresses
+            for i, byte in enumerate(data)
+        ]
+
+    def set_cheats(
+        self,
+        core: CoreInterface,
+        value: int,
+        template: str = "{address:06X}:{value:02X}",
+        *,
+        first_index: int = 0,
+    ) -> int:
+        """
+        Passes the codes from ``cheats`` to ``core.cheat_set``, enabled,
+        numbered consecutively from ``first_index``.
+
+        :return: The number of cheat codes that were set.
+        """
+        codes = self.cheats(value, template)
+        for i, code in enumerate(codes):
+            core.cheat_set(first_index + i, True, code)
+
+        return len(codes)
+
+
+__all__ = [
+    "RamSearch",
+    "SearchComparison",
+]
@@ -0,0 +1,249 @@
+"""
+A bounded history of savestates and inputs that lets a session step backwards.
+"""
+
+from array import array
+from collections import deque
+from collections.abc import Callable
+from typing import NamedTuple, final
+
+from libretro.api import AvEnableFlags
+from libretro.drivers import CompositeEnvironmentDriver
+from libretro.savestate import SavestateManager, Snapshot
+
+
+class RewindStats(NamedTuple):
+    """
+    How much history a ``RewindBuffer`` holds and what it costs.
+    """
+
+    snapshots: int
+    """The number of savestates in the buffer."""
+
+    frames: int
+    """How many frames back the session can currently rewind."""
+
+    bytes: int
+    """The memory used by the buffer's savestates and input logs."""
+
+    bytes_per_second: float
+    """``bytes`` divided by the length of the history in seconds; use this to size ``budget``."""
+
+
+@final
+class RewindBuffer:
+    """
+    Records a savestate every few frames and every input the core reads,
+    so that the session can be restored to any frame within its history.
+
+    Savestates are grouped into segments that begin with a keyframe
+    (see ``SavestateManager``), and whole segments are evicted
+    (oldest first) when the buffer exceeds its memory budget.
+
+    Usually created with ``Session.enable_rewind`` rather than directly.
+    """
+
+    def __init__(
+        self,
+        manager: SavestateManager,
+        *,
+        interval: int = 1,
+        budget: int = 64 * 1024 * 1024,
+        fps: float = 60.0,
+    ):
+        """
+        :param manager: Takes and restores the savestates.
+            Must not be used for anything else, since its keyframes are shared with this buffer.
+        :param interval: How many frames to run between savestates.
+            Larger intervals use less memory but make rewinding slower,
+            since more frames must be re-simulated.
+        :param budget: The most memory the buffer should use, in bytes.
+            The newest segment is always kept, even if it alone exceeds the budget.
+        :param fps: The session's frame rate, used to compute ``RewindStats.bytes_per_second``.
+        :raises TypeError: If ``manager`` is not a ``SavestateManager``.
+        :raises ValueError: If ``interval`` or ``budget`` is less than 1.
+        """
+        if not isinstance(manager, SavestateManager):
+            raise TypeError(f"Expected a SavestateManager, got {type(manager).__name__}")
+
+        if interval < 1:
+            raise ValueError(f"Expected an interval of at least 1, got {interval}")
+
+        if budget < 1:
+            raise ValueError(f"Expected a budget of at least 1 byte, got {budget}")
+
+        self._manager = manager
+        self._interval = interval
+        self._budget = budget
+        self._fps = fps
+        self._frame = 0
+        self._segments: deque[list[tuple[int, Snapshot]]] = deque()
+        self._inputs: deque[array] = deque()
+        self._inputs_start = 0
+        self._bytes = 0
+        self._recording: array | None = None
+
+    @property
+    def manager(self) -> SavestateManager:
+        return self._manager
+
+    @property
+    def interval(self) -> int:
+        return self._interval
+
+    @property
+    def budget(self) -> int:
+        return self._budget
+
+    @property
+    def frame(self) -> int:
+        """
+        The number of frames run since this buffer was created, minus any that were rewound.
+        """
+        return self._frame
+
+    @property
+    def oldest_frame(self) -> int | None:
+        """
+        The earliest frame that the session can rewind to, or ``None`` if the buffer is empty.
+        """
+        return self._segments[0][0][0] if self._segments else None
+
+    @property
+    def stats(self) -> RewindStats:
+        snapshots = sum(len(s) for s in self._segments)
+        frames = self._frame - self._segments[0][0][0] if self._segments else 0
+        seconds = frames / self._fps if self._fps else 0
+        return RewindStats(
+            snapshots,
+            frames,
+            self._bytes,
+            self._bytes / seconds if seconds else 0.0,
+        )
+
+    def clear(self) -> None:
+        """
+        Discards all history.
+        """
+        self._segments.clear()
+        self._inputs.clear()
+        self._inputs_start = self._frame
+        self._bytes = 0
+        self._manager.invalidate()
+
+    def begin_frame(self, environment: CompositeEnvironmentDriver) -> None:
+        """
+        Takes a savestate if one is due, then starts recording the frame's input.
+        Call this just before ``retro_run``.
+        """
+        last = self._segments[-1][-1][0] if self._segments else None
+        if self._frame % self._interval == 0 and last != self._frame:
+            snapshot = self._manager.save()
+            if snapshot.is_keyframe or not self._segments:
+                self._segments.append([])
+
+            self._segments[-1].append((self._frame, snapshot))
+            self._bytes += snapshot.stored_size
+            self._evict()
+
+        self._recording = array("i")
+        environment.input_recording = self._recording
+
+    def end_frame(self, environment: CompositeEnvironmentDriver) -> None:
+        """
+        Stops recording the frame's input.
+        Call this just after ``retro_run``.
+        """
+        environment.input_recording = None
+        if self._recording is None:
+            return
+
+        if not self._segments:
+            # Nothing to replay this input from, so don't keep it
+            self._inputs_start = self._frame + 1
+        else:
+            self._inputs.append(self._recording)
+            self._bytes += len(self._recording) * self._recording.itemsize
+
+        self._recording = None
+        self._frame += 1
+
+    def _evict(self) -> None:
+        while self._bytes > self._budget and len(self._segments) > 1:
+            segment = self._segments.popleft()
+            self._bytes -= sum(s.stored_size for _, s in segment)
+            oldest = self._segments[0][0][0]
+            while self._inputs and self._inputs_start < oldest:
+                inputs = self._inputs.popleft()
+                self._bytes -= len(inputs) * inputs.itemsize
+                self._inputs_start += 1
+
+    def rewind(
+        self, frames: int, environment: CompositeEnvironmentDriver, run: Callable[[], None]
+    ) -> int:
+        """
+        Restores the state from ``frames`` frames ago,
+        or from the oldest frame in the buffer if that's more recent.
+
+        Loads the nearest savestate at or before the target frame,
+        then calls ``run`` once per frame to re-simulate up to it
+        while playing back the recorded input.
+        Each re-simulated frame is bracketed by the environment's
+        ``begin_frame`` and ``end_frame``, but its output is discarded
+        (as in ``RunAhead``'s hidden frames), except for the video of the last one.
+
+        :return: The number of frames that were actually rewound.
+        :raises ValueError: If ``frames`` is negative.
+        :raises RuntimeError: If the core rejects the savestate.
+        """
+        if frames < 0:
+            raise ValueError(f"Expected a non-negative number of frames, got {frames}")
+
+        if not self._segments or frames == 0:
+            return 0
+
+        target = max(self._frame - frames, self._segments[0][0][0])
+
+        # Discard every savestate taken after the target frame
+        while self._segments[-1][-1][0] > target:
+            _, snapshot = self._segments[-1].pop()
+            self._bytes -= snapshot.stored_size
+            if not self._segments[-1]:
+                self._segments.pop()
+
+        start, snapshot = self._segments[-1][-1]
+        if not self._manager.load(snapshot):
+            raise RuntimeError(f"Core failed to load the savestate from frame {start}")
+
+        discarded = environment.discarded_output
+        try:
+            environment.discarded_output = AvEnableFlags.VIDEO | AvEnableFlags.AUDIO
+            for frame in range(start, target):
+                if frame == target - 1:
+                    # Present the frame that was rewound to
+                    environment.discarded_output = AvEnableFlags.AUDIO
+
+                environment.input_playback = iter(self._inputs[frame - self._inputs_start])
+                environment.begin_frame()
+                run()
+                environment.end_frame()
+        finally:
+            environment.input_playback = None
+            environment.discarded_output = discarded
+
+        # Discard the input for the frames that were undone
+        while self._inputs and self._inputs_start + len(self._inputs) > target:
+            inputs = self._inputs.pop()
+            self._bytes -= len(inputs) * inputs.itemsize
+
+        rewound = self._frame - target
+        self._frame = target
+        # The manager's current keyframe may have been discarded
+        self._manager.invalidate()
+        return rewound
+
+
+__all__ = [
+    "RewindBuffer",
+    "RewindStats",
+]
@@ -0,0 +1,187 @@
+"""
+Run-ahead, a frontend technique for hiding a core's internal input latency.
+"""
+
+from array import array
+from collections.abc import Callable
+from typing import final
+
+from libretro.api import AvEnableFlags, SavestateContext
+from libretro.core import CoreInterface
+from libretro.drivers import CompositeEnvironmentDriver
+from libretro.savestate import SavestateManager
+
+_HIDDEN = AvEnableFlags.FAST_SAVESTATES
+_VIDEO_ONLY = AvEnableFlags.VIDEO | AvEnableFlags.FAST_SAVESTATES
+_AUDIO_ONLY = AvEnableFlags.AUDIO | AvEnableFlags.FAST_SAVESTATES
+
+
+@final
+class RunAhead:
+    """
+    Runs the core several frames into the future after every real frame,
+    presents the last of those frames, and then discards them.
+
+    With a single core instance (``SavestateContext.RUNAHEAD_SAME_INSTANCE``),
+    each frame is run like so:
+
+    1. The real frame is run with its video hidden, but its audio kept.
+    2. The core's state is saved.
+    3. ``frames`` more frames are run with the real frame's input;
+       only the last one's video is kept, and none of their audio is.
+    4. The saved state is restored.
+
+    With a secondary instance (``SavestateContext.RUNAHEAD_SAME_BINARY``),
+    steps 3 and 4 happen on the secondary instance instead,
+    after loading the primary instance's state into it.
+    The primary instance never has to load a state,
+    but the presented frames go to the secondary instance's video driver.
+
+    Usually created with ``Session.enable_run_ahead`` rather than directly.
+    """
+
+    def __init__(
+        self,
+        manager: SavestateManager,
+        frames: int,
+        *,
+        secondary_core: CoreInterface | None = None,
+        secondary_environment: CompositeEnvironmentDriver | None = None,
+    ):
+        """
+        :param manager: Saves the primary core's state.
+        :param frames: How many frames to run ahead.
+        :param secondary_core: A second instance of the same core, with the same content loaded.
+            It must be loaded from a separate copy of the core's library file,
+            or else it will share the primary instance's global state.
+        :param secondary_environment: The environment driver used by ``secondary_core``.
+        :raises TypeError: If any parameter is not consistent with its documented types.
+        :raises ValueError: If ``frames`` is less than 1,
+            or if only one of ``secondary_core`` and ``secondary_environment`` is given.
+        """
+        if not isinstance(manager, SavestateManager):
+            raise TypeError(f"Expected a SavestateManager, got {type(manager).__name__}")
+
+        if not isinstance(frames, int):
+            raise TypeError(f"Expected an int, got {type(frames).__name__}")
+
+        if frames < 1:
+            raise ValueError(f"Expected to run at least 1 frame ahead, got {frames}")
+
+        if (secondary_core is None) != (secondary_environment is None):
+            raise ValueError("secondary_core and secondary_environment must be given together")
+
+        if secondary_environment is not None and not isinstance(
+            secondary_environment, CompositeEnvironmentDriver
+        ):
+            raise TypeError(
+                f"Expected CompositeEnvironmentDriver or None, got {type(secondary_environment).__name__}"
+            )
+
+        self._manager = manager
+        self._frames = frames
+        self._secondary_core = secondary_core
+        self._secondary_environment = secondary_environment
+
+    @property
+    def frames(self) -> int:
+        return self._frames
+
+    @property
+    def manager(self) -> SavestateManager:
+        return self._manager
+
+    @property
+    def context(self) -> SavestateContext:
+        if self._secondary_core is None:
+            return SavestateContext.RUNAHEAD_SAME_INSTANCE
+
+        return SavestateContext.RUNAHEAD_SAME_BINARY
+
+    def run_frame(self, environment: CompositeEnvironmentDriver, run: Callable[[], None]) -> None:
+        """
+        Runs one real frame, then runs ahead.
+
+        :param environment: The primary instance's environment driver.
+        :param run: Runs one frame of the primary instance.
+        """
+        context = self.context
+        av_enable = environment.av_enable
+        savestate_context = environment.savestate_context
+        recording = environment.input_recording
+        inputs = array("i")
+
+        try:
+            # Run the real frame, recording its input so the hidden frames can reuse it
+            environment.input_recording = inputs
+            environment.av_enable = _AUDIO_ONLY
+            environment.discarded_output = AvEnableFlags.VIDEO
+            run()
+            environment.input_recording = None
+            if recording is not None:
+                recording.extend(inputs)
+
+            environment.savestate_context = context
+            state = self._manager.serialize()
+
+            if self._secondary_core is None:
+                self._run_ahead(environment, self._manager.core, inputs)
+                if not self._manager.core.unserialize(state):
+                    raise RuntimeError("Core failed to restore its state after running ahead")
+            else:
+                self._run_secondary(state, inputs)
+        finally:
+            environment.input_recording = recording
+            environment.input_playback = None
+            environment.discarded_output = AvEnableFlags(0)
+            _restore(environment, av_enable, savestate_context)
+
+    def _run_ahead(
+        self, environment: CompositeEnvironmentDriver, core: CoreInterface, inputs: array
+    ) -> None:
+        environment.av_enable = _HIDDEN
+        environment.discarded_output = AvEnableFlags.VIDEO | AvEnableFlags.AUDIO
+        for i in range(self._frames):
+            if i == self._frames - 1:
+                # Present only the last frame, and none of the audio
+                environment.av_enable = _VIDEO_ONLY
+                environment.discarded_output = AvEnableFlags.AUDIO
+
+            environment.input_playback = iter(inputs)
+            core.run()
+
+        environment.input_playback = None
+
+    def _run_secondary(self, state: memoryview, inputs: array) -> None:
+        environment = self._secondary_environment
+        av_enable = environment.av_enable
+        savestate_context = environment.savestate_context
+        try:
+            environment.savestate_context = SavestateContext.RUNAHEAD_SAME_BINARY
+            if not self._secondary_core.unserialize(state):
+                raise RuntimeError("Secondary core failed to load the primary core's state")
+
+            self._run_ahead(environment, self._secondary_core, inputs)
+        finally:
+            environment.input_playback = None
+            environment.discarded_output = AvEnableFlags(0)
+            _restore(environment, av_enable, savestate_context)
+
+
+def _restore(
+    environment: CompositeEnvironmentDriver,
+    av_enable: AvEnableFlags | None,
+    savestate_context: SavestateContext | None,
+) -> None:
+    if av_enable is None:
+        del environment.av_enable
+    else:
+        environment.av_enable = av_enable
+
+    if savestate_context is None:
+        del environment.savestate_context
+    else:
+        environment.savestate_context = savestate_context
+
+
+__all__ = ["RunAhead"]
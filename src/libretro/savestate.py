@@ -0,0 +1,272 @@
+"""
+Tools for taking and keeping many savestates at once.
+"""
+
+import zlib
+from enum import Enum, auto
+from typing import NamedTuple, final
+
+from libretro._typing import Buffer
+from libretro.api import SerializationQuirks
+from libretro.core import CoreInterface
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+class Compression(Enum):
+    """
+    How a ``SavestateManager`` compresses the snapshots it takes.
+    """
+
+    NONE = auto()
+    ZLIB = auto()
+    LZ4 = auto()
+    """Requires the ``lz4`` package."""
+
+
+class Snapshot(NamedTuple):
+    """
+    A savestate taken by a ``SavestateManager``.
+
+    Pass it to ``SavestateManager.load`` to restore it,
+    or to ``SavestateManager.decode`` to get the core's serialized state.
+    """
+
+    data: bytes
+    """
+    The stored state, possibly compressed.
+    If this snapshot has a keyframe, this is the XOR of the state with the keyframe's.
+    """
+
+    size: int
+    """The length of the serialized state, in bytes."""
+
+    compression: Compression
+
+    keyframe: "Snapshot | None" = None
+    """The snapshot that this one is a delta of, or ``None`` if this one is a keyframe."""
+
+    @property
+    def is_keyframe(self) -> bool:
+        return self.keyframe is None
+
+    @property
+    def stored_size(self) -> int:
+        """
+        The number of bytes this snapshot occupies, not counting its keyframe.
+        """
+        return len(self.data)
+
+
+def _compress(data: Buffer, compression: Compression, level: int | None) -> bytes:
+    match compression:
+        case Compression.NONE:
+            return bytes(data)
+        case Compression.ZLIB:
+            return zlib.compress(data, -1 if level is None else level)
+        case Compression.LZ4:
+            return lz4_frame.compress(data, compression_level=level or 0)
+        case _:
+            raise ValueError(f"Invalid compression: {compression}")
+
+
+def _decompress(data: bytes, compression: Compression) -> bytes:
+    match compression:
+        case Compression.NONE:
+            return data
+        case Compression.ZLIB:
+            return zlib.decompress(data)
+        case Compression.LZ4:
+            return lz4_frame.decompress(data)
+        case _:
+            raise ValueError(f"Invalid compression: {compression}")
+
+
+def _xor(a: Buffer, b: Buffer, length: int) -> bytes:
+    # Python's big integers XOR whole buffers at C speed
+    x = int.from_bytes(a, "little") ^ int.from_bytes(b, "little")
+    return x.to_bytes(length, "little")
+
+
+@final
+class SavestateManager:
+    """
+    Takes and restores savestates without reallocating buffers on every call,
+    and stores them compactly enough to keep thousands in memory.
+
+    Most snapshots are stored as the XOR of the core's state with a recent keyframe;
+    since little of a core's state changes between nearby frames,
+    these deltas are mostly zeroes and compress very well.
+    """
+
+    def __init__(
+        self,
+        core: CoreInterface,
+        quirks: SerializationQuirks | None = None,
+        *,
+        compression: Compression = Compression.ZLIB,
+        level: int | None = 1,
+        keyframe_interval: int = 60,
+    ):
+        """
+        :param core: The core whose state will be saved and restored.
+        :param quirks: The core's serialization quirks,
+            usually taken from ``Session.serialization_quirks``.
+            If they include ``SerializationQuirks.CORE_VARIABLE_SIZE``,
+            the state's size is queried before every save instead of once.
+        :param compression: How to compress each snapshot.
+        :param level: The compression level, or ``None`` for the compressor's default.
+            Ignored if ``compression`` is ``Compression.NONE``.
+        :param keyframe_interval: How many snapshots to take between full keyframes.
+            If 1, every snapshot is a keyframe.
+        :raises TypeError: If any parameter is not consistent with its documented types.
+        :raises ValueError: If ``keyframe_interval`` is less than 1.
+        :raises ImportError: If ``compression`` is ``Compression.LZ4``
+            but the ``lz4`` package isn't installed.
+        """
+        if quirks is not None and not isinstance(quirks, SerializationQuirks):
+            raise TypeError(f"Expected SerializationQuirks or None, got {type(quirks).__name__}")
+
+        if not isinstance(compression, Compression):
+            raise TypeError(f"Expected a Compression, got {type(compression).__name__}")
+
+        if compression == Compression.LZ4 and lz4_frame is None:
+            raise ImportError("Compression.LZ4 requires the lz4 package")
+
+        if not isinstance(keyframe_interval, int):
+            raise TypeError(f"Expected an int, got {type(keyframe_interval).__name__}")
+
+        if keyframe_interval < 1:
+            raise ValueError(
+                f"Expected a keyframe interval of at least 1, got {keyframe_interval}"
+            )
+
+        self._core = core
+        self._variable_size = bool(quirks and SerializationQuirks.CORE_VARIABLE_SIZE in quirks)
+        self._compression = compression
+        self._level = level
+        self._keyframe_interval = keyframe_interval
+        self._size: int | None = None
+        self._buffer = bytearray()
+        self._keyframe: Snapshot | None = None
+        self._keyframe_state: bytes | None = None
+        self._since_keyframe = 0
+
+    @property
+    def core(self) -> CoreInterface:
+        return self._core
+
+    @property
+    def compression(self) -> Compression:
+        return self._compression
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the core's serialized state, in bytes.
+        Cached after the first query unless the core's size is variable.
+        """
+        if self._size is None or self._variable_size:
+            self._size = self._core.serialize_size()
+
+        return self._size
+
+    def invalidate(self) -> None:
+        """
+        Forgets the cached state size and ensures that the next snapshot is a keyframe.
+        Call this after loading new content or resetting the core.
+        """
+        self._size = None
+        self._keyframe = None
+        self._keyframe_state = None
+        self._since_keyframe = 0
+
+    def serialize(self) -> memoryview:
+        """
+        Serializes the core's state into a reusable buffer, without compressing it.
+
+        :return: A view of the serialized state,
+            valid until the next call to ``serialize`` or ``save``.
+        :raises RuntimeError: If the core doesn't support serialization or fails to serialize.
+        """
+        size = self.size
+        if size == 0:
+            raise RuntimeError("Core does not support serialization")
+
+        if len(self._buffer) < size:
+            self._buffer = bytearray(size)
+
+        view = memoryview(self._buffer)[:size]
+        if not self._core.serialize(view):
+            raise RuntimeError("Core failed to serialize its state")
+
+        return view
+
+    def save(self, keyframe: bool | None = None) -> Snapshot:
+        """
+        Takes a snapshot of the core's current state.
+
+        :param keyframe: ``True`` to force a keyframe, ``False`` to store a delta if possible,
+            or ``None`` to decide based on the keyframe interval.
+        :raises RuntimeError: If the core doesn't support serialization or fails to serialize.
+        """
+        state = self.serialize()
+        size = len(state)
+
+        if keyframe is None:
+            keyframe = self._since_keyframe >= self._keyframe_interval - 1
+
+        if keyframe or self._keyframe_state is None or len(self._keyframe_state) != size:
+            self._keyframe_state = bytes(state)
+            self._keyframe = Snapshot(
+                _compress(self._keyframe_state, self._compression, self._level),
+                size,
+                self._compression,
+            )
+            self._since_keyframe = 0
+            return self._keyframe
+
+        self._since_keyframe += 1
+        delta = _xor(state, self._keyframe_state, size)
+        return Snapshot(
+            _compress(delta, self._compression, self._level),
+            size,
+            self._compression,
+            self._keyframe,
+        )
+
+    def decode(self, snapshot: Snapshot) -> bytes:
+        """
+        :return: The serialized state stored in ``snapshot``.
+        """
+        if not isinstance(snapshot, Snapshot):
+            raise TypeError(f"Expected a Snapshot, got {type(snapshot).__name__}")
+
+        data = _decompress(snapshot.data, snapshot.compression)
+        if snapshot.keyframe is None:
+            return data
+
+        if snapshot.keyframe is self._keyframe:
+            base = self._keyframe_state
+        else:
+            base = self.decode(snapshot.keyframe)
+
+        return _xor(data, base, snapshot.size)
+
+    def load(self, snapshot: Snapshot) -> bool:
+        """
+        Restores the core's state from ``snapshot``.
+
+        :return: ``True`` if the core accepted the state.
+        """
+        return self._core.unserialize(self.decode(snapshot))
+
+
+__all__ = [
+    "Compression",
+    "SavestateManager",
+    "Snapshot",
+]
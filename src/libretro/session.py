@@ -1,9 +1,10 @@
 from collections.abc import Callable, Sequence
+from contextlib import AbstractContextManager, nullcontext
 from copy import deepcopy
 from ctypes import CDLL
 from os import PathLike
 from types import TracebackType
-from typing import AnyStr, Type
+from typing import AnyStr, NamedTuple, Type
 
 from _ctypes import CFuncPtr
 
@@ -12,6 +13,7 @@ from libretro.api import (
     API_VERSION,
     AvEnableFlags,
     Content,
+    MemoryDescriptorFlag,
     SerializationQuirks,
     SubsystemContent,
     Subsystems,
@@ -19,6 +21,7 @@ from libretro.api import (
     retro_fastforwarding_override,
     retro_get_proc_address_interface,
     retro_input_descriptor,
+    retro_memory_descriptor,
     retro_memory_map,
     retro_proc_address_t,
     retro_subsystem_info,
@@ -32,8 +35,12 @@ from libretro.drivers import (
     AudioDriver,
     CompositeEnvironmentDriver,
     ContentDriver,
+    EnvcallPhase,
+    EnvcallTracer,
     FileSystemInterface,
     InputDriver,
+    InputMoviePlayer,
+    InputMovieRecorder,
     LedDriver,
     LoadedContentFile,
     LogDriver,
@@ -41,9 +48,38 @@ from libretro.drivers import (
     MidiDriver,
     OptionDriver,
     RumbleInterface,
+    ThreadedAudioDriver,
     VideoDriver,
 )
 from libretro.error import CoreShutDownException
+from libretro.h import RETRO_MEMORY_SYSTEM_RAM
+from libretro.memory import MemoryBus
+from libretro.rewind import RewindBuffer
+from libretro.runahead import RunAhead
+from libretro.savestate import Compression, SavestateManager
+from libretro.timeline import MemoryTimeline
+from libretro.watch import MemoryWatcher, WatchCondition, WatchHit, Watchpoint
+
+
+class RunSummary(NamedTuple):
+    """
+    What happened during a call to ``Session.run_frames``.
+    """
+
+    frames: int
+    """The number of times ``retro_run`` was called."""
+
+    video_refreshes: int
+    """The number of frames the core submitted, including dupes."""
+
+    video_dupes: int
+    """The number of times the core asked to duplicate the previous frame."""
+
+    audio_frames: int
+    """The number of stereo audio frames the core produced."""
+
+    stopped: bool
+    """``True`` if the ``until`` predicate or a watchpoint stopped the run early."""
 
 
 class Session:
@@ -74,11 +110,32 @@ class Session:
 
         self._environment = environment
 
+        # Held while the session serializes, unserializes, or re-runs the core,
+        # so that the audio thread (if any) doesn't call into it at the same time
+        self._core_lock: AbstractContextManager = (
+            environment.audio.lock
+            if isinstance(environment.audio, ThreadedAudioDriver)
+            else nullcontext()
+        )
+
         self._content = content
         self._system_av_info: retro_system_av_info | None = None
 
         self._pending_callback_exceptions: list[BaseException] = []
         self._is_exited = False
+        self._rewind: RewindBuffer | None = None
+        self._memory_bus: MemoryBus | None = None
+        self._memory_bus_maps: retro_memory_map | None = None
+        self._run_ahead: RunAhead | None = None
+        self._memory_timeline: MemoryTimeline | None = None
+        self._watcher: MemoryWatcher | None = None
+        self._watching_system_ram = False
+        self._envcall_tracer: EnvcallTracer | None = None
+
+        self._input_movie: InputMovieRecorder | InputMoviePlayer | None = None
+        if isinstance(environment.input, (InputMovieRecorder, InputMoviePlayer)):
+            # Movies need to know where each frame ends
+            self._input_movie = environment.input
 
     def __enter__(self):
         api_version = self._core.api_version()
@@ -108,8 +165,11 @@ class Session:
 
         if not self._environment.content:
             # Do nothing, we're testing something that doesn't need to load a game
+            self._set_envcall_phase(EnvcallPhase.RUN)
             return self
 
+        self._set_envcall_phase(EnvcallPhase.LOAD)
+
         self._environment.content.system_info = deepcopy(system_info)
 
         loaded: bool = False
@@ -139,16 +199,30 @@ class Session:
         self._system_av_info = self._core.get_system_av_info()
         self._environment.video.system_av_info = self._system_av_info
         self._environment.audio.system_av_info = self._system_av_info
+        self._set_envcall_phase(EnvcallPhase.RUN)
 
         return self
 
     def __exit__(self, exc_type: type[Exception], exc_val: Exception, exc_tb: TracebackType):
+        if isinstance(self._environment.audio, ThreadedAudioDriver):
+            # The audio thread must not call into the core after it's unloaded
+            self._environment.audio.stop()
+
+        self.disable_memory_timeline()
+        self._set_envcall_phase(EnvcallPhase.UNLOAD)
         if self._content is not None:
             self._core.unload_game()
 
         self._core.deinit()
         del self._core
         self._is_exited = True
+
+        # Finish writing any audio that was recorded (see WaveWriterAudioDriver)
+        self._environment.flush_audio()
+        close_audio = getattr(self._environment.audio, "close", None)
+        if close_audio is not None:
+            close_audio()
+
         return isinstance(exc_val, CoreShutDownException)
         # Returning True from a context manager suppresses the exception
         # and continues from the end of the `with` block.
@@ -265,6 +339,23 @@ class Session:
     def memory_maps(self) -> retro_memory_map | None:
         return self._environment.memory_maps
 
+    @property
+    def memory_bus(self) -> MemoryBus | None:
+        """
+        A ``MemoryBus`` over the core's memory maps,
+        or ``None`` if the core hasn't provided any.
+        Rebuilt if the core replaces its memory maps.
+        """
+        maps = self._environment.memory_maps
+        if maps is None:
+            return None
+
+        if self._memory_bus is None or self._memory_bus_maps is not maps:
+            self._memory_bus = MemoryBus(maps)
+            self._memory_bus_maps = maps
+
+        return self._memory_bus
+
     @property
     def support_achievements(self) -> bool | None:
         return self._environment.support_achievements
@@ -306,11 +397,6 @@ class Session:
         if self._environment.video.needs_reinit:
             self._environment.video.reinit()
 
-        # TODO: In RetroArch, retro_audio_callback.set_state is called on the main thread,
-        # just before starting the audio thread and just after stopping it.
-        # TODO: In RetroArch, retro_audio_callback.callback is called on the audio thread.
-        # TODO: In RetroArch, an audio thread is started if the core registers an audio callback
-
         if isinstance(self._environment.microphones, Pollable):
             self._environment.microphones.poll()
 
@@ -319,10 +405,418 @@ class Session:
             # TODO: Get the time elapsed since the last frame and pass it to frame_time
             # or if throttle_state is set, use that to determine the time elapsed
 
-        # TODO: self._environment.audio.report_buffer_status()
         # TODO: self._environment.camera.poll() (see runloop_iterate in runloop.c, lion)
-        # TODO: Ensure that input is not polled more than once per frame
-        self._core.run()
+        # Starts the audio thread and reports the audio buffer's status,
+        # if the audio driver supports them (see ThreadedAudioDriver)
+        self._environment.begin_frame()
+        if self._rewind or self._run_ahead or self._input_movie or self._memory_timeline:
+            self._run_frame()
+        else:
+            self._core.run()
+
+        self._environment.end_frame()
+        if self._watcher:
+            self.__check_watchpoints()
+
+    def _run_frame(self) -> None:
+        if self._rewind:
+            with self._core_lock:
+                self._rewind.begin_frame(self._environment)
+
+        try:
+            if self._run_ahead:
+                with self._core_lock:
+                    self._run_ahead.run_frame(self._environment, self._core.run)
+            else:
+                self._core.run()
+
+            if self._input_movie:
+                self._input_movie.end_frame()
+
+            if self._memory_timeline:
+                self._memory_timeline.record()
+        finally:
+            if self._rewind:
+                with self._core_lock:
+                    self._rewind.end_frame(self._environment)
+
+    def run_frames(
+        self, n: int, *, until: Callable[["Session"], bool] | None = None
+    ) -> RunSummary:
+        """
+        Runs the core for up to ``n`` frames.
+
+        Equivalent to calling ``run()`` in a loop,
+        but the per-frame checks are only repeated
+        after the core makes an environment call that could invalidate them
+        (see ``CompositeEnvironmentDriver.state_version``).
+
+        :param n: The maximum number of frames to run.
+        :param until: An optional predicate that's called with this session after each frame;
+            if it returns ``True``, no more frames are run.
+            Watchpoints (see ``watch``) are checked first,
+            and those without a callback stop the run when they fire.
+        :return: A summary of the frames that were run.
+            Fewer than ``n`` frames are run if ``until`` returns ``True``
+            or if the core shuts down.
+        :raises CoreShutDownException: If the core was already shut down.
+        :raises ValueError: If ``n`` is negative.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        if n < 0:
+            raise ValueError(f"Expected a non-negative number of frames, got {n}")
+
+        env = self._environment
+        refreshes = env.video_refreshes
+        dupes = env.video_dupes
+        audio_frames = env.audio_frames
+
+        run_core = self._core.run
+        mic_poll = env.microphones.poll if isinstance(env.microphones, Pollable) else None
+        frame_time = env.timing.frame_time if env.timing else None
+        begin_frame = env.begin_frame
+        end_frame = env.end_frame
+        version: int | None = None
+        frames = 0
+        stopped = False
+        while frames < n:
+            if env.state_version != version:
+                version = env.state_version
+                if env.is_shutdown:
+                    break
+
+                if env.video.needs_reinit:
+                    env.video.reinit()
+
+                # The core may have replaced its memory maps
+                if self._watcher:
+                    self.__refresh_watcher_bus()
+
+            if mic_poll:
+                mic_poll()
+
+            if frame_time:
+                frame_time(None)
+
+            begin_frame()
+            # Checked every frame, since until (or a watchpoint's callback)
+            # may enable rewind, run-ahead, or the memory timeline
+            if self._rewind or self._run_ahead or self._input_movie or self._memory_timeline:
+                self._run_frame()
+            else:
+                run_core()
+
+            end_frame()
+            frames += 1
+
+            # Read every frame, since callbacks (or until) may add or remove watchpoints
+            watcher = self._watcher
+            if watcher and any(h.watchpoint.callback is None for h in watcher.check()):
+                stopped = True
+                break
+
+            if until is not None and until(self):
+                stopped = True
+                break
+
+        return RunSummary(
+            frames,
+            env.video_refreshes - refreshes,
+            env.video_dupes - dupes,
+            env.audio_frames - audio_frames,
+            stopped,
+        )
+
+    @property
+    def rewind_buffer(self) -> RewindBuffer | None:
+        return self._rewind
+
+    def enable_rewind(
+        self,
+        *,
+        interval: int = 1,
+        budget: int = 64 * 1024 * 1024,
+        compression: Compression = Compression.ZLIB,
+        keyframe_interval: int = 60,
+    ) -> RewindBuffer:
+        """
+        Starts recording savestates and input so that ``rewind`` can be used.
+        Replaces any existing rewind history.
+
+        :param interval: How many frames to run between savestates.
+        :param budget: The most memory the rewind history should use, in bytes.
+        :param compression: How to compress each savestate.
+        :param keyframe_interval: How many savestates to take between full keyframes.
+        :return: The new rewind buffer, whose ``stats`` can help with choosing a ``budget``.
+        :raises CoreShutDownException: If the core was shut down.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        manager = SavestateManager(
+            self._core,
+            self._environment.serialization_quirks,
+            compression=compression,
+            keyframe_interval=keyframe_interval,
+        )
+        fps = self._system_av_info.timing.fps if self._system_av_info else 60.0
+        self._rewind = RewindBuffer(manager, interval=interval, budget=budget, fps=fps)
+        return self._rewind
+
+    def disable_rewind(self) -> None:
+        """
+        Stops recording rewind history and discards it.
+        """
+        self._rewind = None
+
+    def rewind(self, frames: int) -> int:
+        """
+        Restores the core to the state it was in ``frames`` frames ago,
+        or as far back as the rewind history allows.
+        An input movie that's being recorded or replayed is rewound along with it.
+
+        :return: The number of frames that were actually rewound.
+        :raises RuntimeError: If rewinding wasn't enabled with ``enable_rewind``.
+        :raises CoreShutDownException: If the core was shut down.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        if self._rewind is None:
+            raise RuntimeError("Rewinding is not enabled; call enable_rewind() first")
+
+        with self._core_lock:
+            rewound = self._rewind.rewind(frames, self._environment, self._core.run)
+
+        # The re-simulated frames replay the rewind buffer's input, not the movie's
+        match self._input_movie:
+            case InputMoviePlayer() if rewound:
+                self._input_movie.seek(self._input_movie.frame - rewound)
+            case InputMovieRecorder() if rewound:
+                self._input_movie.truncate(self._input_movie.frame - rewound)
+
+        return rewound
+
+    @property
+    def run_ahead(self) -> RunAhead | None:
+        return self._run_ahead
+
+    def enable_run_ahead(self, frames: int = 1, *, secondary: "Session | None" = None) -> RunAhead:
+        """
+        Makes every subsequent frame run ahead by ``frames`` frames,
+        so that the video driver receives the frame that the core would render
+        ``frames`` frames in the future if the input stayed the same.
+        Audio is only taken from the real frames.
+
+        :param frames: How many frames to run ahead.
+        :param secondary: A second session that runs a separately-loaded copy
+            of the same core with the same content.
+            If given, the hidden frames run on it instead of this session's core,
+            and the presented frames go to its video driver.
+        :return: The new run-ahead state.
+        :raises CoreShutDownException: If the core was shut down.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        manager = SavestateManager(self._core, self._environment.serialization_quirks)
+        if secondary is not None:
+            self._run_ahead = RunAhead(
+                manager,
+                frames,
+                secondary_core=secondary.core,
+                secondary_environment=secondary.environment,
+            )
+        else:
+            self._run_ahead = RunAhead(manager, frames)
+
+        return self._run_ahead
+
+    def disable_run_ahead(self) -> None:
+        self._run_ahead = None
+
+    @property
+    def memory_timeline(self) -> MemoryTimeline | None:
+        return self._memory_timeline
+
+    def enable_memory_timeline(
+        self, path: str | PathLike, memory_ids: Sequence[int] | None = None
+    ) -> MemoryTimeline:
+        """
+        Starts recording which bytes of the core's memory change in each frame,
+        so that ``MemoryTimeline.value`` and ``MemoryTimeline.changes``
+        can tell when a byte changed (e.g. to track down a desync).
+        Frame 0 of the timeline is the memory's current contents,
+        and each frame run afterwards with ``run`` or ``run_frames`` appends another.
+        ``rewind`` restores an older state and re-simulates frames without recording them,
+        so after a rewind the timeline's frame numbers no longer match the session's;
+        the next recorded frame holds every byte that differs from the last recorded one.
+        Replaces (and closes) any existing timeline.
+
+        :param path: Where to write the timeline; see ``MemoryTimeline``.
+        :param memory_ids: The memory regions to record.
+            Defaults to the system, save, and video RAM that the core exposes.
+        :return: The new timeline.
+        :raises CoreShutDownException: If the core was shut down.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        self.disable_memory_timeline()
+        if memory_ids is None:
+            self._memory_timeline = MemoryTimeline(path, self._core)
+        else:
+            self._memory_timeline = MemoryTimeline(path, self._core, memory_ids)
+
+        return self._memory_timeline
+
+    def disable_memory_timeline(self) -> None:
+        """
+        Stops recording the memory timeline and closes its files,
+        which can still be queried with ``MemoryTimeline.open``.
+        """
+        if self._memory_timeline is not None:
+            self._memory_timeline.close()
+            self._memory_timeline = None
+
+    @property
+    def watcher(self) -> MemoryWatcher | None:
+        """
+        The watchpoints added with ``watch``, if any have been.
+        """
+        return self._watcher
+
+    def watch(
+        self,
+        address: int,
+        condition: WatchCondition,
+        value: int | None = None,
+        high: int | None = None,
+        *,
+        size: int = 1,
+        callback: Callable[[WatchHit], None] | None = None,
+    ) -> Watchpoint:
+        """
+        Adds a watchpoint that's checked after every frame.
+        If it has a callback, it's called whenever the watchpoint fires;
+        otherwise the watchpoint stops ``run_frames`` when it fires
+        (e.g. ``session.watch(0x7E0F8C, WatchCondition.EQUAL, 0)``
+        and then ``session.run_frames(100000)`` to run until a boss's HP reaches 0).
+        See ``MemoryWatcher.add`` for the parameters.
+
+        Addresses are translated with ``memory_bus``.
+        If the core hasn't provided memory maps when the first watchpoint is added,
+        addresses are offsets into its ``RETRO_MEMORY_SYSTEM_RAM`` instead,
+        and stay that way until every watchpoint is removed
+        (even if the core provides memory maps later).
+
+        :return: The new watchpoint, which can be passed to ``unwatch``.
+        :raises CoreShutDownException: If the core was shut down.
+        :raises RuntimeError: If the core exposes no memory to watch.
+        """
+        if self._is_exited or self._environment.is_shutdown:
+            raise CoreShutDownException()
+
+        if self._watcher is None:
+            bus = self.memory_bus
+            if bus is None:
+                data = self._core.get_memory_data(RETRO_MEMORY_SYSTEM_RAM)
+                memory_size = self._core.get_memory_size(RETRO_MEMORY_SYSTEM_RAM)
+                if not data or not memory_size:
+                    raise RuntimeError("Core has no memory maps or system RAM to watch")
+
+                # Descriptors without a select mask must have a power-of-two length,
+                # so map the RAM in power-of-two pieces to avoid mirroring past its end
+                descriptors = []
+                start = 0
+                for bit in reversed(range(memory_size.bit_length())):
+                    if memory_size & (1 << bit):
+                        descriptors.append(
+                            retro_memory_descriptor(
+                                flags=MemoryDescriptorFlag.SYSTEM_RAM,
+                                ptr=data,
+                                offset=start,
+                                start=start,
+                                len=1 << bit,
+                            )
+                        )
+                        start += 1 << bit
+
+                bus = MemoryBus(descriptors)
+
+            self._watcher = MemoryWatcher(bus)
+            self._watching_system_ram = self._environment.memory_maps is None
+
+        return self._watcher.add(address, condition, value, high, size=size, callback=callback)
+
+    def unwatch(self, watchpoint: Watchpoint) -> None:
+        """
+        Removes a watchpoint that was returned by ``watch``.
+
+        :raises ValueError: If the watchpoint isn't watched by this session.
+        """
+        if self._watcher is None:
+            raise ValueError("Watchpoint is not watched by this session")
+
+        self._watcher.remove(watchpoint)
+        if not self._watcher:
+            # The next watchpoint may use the core's memory maps
+            self._watcher = None
+            self._watching_system_ram = False
+
+    def __refresh_watcher_bus(self) -> None:
+        if self._watching_system_ram:
+            # Don't reinterpret RAM offsets as addresses on the core's memory maps
+            return
+
+        bus = self.memory_bus
+        if bus is not None and bus is not self._watcher.bus:
+            self._watcher.bus = bus
+
+    def __check_watchpoints(self) -> Sequence[WatchHit]:
+        self.__refresh_watcher_bus()
+        return self._watcher.check()
+
+    @property
+    def envcall_tracer(self) -> EnvcallTracer | None:
+        return self._envcall_tracer
+
+    def trace_envcalls(self, tracer: EnvcallTracer | None = None) -> EnvcallTracer:
+        """
+        Starts counting and timing every envcall that the core makes.
+
+        Call this before entering the session's ``with`` block
+        to include the envcalls made while the core initializes and loads content.
+        The session keeps the tracer's ``phase`` up to date.
+
+        :param tracer: The tracer to use, or ``None`` to create a new one.
+        :return: The attached tracer.
+        :raises RuntimeError: If envcalls are already being traced.
+        """
+        if self._envcall_tracer is not None:
+            raise RuntimeError("Envcalls are already being traced")
+
+        tracer = tracer or EnvcallTracer()
+        if self._system_av_info is not None:
+            tracer.phase = EnvcallPhase.RUN
+
+        tracer.attach(self._environment)
+        self._envcall_tracer = tracer
+        return tracer
+
+    def stop_tracing_envcalls(self) -> None:
+        """
+        Detaches the envcall tracer, if any; its statistics remain available.
+        """
+        if self._envcall_tracer is not None:
+            self._envcall_tracer.detach()
+            self._envcall_tracer = None
+
+    def _set_envcall_phase(self, phase: EnvcallPhase) -> None:
+        if self._envcall_tracer is not None:
+            self._envcall_tracer.phase = phase
 
     def reset(self) -> None:
         if self._is_exited or self._environment.is_shutdown:
@@ -333,5 +827,6 @@ class Session:
 
 __all__ = [
     "Session",
+    "RunSummary",
     "CoreShutDownException",
 ]
@@ -0,0 +1,408 @@
+"""
+A per-frame history of a core's memory, for finding out when a byte changed.
+"""
+
+import os
+import struct
+from collections.abc import Sequence
+from mmap import ACCESS_READ, mmap
+from os import PathLike
+from typing import final
+
+from libretro.core import CoreInterface
+from libretro.h import (
+    RETRO_MEMORY_SAVE_RAM,
+    RETRO_MEMORY_SYSTEM_RAM,
+    RETRO_MEMORY_VIDEO_RAM,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_MAGIC = b"LRMT"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHQ")  # magic, version, memory count, frame count
+_FRAMES_OFFSET = 8
+_MEMORY = struct.Struct("<IQ")  # memory ID, size
+_INDEX_SUFFIX = ".idx"
+
+_DEFAULT_MEMORY_IDS = (RETRO_MEMORY_SYSTEM_RAM, RETRO_MEMORY_SAVE_RAM, RETRO_MEMORY_VIDEO_RAM)
+
+if numpy is not None:
+    # One entry per run of changed bytes, in the order they were recorded
+    _ENTRY = numpy.dtype(
+        [
+            ("frame", "<u8"),
+            ("memory", "<u4"),
+            ("offset", "<u4"),
+            ("length", "<u4"),
+            ("position", "<u8"),
+        ]
+    )
+
+
+class _Appender:
+    """
+    An append-only file that's written and read through a memory map,
+    which grows in whole chunks and is trimmed to size when closed.
+    """
+
+    def __init__(self, path: str | PathLike, chunk_size: int, *, create: bool):
+        self._file = open(path, "w+b" if create else "rb")
+        self._length = os.fstat(self._file.fileno()).st_size
+        self._chunk_size = chunk_size
+        self._writable = create
+        self._map: mmap | None = None
+        if self._writable:
+            self.__remap(chunk_size)
+        elif self._length:
+            self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ)
+
+    def __remap(self, capacity: int) -> None:
+        self._file.truncate(capacity)
+        # The old map is left for the garbage collector,
+        # since arrays that were made from it may still refer to it
+        self._map = mmap(self._file.fileno(), capacity)
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def map(self) -> mmap | None:
+        return self._map
+
+    def append(self, data) -> int:
+        position = self._length
+        end = position + len(data)
+        if end > len(self._map):
+            self.__remap(max(end + self._chunk_size, 2 * len(self._map)))
+
+        self._map[position:end] = data
+        self._length = end
+        return position
+
+    def close(self) -> None:
+        if self._file.closed:
+            return
+
+        if self._writable:
+            self._map.flush()
+            self._map = None
+            self._file.truncate(self._length)
+
+        self._map = None
+        self._file.close()
+
+
+@final
+class MemoryTimeline:
+    """
+    Records which bytes of a core's memory changed in each frame,
+    so that the value of any byte at any recorded frame
+    (and every frame in which it changed) can be looked up without replaying the session.
+
+    The first frame (frame 0) holds the memory's contents when recording began;
+    each later frame holds only the runs of bytes that differ from the frame before,
+    found with a vectorized comparison against a copy of the previous contents.
+    The runs' bytes are appended to a memory-mapped file at ``path``,
+    and an index of the runs (their frame, memory, offset, length, and position in that file)
+    is appended to another one at ``path`` plus ``".idx"``;
+    queries search the index with vectorized comparisons rather than scanning the data.
+
+    Usually created with ``Session.enable_memory_timeline`` rather than directly.
+    Requires NumPy.
+    """
+
+    def __init__(
+        self,
+        path: str | PathLike,
+        core: CoreInterface,
+        memory_ids: Sequence[int] = _DEFAULT_MEMORY_IDS,
+        *,
+        chunk_size: int = 16 * 1024 * 1024,
+    ):
+        """
+        Creates (or overwrites) a timeline at ``path``
+        and records the core's memory as frame 0.
+
+        :param path: Where to write the changed bytes.
+            The index is written to the same path with ``".idx"`` appended.
+        :param core: The core whose memory is recorded.
+        :param memory_ids: The memory regions to record, as passed to ``Core.get_memory``.
+            Regions that the core doesn't expose when recording begins are skipped.
+        :param chunk_size: How many bytes the files grow by at a time.
+        :raises RuntimeError: If NumPy isn't installed.
+        :raises ValueError: If ``chunk_size`` isn't positive.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is required for MemoryTimeline but is not installed")
+
+        if chunk_size <= 0:
+            raise ValueError(f"Expected a positive chunk size, got {chunk_size}")
+
+        self._core = core
+        self._path = os.fspath(path)
+        self._memories: dict[int, int] = {}
+        for memory_id in memory_ids:
+            memory = core.get_memory(memory_id)
+            if memory is not None and memory.nbytes > 0:
+                self._memories[memory_id] = memory.nbytes
+
+        self._previous = {
+            i: numpy.empty(size, dtype=numpy.uint8) for i, size in self._memories.items()
+        }
+        self._frames = 0
+        self._data = _Appender(self._path, chunk_size, create=True)
+        self._index = _Appender(self._path + _INDEX_SUFFIX, chunk_size, create=True)
+        header = _HEADER.pack(_MAGIC, _VERSION, len(self._memories), 0)
+        self._index.append(header + b"".join(_MEMORY.pack(*m) for m in self._memories.items()))
+        self._entries_offset = len(self._index)
+
+        # Every byte differs from "nothing", so frame 0 is stored in full
+        for memory_id, previous in self._previous.items():
+            current = numpy.frombuffer(core.get_memory(memory_id), dtype=numpy.uint8)
+            previous[:] = current
+            self.__append(memory_id, numpy.array([0]), numpy.array([len(current)]), current)
+
+        self.__end_frame()
+
+    @classmethod
+    def open(cls, path: str | PathLike) -> "MemoryTimeline":
+        """
+        Opens a timeline that was previously recorded to ``path``, for querying only.
+
+        :raises RuntimeError: If NumPy isn't installed.
+        :raises ValueError: If the files aren't a timeline.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is required for MemoryTimeline but is not installed")
+
+        self = cls.__new__(cls)
+        self._core = None
+        self._path = os.fspath(path)
+        self._data = _Appender(self._path, 0, create=False)
+        self._index = _Appender(self._path + _INDEX_SUFFIX, 0, create=False)
+        index = self._index.map
+        if index is None or len(index) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{self._path}{_INDEX_SUFFIX} is not a memory timeline index")
+
+        magic, version, count, self._frames = _HEADER.unpack_from(index)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"{self._path}{_INDEX_SUFFIX} is not a memory timeline index")
+
+        self._memories = dict(
+            _MEMORY.unpack_from(index, _HEADER.size + i * _MEMORY.size) for i in range(count)
+        )
+        self._previous = {}
+        self._entries_offset = _HEADER.size + count * _MEMORY.size
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Trims the files to their contents and closes them.
+        The timeline can't be recorded to or queried afterwards.
+        """
+        self._core = None
+        self._data.close()
+        self._index.close()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def frames(self) -> int:
+        """
+        The number of recorded frames, including frame 0.
+        """
+        return self._frames
+
+    @property
+    def memory_ids(self) -> Sequence[int]:
+        """
+        The IDs of the recorded memory regions.
+        """
+        return tuple(self._memories)
+
+    def memory_size(self, memory_id: int) -> int:
+        """
+        The size of the given memory region when recording began.
+
+        :raises KeyError: If that region isn't recorded.
+        """
+        return self._memories[memory_id]
+
+    def __append(
+        self,
+        memory_id: int,
+        starts: "numpy.ndarray",
+        lengths: "numpy.ndarray",
+        data: "numpy.ndarray",
+    ) -> None:
+        position = self._data.append(data)
+        entries = numpy.empty(len(starts), dtype=_ENTRY)
+        entries["frame"] = self._frames
+        entries["memory"] = memory_id
+        entries["offset"] = starts
+        entries["length"] = lengths
+        entries["position"][0] = position
+        numpy.cumsum(lengths[:-1], out=entries["position"][1:])
+        entries["position"][1:] += position
+        self._index.append(entries.view(numpy.uint8))
+
+    def __end_frame(self) -> None:
+        self._frames += 1
+        struct.pack_into("<Q", self._index.map, _FRAMES_OFFSET, self._frames)
+
+    def record(self) -> int:
+        """
+        Appends the bytes that changed since the last recorded frame as a new frame.
+        ``Session`` calls this after each frame while the timeline is enabled.
+
+        :return: The number of bytes that changed.
+        :raises RuntimeError: If the timeline was opened for querying or has been closed.
+        :raises ValueError: If a recorded memory region was resized or removed.
+        """
+        if self._core is None:
+            raise RuntimeError("This memory timeline is not recording")
+
+        changed_bytes = 0
+        for memory_id, previous in self._previous.items():
+            memory = self._core.get_memory(memory_id)
+            if memory is None or memory.nbytes != len(previous):
+                raise ValueError(f"Memory region {memory_id} was resized or removed")
+
+            current = numpy.frombuffer(memory, dtype=numpy.uint8)
+            changed = numpy.flatnonzero(current != previous)
+            if len(changed) == 0:
+                continue
+
+            # A run of changed bytes begins wherever a changed byte doesn't follow another one
+            breaks = numpy.flatnonzero(numpy.diff(changed) != 1) + 1
+            starts = changed[numpy.concatenate(([0], breaks))]
+            ends = changed[numpy.concatenate((breaks - 1, [len(changed) - 1]))] + 1
+            data = current[changed]
+            self.__append(memory_id, starts, ends - starts, data)
+            previous[changed] = data
+            changed_bytes += len(data)
+
+        self.__end_frame()
+        return changed_bytes
+
+    def __entries(self) -> "numpy.ndarray":
+        count = (len(self._index) - self._entries_offset) // _ENTRY.itemsize
+        return numpy.frombuffer(
+            self._index.map, dtype=_ENTRY, count=count, offset=self._entries_offset
+        )
+
+    def __matches(
+        self, memory_id: int, start: int, end: int, frame: int | None = None
+    ) -> tuple["numpy.ndarray", "numpy.ndarray"]:
+        # The entries recorded up to the given frame that overlap [start, end), in order
+        if memory_id not in self._memories:
+            raise KeyError(f"Memory region {memory_id} was not recorded")
+
+        size = self._memories[memory_id]
+        if not 0 <= start < end <= size:
+            raise IndexError(f"Expected addresses in [0, {size}), got [{start}, {end})")
+
+        entries = self.__entries()
+        if frame is not None:
+            # The frame index: entries are in frame order, so later frames can be skipped
+            entries = entries[: numpy.searchsorted(entries["frame"], frame, side="right")]
+
+        offsets = entries["offset"]
+        matches = numpy.flatnonzero(
+            (entries["memory"] == memory_id)
+            & (offsets < end)
+            & (start < offsets + entries["length"])
+        )
+        return entries, matches
+
+    def value(self, address: int, frame: int, memory_id: int = RETRO_MEMORY_SYSTEM_RAM) -> int:
+        """
+        Looks up the value that a byte had at the end of a recorded frame.
+
+        :param address: The byte's offset within the memory region.
+        :param frame: The frame to look at, from 0 to ``frames - 1``.
+        :param memory_id: The memory region that contains the byte.
+        :raises KeyError: If that memory region isn't recorded.
+        :raises IndexError: If ``address`` or ``frame`` is out of range.
+        """
+        return self.read(address, 1, frame, memory_id)[0]
+
+    def read(
+        self, address: int, size: int, frame: int, memory_id: int = RETRO_MEMORY_SYSTEM_RAM
+    ) -> bytes:
+        """
+        Looks up the values of ``size`` consecutive bytes at the end of a recorded frame.
+
+        :raises KeyError: If that memory region isn't recorded.
+        :raises IndexError: If any of the bytes or ``frame`` is out of range.
+        """
+        if not 0 <= frame < self._frames:
+            raise IndexError(f"Expected a frame in [0, {self._frames}), got {frame}")
+
+        end = address + size
+        entries, matches = self.__matches(memory_id, address, end, frame)
+        offsets = entries["offset"][matches].astype(numpy.int64)
+        low = numpy.maximum(offsets, address)
+        lengths = numpy.minimum(offsets + entries["length"][matches], end) - low
+
+        # Every byte that each match covers, relative to address
+        owners = numpy.repeat(numpy.arange(len(matches)), lengths)
+        covered = numpy.arange(len(owners)) + numpy.repeat(
+            low - address - (numpy.cumsum(lengths) - lengths), lengths
+        )
+
+        # Matches are in frame order, so each byte's value comes from the last one that covers it
+        # (frame 0 covers every byte)
+        latest = numpy.full(size, -1, dtype=numpy.int64)
+        numpy.maximum.at(latest, covered, owners)
+        positions = entries["position"][matches][latest] + (
+            numpy.arange(address, end) - offsets[latest]
+        ).astype(numpy.uint64)
+        data = numpy.frombuffer(self._data.map, dtype=numpy.uint8, count=len(self._data))
+        return data[positions].tobytes()
+
+    def changes(self, address: int, memory_id: int = RETRO_MEMORY_SYSTEM_RAM) -> Sequence[int]:
+        """
+        Lists the frames in which a byte changed, in ascending order.
+        Frame 0 isn't included, since it's when recording began.
+
+        :raises KeyError: If that memory region isn't recorded.
+        :raises IndexError: If ``address`` is out of range.
+        """
+        entries, matches = self.__matches(memory_id, address, address + 1)
+        frames = entries["frame"][matches]
+        return frames[frames > 0].tolist()
+
+    def changed_bytes(self, frame: int) -> int:
+        """
+        The number of bytes that changed in a recorded frame
+        (or the total size of the recorded memory, for frame 0).
+
+        :raises IndexError: If ``frame`` is out of range.
+        """
+        if not 0 <= frame < self._frames:
+            raise IndexError(f"Expected a frame in [0, {self._frames}), got {frame}")
+
+        entries = self.__entries()
+        # The frame index: each frame's entries are contiguous and in order
+        first, last = numpy.searchsorted(entries["frame"], [frame, frame + 1])
+        return int(entries["length"][first:last].sum())
+
+
+__all__ = [
+    "MemoryTimeline",
+]
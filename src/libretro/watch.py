@@ -0,0 +1,339 @@
+"""
+Conditions on the emulated system's memory that are checked between frames.
+"""
+
+from collections.abc import Callable, Iterator, Sequence
+from enum import Enum
+from typing import NamedTuple, final
+
+from libretro.memory import MemoryBus, MemoryGather
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class WatchCondition(Enum):
+    """
+    When a ``Watchpoint`` fires.
+    Values are compared as unsigned integers.
+    """
+
+    EQUAL = "=="
+    """The value equals ``Watchpoint.value``."""
+
+    NOT_EQUAL = "!="
+    """The value does not equal ``Watchpoint.value``."""
+
+    LESS = "<"
+    """The value is less than ``Watchpoint.value``."""
+
+    GREATER = ">"
+    """The value is greater than ``Watchpoint.value``."""
+
+    IN_RANGE = "in"
+    """The value is between ``Watchpoint.value`` and ``Watchpoint.high``, inclusive."""
+
+    CHANGED = "changed"
+    """The value differs from what it was when the watchpoint was last checked (or added)."""
+
+
+class Watchpoint(NamedTuple):
+    """
+    A condition on an integer in the emulated system's memory.
+    Created with ``MemoryWatcher.add``.
+    """
+
+    address: int
+    """The address of the integer, as the emulated system sees it."""
+
+    condition: WatchCondition
+
+    value: int | None
+    """The operand of ``condition``, or the low end of the range for ``IN_RANGE``."""
+
+    high: int | None
+    """The high end of the range for ``IN_RANGE``."""
+
+    size: int
+    """The size of the integer in bytes."""
+
+    callback: Callable[["WatchHit"], None] | None
+    """
+    Called when the watchpoint fires.
+    If ``None``, the watchpoint stops ``Session.run_frames`` instead.
+    """
+
+
+class WatchHit(NamedTuple):
+    """
+    A watchpoint that fired, and the value that made it fire.
+    """
+
+    watchpoint: Watchpoint
+    value: int
+
+
+class _Group(NamedTuple):
+    # Watchpoints of one size, checked together
+    gather: MemoryGather
+    positions: Sequence[int]  # Index of each watchpoint in MemoryWatcher._watchpoints
+    low: Sequence[int]
+    span: Sequence[int]  # high - low
+    negate: Sequence[bool]
+    changed: Sequence[int]  # Indexes (within the group) of the CHANGED watchpoints
+
+
+@final
+class MemoryWatcher:
+    """
+    Checks a set of watchpoints against the emulated system's memory, usually once per frame.
+
+    Every condition is compiled to a range test, optionally negated
+    (e.g. ``LESS`` fires when the value is *not* in ``[value, max]``),
+    and the watchpoints of each size are read with a single ``MemoryGather``,
+    so a check costs a handful of vectorized NumPy operations
+    no matter how many watchpoints there are.
+    Watchpoints are compiled when they're first checked after being added or removed.
+    Without NumPy, the same work is done in a Python loop.
+
+    Watchpoints are level-triggered: they fire after every frame that their condition holds,
+    except for ``CHANGED`` which only fires in frames where the value changes.
+
+    Usually created with ``Session.watch`` rather than directly.
+    """
+
+    def __init__(self, bus: MemoryBus, *, big_endian: bool | None = None):
+        """
+        :param bus: The memory to watch.
+        :param big_endian: The byte order of multi-byte watchpoints.
+            Defaults to each region's own byte order.
+        :raises TypeError: If ``bus`` isn't a ``MemoryBus``.
+        """
+        if not isinstance(bus, MemoryBus):
+            raise TypeError(f"Expected a MemoryBus, got {type(bus).__name__}")
+
+        self._bus = bus
+        self._big_endian = big_endian
+        self._watchpoints: list[Watchpoint] = []
+        self._baselines: list[int | None] = []  # The last value seen by each CHANGED watchpoint
+        self._groups: list[_Group] | None = None
+        self._hits: Sequence[WatchHit] = ()
+
+    @property
+    def bus(self) -> MemoryBus:
+        return self._bus
+
+    @bus.setter
+    def bus(self, bus: MemoryBus):
+        """
+        Watches a different memory bus, e.g. after the core replaces its memory maps.
+        ``CHANGED`` watchpoints keep the values they last saw.
+        """
+        if not isinstance(bus, MemoryBus):
+            raise TypeError(f"Expected a MemoryBus, got {type(bus).__name__}")
+
+        self.__decompile()
+        self._bus = bus
+
+    @property
+    def hits(self) -> Sequence[WatchHit]:
+        """
+        The watchpoints that fired the last time ``check`` was called.
+        """
+        return self._hits
+
+    def __len__(self) -> int:
+        return len(self._watchpoints)
+
+    def __iter__(self) -> Iterator[Watchpoint]:
+        return iter(self._watchpoints)
+
+    def add(
+        self,
+        address: int,
+        condition: WatchCondition,
+        value: int | None = None,
+        high: int | None = None,
+        *,
+        size: int = 1,
+        callback: Callable[[WatchHit], None] | None = None,
+    ) -> Watchpoint:
+        """
+        Adds a watchpoint.
+
+        :param address: The address of the integer to watch.
+        :param condition: When the watchpoint fires.
+        :param value: The operand of ``condition``; not used by ``CHANGED``.
+        :param high: The high end of the range for ``IN_RANGE``.
+        :param size: The size of the integer in bytes; one of 1, 2, 4, or 8.
+        :param callback: Called with each hit, if given.
+        :return: The new watchpoint, which can be passed to ``remove``.
+        :raises TypeError: If ``condition`` isn't a ``WatchCondition``.
+        :raises ValueError: If ``size`` is invalid or an operand is missing or out of range.
+        :raises IndexError: If the integer isn't mapped to one contiguous piece of memory.
+        """
+        if not isinstance(condition, WatchCondition):
+            raise TypeError(f"Expected a WatchCondition, got {type(condition).__name__}")
+
+        if size not in (1, 2, 4, 8):
+            raise ValueError(f"Expected a size of 1, 2, 4, or 8, got {size}")
+
+        limit = (1 << (8 * size)) - 1
+        operands = (value,) if condition != WatchCondition.IN_RANGE else (value, high)
+        for operand in operands if condition != WatchCondition.CHANGED else ():
+            if operand is None:
+                raise ValueError(f"{condition.name} requires an operand")
+
+            if not 0 <= operand <= limit:
+                raise ValueError(f"Expected an operand in [0, {limit}], got {operand}")
+
+        if condition == WatchCondition.IN_RANGE and high < value:
+            raise ValueError(f"Expected an empty or increasing range, got [{value}, {high}]")
+
+        # Also checks that the address is mapped
+        current = self._bus.read_int(address, size, big_endian=self._big_endian)
+
+        watchpoint = Watchpoint(address, condition, value, high, size, callback)
+        self.__decompile()
+        self._watchpoints.append(watchpoint)
+        self._baselines.append(current if condition == WatchCondition.CHANGED else None)
+        return watchpoint
+
+    def remove(self, watchpoint: Watchpoint) -> None:
+        """
+        Removes a watchpoint that was returned by ``add``.
+
+        :raises ValueError: If the watchpoint isn't in this watcher.
+        """
+        index = next((i for i, w in enumerate(self._watchpoints) if w is watchpoint), None)
+        if index is None:
+            raise ValueError("Watchpoint is not in this watcher")
+
+        self.__decompile()
+        del self._watchpoints[index]
+        del self._baselines[index]
+
+    def clear(self) -> None:
+        """
+        Removes every watchpoint.
+        """
+        self._watchpoints.clear()
+        self._baselines.clear()
+        self._groups = None
+        self._hits = ()
+
+    def __decompile(self) -> None:
+        # Save what the CHANGED watchpoints last saw before their positions change
+        for group in self._groups or ():
+            for i in group.changed:
+                self._baselines[group.positions[i]] = int(group.low[i])
+
+        self._groups = None
+
+    def __compile(self) -> list[_Group]:
+        by_size: dict[int, list[int]] = {}
+        for position, watchpoint in enumerate(self._watchpoints):
+            by_size.setdefault(watchpoint.size, []).append(position)
+
+        groups = []
+        for size, positions in by_size.items():
+            limit = (1 << (8 * size)) - 1
+            low = []
+            high = []
+            negate = []
+            changed = []
+            for i, position in enumerate(positions):
+                w = self._watchpoints[position]
+                match w.condition:
+                    case WatchCondition.EQUAL:
+                        bounds = (w.value, w.value, False)
+                    case WatchCondition.NOT_EQUAL:
+                        bounds = (w.value, w.value, True)
+                    case WatchCondition.LESS:
+                        bounds = (w.value, limit, True)
+                    case WatchCondition.GREATER:
+                        bounds = (0, w.value, True)
+                    case WatchCondition.IN_RANGE:
+                        bounds = (w.value, w.high, False)
+                    case WatchCondition.CHANGED:
+                        baseline = self._baselines[position]
+                        bounds = (baseline, baseline, True)
+                        changed.append(i)
+
+                low.append(bounds[0])
+                high.append(bounds[1])
+                negate.append(bounds[2])
+
+            gather = self._bus.gatherer(
+                (self._watchpoints[p].address for p in positions),
+                size,
+                big_endian=self._big_endian,
+            )
+            span = [h - lo for lo, h in zip(low, high)]
+            if numpy is not None:
+                dtype = numpy.dtype(f"u{size}")
+                groups.append(
+                    _Group(
+                        gather,
+                        numpy.array(positions, dtype=numpy.intp),
+                        numpy.array(low, dtype=dtype),
+                        numpy.array(span, dtype=dtype),
+                        numpy.array(negate, dtype=numpy.bool_),
+                        numpy.array(changed, dtype=numpy.intp),
+                    )
+                )
+            else:
+                groups.append(_Group(gather, positions, low, span, negate, changed))
+
+        return groups
+
+    def check(self) -> Sequence[WatchHit]:
+        """
+        Reads every watched value and collects the watchpoints that fire,
+        calling the callbacks of those that have one.
+        ``Session`` calls this after each frame.
+
+        :return: Every watchpoint that fired, in the order they were added.
+            Also available as ``hits`` until the next check.
+        """
+        if self._groups is None:
+            self._groups = self.__compile()
+
+        fired: list[tuple[int, int]] = []
+        for group in self._groups:
+            values = group.gather()
+            if numpy is not None:
+                # Unsigned subtraction wraps around, so values below low are out of range too
+                hits = ((values - group.low) <= group.span) ^ group.negate
+                if len(group.changed):
+                    group.low[group.changed] = values[group.changed]
+
+                if hits.any():
+                    indexes = numpy.flatnonzero(hits)
+                    fired.extend(zip(group.positions[indexes].tolist(), values[indexes].tolist()))
+            else:
+                for i, value in enumerate(values):
+                    low = group.low[i]
+                    if (0 <= value - low <= group.span[i]) != group.negate[i]:
+                        fired.append((group.positions[i], value))
+
+                for i in group.changed:
+                    group.low[i] = values[i]
+
+        fired.sort()
+        self._hits = [WatchHit(self._watchpoints[p], v) for p, v in fired]
+        for hit in self._hits:
+            if hit.watchpoint.callback is not None:
+                hit.watchpoint.callback(hit)
+
+        return self._hits
+
+
+__all__ = [
+    "MemoryWatcher",
+    "WatchCondition",
+    "WatchHit",
+    "Watchpoint",
+]